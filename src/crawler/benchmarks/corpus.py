@@ -0,0 +1,136 @@
+"""
+Recorded page corpora for the ingestion benchmark.
+
+A corpus is a directory holding pages.jsonl.gz: one {"url", "title", "html"}
+object per line, the same fields the spider yields. Record one from a live
+site, or generate a deterministic synthetic one for runs without network:
+
+    python -m benchmarks.corpus record https://www.colorado.edu/ corpora/colorado [max_pages] [delay]
+    python -m benchmarks.corpus synthesize corpora/synthetic [pages] [seed]
+"""
+
+import gzip
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import deque
+from urllib.parse import urldefrag, urljoin, urlparse
+
+from parsel import Selector
+
+USER_AGENT = "Mozilla/5.0 (compatible; CustomCrawler/1.0)"
+PAGES_FILE = "pages.jsonl.gz"
+
+
+def load(corpus_dir: str) -> list[dict]:
+    with gzip.open(os.path.join(corpus_dir, PAGES_FILE), "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def git_commit() -> str | None:
+    """The checked-out commit, recorded in benchmark results next to the corpus they ran on."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(corpus_dir: str, pages: list[dict]) -> str:
+    os.makedirs(corpus_dir, exist_ok=True)
+    path = os.path.join(corpus_dir, PAGES_FILE)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for page in pages:
+            f.write(json.dumps(page) + "\n")
+    return path
+
+
+def record(start_url: str, corpus_dir: str, max_pages: int = 200, delay: float = 0.5) -> str:
+    """Breadth-first fetch of up to `max_pages` HTML pages on the start URL's domain."""
+    domain = urlparse(start_url).netloc.removeprefix("www.")
+    queue, seen, pages = deque([start_url]), {start_url}, []
+    while queue and len(pages) < max_pages:
+        url = queue.popleft()
+        try:
+            request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+            with urllib.request.urlopen(request, timeout=20) as response:
+                if "html" not in response.headers.get("Content-Type", ""):
+                    continue
+                html = response.read().decode(response.headers.get_content_charset() or "utf-8", errors="replace")
+                url = response.url
+        except Exception as e:
+            print(f"Skipping {url}: {e}")
+            continue
+
+        selector = Selector(text=html)
+        pages.append({"url": url, "title": selector.css("title::text").get(), "html": html})
+        print(f"Recorded {len(pages)}/{max_pages}: {url}")
+        for href in selector.css("a::attr(href)").getall():
+            link = urldefrag(urljoin(url, href))[0]
+            if urlparse(link).scheme in ("http", "https") and urlparse(link).netloc.removeprefix("www.") == domain and link not in seen:
+                seen.add(link)
+                queue.append(link)
+        time.sleep(delay)
+    return save(corpus_dir, pages)
+
+
+WORDS = (
+    "admissions application deadline tuition fees financial aid scholarship undergraduate graduate program "
+    "degree major minor course catalog credit semester registration advising faculty department research "
+    "laboratory library housing residence campus student services international transfer requirement policy "
+    "handbook transcript enrollment orientation career center counseling health wellness dining parking"
+).split()
+NAV = ("Home", "Admissions", "Academics", "Research", "Campus Life", "Athletics", "About")
+
+
+def _paragraph(rng: random.Random, sentences: int) -> str:
+    text = []
+    for _ in range(sentences):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 22))]
+        text.append(" ".join(words).capitalize() + ".")
+    return " ".join(text)
+
+
+def synthesize(corpus_dir: str, pages: int = 500, seed: int = 0) -> str:
+    """University-like pages with shared navigation and footer boilerplate and a mix of short and long bodies."""
+    rng = random.Random(seed)
+    nav = "".join(f'<li><a href="/{item.lower().replace(" ", "-")}/">{item}</a></li>' for item in NAV)
+    footer = ("<footer><p>University of Example, 100 College Ave, Example City. Phone 555-0100.</p>"
+              "<p>Copyright University of Example. All rights reserved. Privacy. Accessibility.</p></footer>")
+    generated = []
+    for i in range(pages):
+        section = rng.choice(NAV[1:]).lower().replace(" ", "-")
+        title = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} | University of Example"
+        # Mostly short pages with a long tail, like a real site
+        sections = max(1, int(rng.expovariate(1 / 3)))
+        body = "".join(
+            f"<h2>{rng.choice(WORDS).title()} {rng.choice(WORDS)}</h2><p>{_paragraph(rng, rng.randint(3, 10))}</p>"
+            for _ in range(sections)
+        )
+        links = "".join(f'<a href="/{section}/page-{rng.randrange(pages)}.html">Related</a> ' for _ in range(5))
+        html = (f"<!DOCTYPE html><html><head><title>{title}</title></head><body>"
+                f"<header><nav><ul>{nav}</ul></nav></header><main><article><h1>{title.split(' | ')[0]}</h1>"
+                f"{body}</article><aside>{links}</aside></main>{footer}</body></html>")
+        generated.append({"url": f"https://www.example.edu/{section}/page-{i}.html", "title": title, "html": html})
+    return save(corpus_dir, generated)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("record", "synthesize"):
+        print(__doc__)
+        sys.exit(1)
+    if sys.argv[1] == "record":
+        if len(sys.argv) < 4:
+            print(__doc__)
+            sys.exit(1)
+        path = record(sys.argv[2], sys.argv[3],
+                      int(sys.argv[4]) if len(sys.argv) > 4 else 200,
+                      float(sys.argv[5]) if len(sys.argv) > 5 else 0.5)
+    else:
+        path = synthesize(sys.argv[2],
+                          int(sys.argv[3]) if len(sys.argv) > 3 else 500,
+                          int(sys.argv[4]) if len(sys.argv) > 4 else 0)
+    print(f"Saved corpus to {path}")
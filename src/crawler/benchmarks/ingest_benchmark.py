@@ -0,0 +1,289 @@
+"""
+Offline ingestion throughput benchmark.
+
+Replays a recorded corpus (see benchmarks/corpus.py) through
+DataCleaningPipeline, EmbeddingPipeline and VectorStorePipeline in a real
+Scrapy crawl, without network access: tools/fake_ollama.py stands in for the
+embedding model, and Chroma, the embedding cache and the spill file all live
+in a temporary directory. Settings come from the crawler config, so a run
+measures the configured batch sizes and worker counts.
+
+Reports pages/sec, chunks/sec, per-stage latency percentiles (time from an
+item entering a stage to the stage finishing with it, queueing included, as
+sent by extensions.telemetry's `stage_timing` signal), the vector store's
+write timings, and peak RSS, and writes them as JSON so runs can be compared.
+The vector_store stage only buffers records, so its latency leaves out the
+writes; those are reported under "vector_store_writes".
+
+Usage (from src/crawler):
+    python -m benchmarks.ingest_benchmark run <corpus_dir> [config.json] [results.json] [embed_ms]
+    python -m benchmarks.ingest_benchmark compare <baseline.json> <candidate.json>
+"""
+
+import json
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+import scrapy
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+from scrapy.exceptions import DontCloseSpider
+
+from benchmarks import corpus
+from extensions.telemetry import stage_timing
+from pipelines.data_cleaning import DataCleaningPipeline
+from pipelines.embedding import EmbeddingPipeline
+from pipelines.vector_store import VectorStorePipeline
+
+FAKE_OLLAMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "tools", "fake_ollama.py")
+STAGES = (("cleaning", DataCleaningPipeline, 100), ("embedding", EmbeddingPipeline, 200), ("vector_store", VectorStorePipeline, 300))
+# Settings that shape throughput, copied into the results
+REPORTED_SETTINGS = (
+    "DATA_CLEANING_WORKERS", "CHUNKING_STRATEGY", "EMBEDDING_CHUNK_MAX_TOKENS", "EMBEDDING_BATCH_SIZE",
+    "EMBEDDING_BATCH_MAX_DELAY", "EMBEDDING_MAX_PENDING_CHUNKS", "EMBEDDING_WORKERS", "EMBEDDING_CACHE_ENABLED",
+    "VECTOR_STORE_FLUSH_CHUNKS", "VECTOR_STORE_BACKEND",
+)
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class StageTimer:
+    """Per-stage latencies and drops from the `stage_timing` signal, and the pages and chunks that were stored."""
+
+    def __init__(self):
+        self.stages = {cls.__name__: stage for stage, cls, _ in STAGES}
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.dropped: Counter = Counter()
+        self.pages = 0
+        self.chunks = 0
+        # Pages that left the pipeline, stored or dropped
+        self.finished = 0
+
+    def connect(self, crawler) -> None:
+        crawler.signals.connect(self.stage_timing, signal=stage_timing)
+        crawler.signals.connect(self.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(self.item_dropped, signal=signals.item_dropped)
+
+    def stage_timing(self, stage, seconds, outcome, spider):
+        name = self.stages.get(stage, stage)
+        self.latencies[name].append(seconds * 1000)
+        if outcome != "ok":
+            self.dropped[name] += 1
+
+    def item_scraped(self, item, response, spider):
+        self.pages += 1
+        self.chunks += len(item.get("embeddings") or [])
+        self.finished += 1
+
+    def item_dropped(self, item, response, exception, spider):
+        self.finished += 1
+
+    def report(self) -> dict:
+        return {
+            stage: {
+                "items": len(self.latencies[stage]),
+                "dropped": self.dropped[stage],
+                "ms_mean": sum(self.latencies[stage]) / max(len(self.latencies[stage]), 1),
+                "ms_p50": percentile(self.latencies[stage], 0.50),
+                "ms_p95": percentile(self.latencies[stage], 0.95),
+                "ms_p99": percentile(self.latencies[stage], 0.99),
+            }
+            for stage, _, _ in STAGES
+        }
+
+
+def write_timings(stats: dict, name: str = "vector_store") -> dict:
+    """The write-behind buffer's flush timings (see utils.write_buffer), from the crawl stats."""
+    flushes = stats.get(f"{name}/flushes", 0)
+    return {
+        "flushes": flushes,
+        "records": stats.get(f"{name}/records_written", 0),
+        "ms_mean": stats.get(f"{name}/flush_ms_total", 0.0) / max(flushes, 1),
+        "ms_max": stats.get(f"{name}/flush_ms_max", 0.0),
+        # Longest a record waited in the buffer before its batch was written
+        "buffered_ms_max": stats.get(f"{name}/buffered_ms_max", 0.0),
+    }
+
+
+class ReplaySpider(scrapy.Spider):
+    """Yields the recorded pages as spider items, in place of downloading them."""
+
+    name = "ingest_benchmark"
+
+    def __init__(self, pages=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pages = pages or []
+
+    async def start(self):
+        for page in self.pages:
+            yield {"url": page["url"], "title": page.get("title"), "html": page["html"], "etag": None, "last_modified": None}
+
+
+def keep_open(timer: StageTimer, pages: int) -> None:
+    # Items yielded from start() aren't tracked as in progress, so Scrapy would close the spider under them
+    if timer.finished < pages:
+        raise DontCloseSpider
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_ollama(embed_ms: float, dim: int = 1024) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    process = subprocess.Popen([sys.executable, FAKE_OLLAMA, str(port), "0", "0", str(dim), str(embed_ms)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{url}/api/version", timeout=1).read()
+            return process, url
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Fake Ollama did not start")
+
+
+def peak_rss_mb(who: int) -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def run(corpus_dir: str, config_path: str = "../../crawler_config.json", embed_ms: float = 0.0) -> dict:
+    pages = corpus.load(corpus_dir)
+    with open(config_path, "r") as f:
+        settings = json.load(f)["settings"]
+
+    workdir = tempfile.mkdtemp(prefix="ingest_benchmark_")
+    timer = StageTimer()
+    settings.update({
+        "UNIVERSITY_NAME": "benchmark",
+        "ITEM_PIPELINES": {cls: order for _, cls, order in STAGES},
+        # Nothing is downloaded, so none of the crawl machinery (Redis scheduler, feeds, middlewares) is needed
+        "SCHEDULER": "scrapy.core.scheduler.Scheduler",
+        "DUPEFILTER_CLASS": "scrapy.dupefilters.RFPDupeFilter",
+        "DOWNLOADER_MIDDLEWARES": {},
+        "FEEDS": {},
+        "TELNETCONSOLE_ENABLED": False,
+        # Stage latencies are collected from the stage_timing signal; live telemetry would need Redis
+        "TELEMETRY_ENABLED": False,
+        "CLOSESPIDER_ITEMCOUNT": 0,
+        "INCREMENTAL_CRAWL": False,
+        "LOG_LEVEL": os.environ.get("BENCHMARK_LOG_LEVEL", "WARNING"),
+        "CHROMA_DB_PATH": os.path.join(workdir, "chroma"),
+        "QUANTIZED_INDEX_DIR": os.path.join(workdir, "quantized_index"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.sqlite"),
+        "VECTOR_STORE_SPILL_PATH": os.path.join(workdir, "unwritten.jsonl"),
+    })
+
+    fake_ollama, url = start_fake_ollama(embed_ms)
+    os.environ["OLLAMA_HOST"] = url
+    window = {}
+    try:
+        process = CrawlerProcess(settings)
+        crawler = process.create_crawler(ReplaySpider)
+
+        # Signal receivers are held weakly, so these must stay referenced for the whole crawl.
+        # Opened fires after every pipeline's open_spider, closed after every close_spider (final flushes included)
+        def opened(spider):
+            window["opened"] = time.perf_counter()
+
+        def closed(spider):
+            window["closed"] = time.perf_counter()
+
+        def idle(spider):
+            keep_open(timer, len(pages))
+
+        crawler.signals.connect(opened, signal=signals.spider_opened)
+        crawler.signals.connect(closed, signal=signals.spider_closed)
+        crawler.signals.connect(idle, signal=signals.spider_idle)
+        timer.connect(crawler)
+        started = time.perf_counter()
+        process.crawl(crawler, pages=pages)
+        process.start()
+        # Extraction workers have been joined by now; the fake model server hasn't
+        worker_rss = peak_rss_mb(resource.RUSAGE_CHILDREN)
+    finally:
+        fake_ollama.terminate()
+        fake_ollama.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    seconds = window["closed"] - window["opened"]
+    stats = crawler.stats.get_stats()
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": corpus.git_commit(),
+        "corpus": os.path.abspath(corpus_dir),
+        "corpus_pages": len(pages),
+        "embed_ms": embed_ms,
+        "settings": {key: settings.get(key) for key in REPORTED_SETTINGS},
+        "pages": timer.pages,
+        "chunks": timer.chunks,
+        "startup_s": window["opened"] - started,
+        "ingest_s": seconds,
+        "pages_per_sec": timer.pages / seconds,
+        "chunks_per_sec": timer.chunks / seconds,
+        "stages": timer.report(),
+        "vector_store_writes": write_timings(stats),
+        "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF),
+        "peak_worker_rss_mb": worker_rss,
+        "stats": {key: value for key, value in stats.items()
+                  if key.startswith(("embedding", "vector_store", "cleaning", "item_dropped"))},
+    }
+
+
+def compare(baseline: dict, candidate: dict) -> list[tuple[str, float, float, float]]:
+    """(metric, baseline, candidate, % change) for the headline numbers of two runs."""
+    def flat(result):
+        metrics = {key: result[key] for key in ("pages_per_sec", "chunks_per_sec", "ingest_s", "peak_rss_mb", "peak_worker_rss_mb")}
+        for stage, values in result["stages"].items():
+            for key in ("ms_p50", "ms_p95", "ms_p99"):
+                metrics[f"{stage}_{key}"] = values[key]
+        # Runs saved before write timings were reported don't have them
+        for key in ("ms_mean", "ms_max", "buffered_ms_max"):
+            metrics[f"write_{key}"] = result.get("vector_store_writes", {}).get(key, 0.0)
+        return metrics
+
+    old, new = flat(baseline), flat(candidate)
+    return [(key, old[key], new[key], (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0) for key in old]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("run", "compare"):
+        print(__doc__)
+        sys.exit(1)
+
+    if sys.argv[1] == "compare":
+        with open(sys.argv[2]) as f, open(sys.argv[3]) as g:
+            rows = compare(json.load(f), json.load(g))
+        for key, old, new, change in rows:
+            print(f"{key:28} {old:12.2f} {new:12.2f} {change:+8.1f}%")
+        sys.exit(0)
+
+    config_path = sys.argv[3] if len(sys.argv) > 3 else "../../crawler_config.json"
+    output = sys.argv[4] if len(sys.argv) > 4 else os.path.join(
+        "benchmarks", "results", f"ingest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    result = run(sys.argv[2], config_path, float(sys.argv[5]) if len(sys.argv) > 5 else 0.0)
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps({key: value for key, value in result.items() if key != "stats"}, indent=2))
+    print(f"Saved results to {output}")
@@ -2,14 +2,21 @@ import streamlit as st
 import subprocess
 import os
 import time
+import json
+from collections import deque
 import chromadb
 import pandas as pd
+import redis
 from utils.redis_utils import clear_redis
 from utils.chroma_utils import clear_chroma_db
 
 # Configuration
 LOG_FILE = "/Users/lukepitstick/university-search/crawler_output.log"
 CHROMA_DB_PATH = '../../chroma_langchain_db'
+REDIS_URL = "redis://localhost:6379"
+LOG_LINES = 100
+# Bytes read from the end of an existing log when the dashboard first opens it
+LOG_BACKFILL_BYTES = 64 * 1024
 
 st.set_page_config(page_title="University Crawler Dashboard", layout="wide")
 st.title("🎓 University Crawler Dashboard")
@@ -24,18 +31,151 @@ def check_crawler_running():
     result = subprocess.run(['pgrep', '-f', 'start_crawlers.py'], capture_output=True)
     return result.returncode == 0
 
-def read_log_file(max_lines=100):
-    """Read the last N lines from the log file"""
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, 'r') as f:
-            lines = f.readlines()
-            return ''.join(lines[-max_lines:])
-    return ""
+def reset_log_tail():
+    st.session_state.log_offset = None
+    st.session_state.log_lines = deque(maxlen=LOG_LINES)
+    st.session_state.log_partial = b""
+
+def read_log_file():
+    """
+    Return the last LOG_LINES lines of the log file. Only the bytes written
+    since the previous rerun are read, from the offset where that read stopped.
+    """
+    if "log_offset" not in st.session_state:
+        reset_log_tail()
+    if not os.path.exists(LOG_FILE):
+        return ""
+
+    size = os.path.getsize(LOG_FILE)
+    offset = st.session_state.log_offset
+    if offset is not None and size < offset:
+        # Truncated (cleared or restarted), start over
+        reset_log_tail()
+        offset = None
+    with open(LOG_FILE, 'rb') as f:
+        if offset is None:
+            offset = max(0, size - LOG_BACKFILL_BYTES)
+            f.seek(offset)
+            if offset:
+                f.readline()  # Drop the partial first line
+        else:
+            f.seek(offset)
+        data = st.session_state.log_partial + f.read()
+        st.session_state.log_offset = f.tell()
+
+    # Keep an unterminated last line until the rest of it is written
+    *lines, st.session_state.log_partial = data.split(b"\n")
+    st.session_state.log_lines.extend(line.decode("utf-8", errors="replace") for line in lines)
+    return "\n".join(st.session_state.log_lines)
 
 def clear_log_file():
     """Clear the log file"""
     with open(LOG_FILE, 'w') as f:
         f.write("")
+    reset_log_tail()
+
+def read_telemetry(redis_url):
+    """Telemetry snapshots published by extensions.telemetry.CrawlTelemetry, oldest first, keyed by spider name"""
+    try:
+        r = redis.from_url(redis_url)
+        telemetry = {}
+        for key in r.scan_iter(match="university_spider_*:telemetry"):
+            snapshots = [json.loads(raw) for raw in reversed(r.lrange(key, 0, -1))]
+            if snapshots:
+                telemetry[snapshots[-1]["spider"]] = snapshots
+        return telemetry
+    except redis.RedisError:
+        return {}
+
+def telemetry_frame(snapshots, field):
+    """One column per spider, indexed by snapshot time"""
+    series = {
+        spider: pd.Series(
+            [snapshot.get(field) for snapshot in rows],
+            index=pd.to_datetime([snapshot["time"] for snapshot in rows], unit="s"),
+        )
+        for spider, rows in snapshots.items()
+    }
+    return pd.DataFrame(series)
+
+def stage_frame(rows, field):
+    """One column per pipeline stage for a single spider"""
+    records = {}
+    for snapshot in rows:
+        timestamp = pd.to_datetime(snapshot["time"], unit="s")
+        for stage, values in snapshot["stages"].items():
+            if values["items"]:
+                records.setdefault(stage, {})[timestamp] = values[field]
+    return pd.DataFrame(records)
+
+def per_university(latest, field):
+    """
+    A shared gauge's newest value for each university. All crawlers of a
+    university report the same queue and dupefilter, so summing them per
+    crawler would count each one several times.
+    """
+    values = {}
+    for snapshot in sorted(latest, key=lambda snapshot: snapshot["time"]):
+        if snapshot.get(field) is not None:
+            values[snapshot["university"]] = snapshot[field]
+    return values
+
+def shared_metric(column, label, latest, field):
+    values = per_university(latest, field)
+    breakdown = ", ".join(f"{university}: {value}" for university, value in sorted(values.items()))
+    column.metric(label, sum(values.values()) if values else "-", help=breakdown or None)
+
+def show_telemetry():
+    telemetry = read_telemetry(REDIS_URL)
+    if not telemetry:
+        st.write("_No telemetry yet_")
+        return
+
+    spiders = st.multiselect("Crawlers", sorted(telemetry), default=sorted(telemetry))
+    selected = {spider: telemetry[spider] for spider in spiders}
+    if not selected:
+        return
+
+    latest = [rows[-1] for rows in selected.values()]
+    cols = st.columns(5)
+    cols[0].metric("Items scraped", sum(snapshot["items"] for snapshot in latest))
+    cols[1].metric("Items/sec", f"{sum(snapshot['items_per_sec'] for snapshot in latest):.2f}")
+    shared_metric(cols[2], "Queue depth", latest, "queue_depth")
+    shared_metric(cols[3], "Dupefilter size", latest, "dupefilter_size")
+    cols[4].metric("Items in pipelines", sum(snapshot["items_in_pipelines"] for snapshot in latest))
+
+    chart_a, chart_b = st.columns(2)
+    with chart_a:
+        st.caption("Items/sec")
+        st.line_chart(telemetry_frame(selected, "items_per_sec"))
+        st.caption("Queue depth")
+        st.line_chart(telemetry_frame(selected, "queue_depth"))
+    with chart_b:
+        st.caption("Responses/sec")
+        st.line_chart(telemetry_frame(selected, "responses_per_sec"))
+        st.caption("Dupefilter size")
+        st.line_chart(telemetry_frame(selected, "dupefilter_size"))
+
+    spider = st.selectbox("Stage timings for", spiders)
+    rows = selected[spider]
+    chart_a, chart_b = st.columns(2)
+    with chart_a:
+        st.caption("Stage p95 latency (ms)")
+        st.line_chart(stage_frame(rows, "p95_ms"))
+    with chart_b:
+        st.caption("Stage p50 latency (ms)")
+        st.line_chart(stage_frame(rows, "p50_ms"))
+
+    st.caption("Pipeline stages (latest interval)")
+    st.dataframe(pd.DataFrame(rows[-1]["stages"]).T, use_container_width=True)
+
+    stats = rows[-1]["stats"]
+    batches = stats.get("embedding/batches", 0)
+    cols = st.columns(4)
+    cols[0].metric("Embedding batches", batches)
+    cols[1].metric("Avg batch size", f"{stats.get('embedding/chunks', 0) / batches:.1f}" if batches else "-")
+    cols[2].metric("Embedding queue", stats.get("embedding/queue_depth", 0))
+    cols[3].metric("Backpressure waits", stats.get("embedding/backpressure_waits", 0))
 
 @st.cache_resource
 def get_chroma_client():
@@ -95,6 +235,10 @@ with tab1:
     else:
         st.write("No crawler running")
     
+    # Telemetry
+    st.subheader("Telemetry")
+    show_telemetry()
+
     # Log output
     st.subheader("Output Log")
     log_content = read_log_file()
@@ -199,7 +343,7 @@ with tab3:
     st.header("Utilities")
     
     st.subheader("Redis")
-    redis_url = st.text_input("Redis URL", value="redis://localhost:6379")
+    redis_url = st.text_input("Redis URL", value=REDIS_URL)
     if st.button("🗑️ Clear Redis", use_container_width=True):
         clear_redis(redis_url)
         st.success("Redis cleared!")
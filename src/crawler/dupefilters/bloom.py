@@ -0,0 +1,102 @@
+import math
+
+
+class RedisBloomFilter:
+    """
+    Scalable Bloom filter stored as Redis bitmaps, shared by every crawler
+    that uses the same key.
+
+    It starts with one filter sized for `capacity` fingerprints. When that
+    fills up a new filter is added with `growth` times the capacity and a
+    tighter error rate, so the overall false-positive rate stays below
+    `error_rate` however many URLs are seen.
+
+    Keys: `<key>:bloom:meta` (filter count and per-filter fill counts) and
+    `<key>:bloom:<n>` (one bitmap per filter).
+    """
+
+    TIGHTENING = 0.5
+
+    def __init__(self, server, key, capacity=1_000_000, error_rate=0.001, growth=2, refresh_every=1000):
+        self.server = server
+        self.key = key
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.refresh_every = refresh_every
+        self.meta_key = f"{key}:bloom:meta"
+        self._filters = []
+        self._lookups_since_refresh = 0
+        self._refresh()
+
+    def _filter_params(self, index):
+        capacity = self.capacity * self.growth ** index
+        # The series error_rate * (1 - r) * r^i sums to at most error_rate
+        error = self.error_rate * (1 - self.TIGHTENING) * self.TIGHTENING ** index
+        bits = math.ceil(-capacity * math.log(error) / math.log(2) ** 2)
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        return {"key": f"{self.key}:bloom:{index}", "capacity": capacity, "bits": bits, "hashes": hashes}
+
+    def _refresh(self):
+        count = int(self.server.hget(self.meta_key, "filters") or 1)
+        self._filters = [self._filter_params(i) for i in range(count)]
+        self._lookups_since_refresh = 0
+
+    @staticmethod
+    def _positions(fingerprint, bloom):
+        # Double hashing over the 20-byte SHA1 fingerprint
+        h1 = int.from_bytes(fingerprint[:8], "big")
+        h2 = int.from_bytes(fingerprint[8:16], "big") | 1
+        return [(h1 + i * h2) % bloom["bits"] for i in range(bloom["hashes"])]
+
+    def add(self, fingerprint):
+        """Adds a fingerprint and returns True if it was (probably) already present."""
+        self._lookups_since_refresh += 1
+        if self._lookups_since_refresh >= self.refresh_every:
+            self._refresh()
+
+        pipe = self.server.pipeline(transaction=False)
+        for bloom in self._filters:
+            for position in self._positions(fingerprint, bloom):
+                pipe.getbit(bloom["key"], position)
+        bits = pipe.execute()
+
+        offset = 0
+        for bloom in self._filters:
+            if all(bits[offset:offset + bloom["hashes"]]):
+                return True
+            offset += bloom["hashes"]
+
+        # Only new fingerprints are written, so repeat lookups never fill the current filter
+        current = self._filters[-1]
+        pipe = self.server.pipeline(transaction=False)
+        for position in self._positions(fingerprint, current):
+            pipe.setbit(current["key"], position, 1)
+        # SETBIT returns the previous bits, so a concurrent add by another crawler is still detected
+        if all(pipe.execute()):
+            return True
+
+        index = len(self._filters) - 1
+        filled = self.server.hincrby(self.meta_key, f"count:{index}", 1)
+        if filled == current["capacity"]:
+            # Exactly one crawler sees the filter reach capacity and adds the next one
+            self.server.hset(self.meta_key, "filters", index + 2)
+            self._refresh()
+        elif filled > current["capacity"]:
+            self._refresh()
+        return False
+
+    def __len__(self):
+        counts = self.server.hgetall(self.meta_key)
+        return sum(int(v) for k, v in counts.items() if k.startswith(b"count:"))
+
+    def memory_bytes(self):
+        return sum(math.ceil(bloom["bits"] / 8) for bloom in self._filters)
+
+    def clear(self):
+        self._refresh()
+        self.server.delete(self.meta_key, *(bloom["key"] for bloom in self._filters))
+        self._refresh()
+
+    def close(self):
+        pass
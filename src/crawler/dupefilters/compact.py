@@ -0,0 +1,109 @@
+import logging
+import time
+
+from scrapy import signals
+from scrapy_redis import defaults
+from scrapy_redis.connection import get_redis_from_settings
+from scrapy_redis.dupefilter import RFPDupeFilter
+
+from dupefilters.bloom import RedisBloomFilter
+from dupefilters.sqlite import SQLiteFingerprintStore
+
+logger = logging.getLogger(__name__)
+
+
+def make_backend(settings, server, key):
+    backend = settings.get("DUPEFILTER_BACKEND", "bloom")
+    if backend == "bloom":
+        return RedisBloomFilter(
+            server,
+            key,
+            capacity=settings.getint("DUPEFILTER_BLOOM_CAPACITY", 1_000_000),
+            error_rate=settings.getfloat("DUPEFILTER_BLOOM_ERROR_RATE", 0.0001),
+        )
+    if backend == "sqlite":
+        return SQLiteFingerprintStore(settings.get("DUPEFILTER_SQLITE_PATH", "../../dupefilter.sqlite"), key)
+    raise ValueError(f"Unknown DUPEFILTER_BACKEND: {backend}")
+
+
+class CompactDupeFilter(RFPDupeFilter):
+    """
+    Drop-in replacement for scrapy_redis' RFPDupeFilter that stores
+    fingerprints compactly instead of as 40-char hex strings in a Redis set.
+
+    DUPEFILTER_BACKEND selects a scalable Bloom filter in Redis ("bloom",
+    shared by every crawler instance) or a local SQLite table ("sqlite").
+    Both use the same SCHEDULER_DUPEFILTER_KEY namespacing. Lookup latency
+    and memory use are reported in the crawl stats.
+    """
+
+    logger = logger
+
+    def __init__(self, server, key, debug=False, backend=None, stats=None):
+        super().__init__(server, key, debug)
+        self.backend = backend
+        self.stats = stats
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+        self.max_lookup_seconds = 0.0
+
+    @classmethod
+    def from_settings(cls, settings):
+        # Standalone use with Scrapy's default scheduler gets a one-time key, like RFPDupeFilter
+        server = get_redis_from_settings(settings)
+        key = defaults.DUPEFILTER_KEY % {"timestamp": int(time.time())}
+        return cls(server, key, settings.getbool("DUPEFILTER_DEBUG"), make_backend(settings, server, key))
+
+    @classmethod
+    def from_spider(cls, spider):
+        settings = spider.settings
+        server = get_redis_from_settings(settings)
+        dupefilter_key = settings.get("SCHEDULER_DUPEFILTER_KEY", defaults.SCHEDULER_DUPEFILTER_KEY)
+        key = dupefilter_key % {"spider": spider.name}
+        dupefilter = cls(
+            server,
+            key,
+            debug=settings.getbool("DUPEFILTER_DEBUG"),
+            backend=make_backend(settings, server, key),
+            stats=spider.crawler.stats,
+        )
+        # scrapy_redis' scheduler never calls close(), so report on spider close instead
+        spider.crawler.signals.connect(dupefilter.close, signal=signals.spider_closed)
+        return dupefilter
+
+    def request_seen(self, request):
+        fingerprint = bytes.fromhex(self.request_fingerprint(request))
+        start = time.perf_counter()
+        seen = self.backend.add(fingerprint)
+        elapsed = time.perf_counter() - start
+
+        self.lookups += 1
+        self.lookup_seconds += elapsed
+        self.max_lookup_seconds = max(self.max_lookup_seconds, elapsed)
+        if self.lookups % 1000 == 0:
+            self.report()
+        return seen
+
+    def __len__(self):
+        return len(self.backend)
+
+    def report(self):
+        if self.stats is None or not self.lookups:
+            return
+        self.stats.set_value("dupefilter/lookups", self.lookups)
+        self.stats.set_value("dupefilter/lookup_ms_avg", round(self.lookup_seconds / self.lookups * 1000, 3))
+        self.stats.set_value("dupefilter/lookup_ms_max", round(self.max_lookup_seconds * 1000, 3))
+        self.stats.set_value("dupefilter/memory_bytes", self.backend.memory_bytes())
+
+    def clear(self):
+        self.backend.clear()
+
+    def close(self, reason=""):
+        # Unlike RFPDupeFilter, don't clear on close: the scheduler flushes when SCHEDULER_PERSIST is off
+        self.report()
+        self.logger.info(
+            f"Dupefilter {self.key}: {self.lookups} lookups, "
+            f"{self.lookup_seconds / max(self.lookups, 1) * 1000:.3f} ms avg, "
+            f"{self.backend.memory_bytes()} bytes"
+        )
+        self.backend.close()
@@ -0,0 +1,47 @@
+import os
+import sqlite3
+
+
+class SQLiteFingerprintStore:
+    """
+    Local SQLite set of request fingerprints, stored as 20-byte blobs in a
+    WITHOUT ROWID table keyed by (dupefilter key, fingerprint). Only crawlers
+    on the same machine share it.
+    """
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            "key TEXT NOT NULL, fp BLOB NOT NULL, PRIMARY KEY (key, fp)"
+            ") WITHOUT ROWID"
+        )
+
+    def add(self, fingerprint):
+        """Adds a fingerprint and returns True if it was already present."""
+        cursor = self._conn.execute("INSERT OR IGNORE INTO fingerprints (key, fp) VALUES (?, ?)", (self.key, fingerprint))
+        return cursor.rowcount == 0
+
+    def __len__(self):
+        # A connection of its own, so telemetry can count from a worker thread while crawling goes on
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM fingerprints WHERE key = ?", (self.key,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def memory_bytes(self):
+        page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
+
+    def clear(self):
+        self._conn.execute("DELETE FROM fingerprints WHERE key = ?", (self.key,))
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,80 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scrapy.exporters import BaseItemExporter
+
+
+class _ColumnarItemExporter(BaseItemExporter, ABC):
+    """
+    Writes one row per embedded chunk (url, title, chunk index, chunk text)
+    with the embedding as a fixed-size list of float32 or float16, so the
+    vectors are stored contiguously instead of as JSON floats.
+
+    Options (via the feed's item_export_kwargs): `embedding_dtype`
+    ("float32" or "float16") and `batch_rows` (rows buffered per record batch).
+    """
+
+    def __init__(self, file, **kwargs):
+        self.file = file
+        self.embedding_dtype = np.dtype(kwargs.pop("embedding_dtype", "float32"))
+        self.batch_rows = kwargs.pop("batch_rows", 1024)
+        super().__init__(dont_fail=True, **kwargs)
+        self._rows = {"url": [], "title": [], "chunk_index": [], "text": []}
+        self._vectors = []
+        self._writer = None
+        self._schema = None
+
+    def export_item(self, item):
+        for index, chunk in enumerate(item.get("embeddings") or []):
+            self._rows["url"].append(item["url"])
+            self._rows["title"].append(item.get("title"))
+            self._rows["chunk_index"].append(index)
+            self._rows["text"].append(chunk["text"])
+            self._vectors.append(chunk["embedding"])
+        if len(self._vectors) >= self.batch_rows:
+            self._write_batch()
+
+    def finish_exporting(self):
+        self._write_batch()
+        if self._writer is not None:
+            self._writer.close()
+
+    def _write_batch(self):
+        if not self._vectors:
+            return
+        vectors = np.asarray(self._vectors, dtype=self.embedding_dtype)
+        embedding = pa.FixedSizeListArray.from_arrays(pa.array(vectors.ravel()), vectors.shape[1])
+        batch = pa.record_batch(
+            [
+                pa.array(self._rows["url"], pa.string()),
+                pa.array(self._rows["title"], pa.string()),
+                pa.array(self._rows["chunk_index"], pa.int32()),
+                pa.array(self._rows["text"], pa.string()),
+                embedding,
+            ],
+            names=["url", "title", "chunk_index", "text", "embedding"],
+        )
+        if self._writer is None:
+            self._schema = batch.schema
+            self._writer = self._open_writer(self._schema)
+        self._writer.write_batch(batch)
+        self._rows = {key: [] for key in self._rows}
+        self._vectors = []
+
+    @abstractmethod
+    def _open_writer(self, schema):
+        """A writer for `schema` on self.file, with write_batch() and close()."""
+
+
+class ParquetItemExporter(_ColumnarItemExporter):
+    def _open_writer(self, schema):
+        return pq.ParquetWriter(self.file, schema, compression="zstd")
+
+
+class ArrowItemExporter(_ColumnarItemExporter):
+    """Arrow IPC file, which can be memory-mapped without decoding."""
+
+    def _open_writer(self, schema):
+        return pa.ipc.new_file(self.file, schema)
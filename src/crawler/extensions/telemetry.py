@@ -0,0 +1,286 @@
+import functools
+import json
+import logging
+import time
+
+import redis
+from scrapy import signals
+from scrapy.exceptions import DropItem, NotConfigured
+from scrapy_redis.connection import get_redis_from_settings
+from twisted.internet import task, threads
+from twisted.internet.defer import Deferred
+from twisted.python.failure import Failure
+
+from utils.histogram import Histogram
+from utils.prometheus import MetricsServer
+
+logger = logging.getLogger(__name__)
+
+# Sent with stage, seconds, outcome ("ok", "dropped" or "error") and spider when an item leaves a pipeline
+stage_timing = object()
+
+# Upper bounds in seconds, from a cached lookup to a slow extraction or a full embedding queue
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Crawl stats published as-is, by prefix
+STATS_PREFIXES = ("embedding/", "embedding_cache/", "vector_store/", "lexical_index/", "dupefilter/", "cleaning/", "frontier/")
+
+
+def _report(spider, stage, start, outcome):
+    spider.crawler.signals.send_catch_log(
+        stage_timing, stage=stage, seconds=time.perf_counter() - start, outcome=outcome, spider=spider
+    )
+
+
+def timed_stage(process_item):
+    """
+    Decorates a pipeline's process_item to send `stage_timing` when the item
+    leaves the stage. For a Deferred result that is when it fires, so the
+    time includes waiting for worker threads and batches.
+    """
+
+    @functools.wraps(process_item)
+    def wrapper(self, item, spider):
+        stage = type(self).__name__
+        start = time.perf_counter()
+        try:
+            result = process_item(self, item, spider)
+        except DropItem:
+            _report(spider, stage, start, "dropped")
+            raise
+        except Exception:
+            _report(spider, stage, start, "error")
+            raise
+        if not isinstance(result, Deferred):
+            _report(spider, stage, start, "ok")
+            return result
+
+        def done(value):
+            if isinstance(value, Failure):
+                _report(spider, stage, start, "dropped" if value.check(DropItem) else "error")
+            else:
+                _report(spider, stage, start, "ok")
+            return value
+
+        return result.addBoth(done)
+
+    return wrapper
+
+
+def _bucket_labels(buckets):
+    return [str(bound) for bound in buckets] + ["+Inf"]
+
+
+def _size(obj):
+    try:
+        return len(obj)
+    except (TypeError, redis.RedisError):
+        return None
+
+
+class CrawlTelemetry:
+    """
+    Live crawl metrics: per-pipeline-stage latency histograms (fed by
+    `timed_stage`), items and responses per second, scheduler queue depth,
+    dupefilter size, items in the pipelines, and the embedding, vector store
+    and dupefilter counters from the crawl stats.
+
+    Every TELEMETRY_INTERVAL seconds a snapshot is pushed to the Redis list
+    `<spider name>:telemetry` (newest first, capped at TELEMETRY_HISTORY) for
+    the dashboard. Stage latencies in a snapshot cover that interval only.
+    Queue depth and dupefilter size are read in a worker thread, since both
+    are Redis or SQLite queries. With TELEMETRY_PROMETHEUS_PORT set, cumulative metrics are also served at
+    /metrics, labelled by spider, by one server shared by all crawlers in the
+    process.
+    """
+
+    def __init__(self, crawler, interval=5.0, history=720, prometheus_host="127.0.0.1", prometheus_port=0):
+        self.crawler = crawler
+        self.interval = interval
+        self.history = history
+        self.prometheus_host = prometheus_host
+        self.prometheus_port = prometheus_port
+        self.server = get_redis_from_settings(crawler.settings)
+        self.histograms = {}
+        self.outcomes = {}
+        self.metrics_server = None
+        self.spider = None
+        self.key = None
+        self._loop = None
+        self._previous = None
+        self._families = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("TELEMETRY_ENABLED", True):
+            raise NotConfigured
+        telemetry = cls(
+            crawler,
+            interval=settings.getfloat("TELEMETRY_INTERVAL", 5.0),
+            history=settings.getint("TELEMETRY_HISTORY", 720),
+            prometheus_host=settings.get("TELEMETRY_PROMETHEUS_HOST", "127.0.0.1"),
+            prometheus_port=settings.getint("TELEMETRY_PROMETHEUS_PORT", 0),
+        )
+        crawler.signals.connect(telemetry.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(telemetry.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(telemetry.stage_timing, signal=stage_timing)
+        return telemetry
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        self.key = f"{spider.name}:telemetry"
+        self._previous = self._counters()
+        if self.prometheus_port:
+            self.metrics_server = MetricsServer.acquire(self.prometheus_host, self.prometheus_port)
+            if self.metrics_server is not None:
+                self.metrics_server.add(self.families)
+        self._loop = task.LoopingCall(self.publish)
+        self._loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+        d = self.publish()
+        d.addCallback(self._release_metrics_server)
+        return d
+
+    def _release_metrics_server(self, _):
+        if self.metrics_server is not None:
+            self.metrics_server.remove(self.families)
+            MetricsServer.release()
+            self.metrics_server = None
+
+    def stage_timing(self, stage, seconds, outcome, spider):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram(STAGE_BUCKETS)
+            self.outcomes[stage] = {"ok": 0, "dropped": 0, "error": 0}
+        histogram.observe(seconds)
+        self.outcomes[stage][outcome] += 1
+
+    def _scheduler(self):
+        engine = self.crawler.engine
+        slot = getattr(engine, "_slot", None) or getattr(engine, "slot", None)
+        return getattr(slot, "scheduler", None)
+
+    def _counters(self):
+        stats = self.crawler.stats
+        return {
+            "time": time.time(),
+            "items": stats.get_value("item_scraped_count", 0),
+            "responses": stats.get_value("response_received_count", 0),
+            "stages": {stage: list(histogram.counts) for stage, histogram in self.histograms.items()},
+        }
+
+    def _sizes(self):
+        """Queue depth and dupefilter size, in a Deferred that fires from a worker thread."""
+        scheduler = self._scheduler()
+        return threads.deferToThread(lambda: (_size(scheduler), _size(getattr(scheduler, "df", None))))
+
+    def snapshot(self, queue_depth=None, dupefilter_size=None):
+        """Current gauges and counters, with rates and stage latencies over the interval since the last snapshot."""
+        stats = self.crawler.stats
+        engine = self.crawler.engine
+        current = self._counters()
+        previous = self._previous or current
+        elapsed = max(current["time"] - previous["time"], 1e-9)
+
+        stages = {}
+        for stage, histogram in self.histograms.items():
+            before = previous["stages"].get(stage, [0] * len(histogram.counts))
+            window = [now - then for now, then in zip(current["stages"][stage], before)]
+            stages[stage] = {
+                "items": sum(window),
+                "total": histogram.count,
+                "mean_ms": histogram.sum / max(histogram.count, 1) * 1000,
+                "p50_ms": histogram.quantile(0.50, window) * 1000,
+                "p95_ms": histogram.quantile(0.95, window) * 1000,
+                "p99_ms": histogram.quantile(0.99, window) * 1000,
+                **self.outcomes[stage],
+            }
+
+        snapshot = {
+            "time": current["time"],
+            "spider": self.spider.name,
+            "university": self.crawler.settings.get("UNIVERSITY_NAME"),
+            "items": current["items"],
+            "items_dropped": stats.get_value("item_dropped_count", 0),
+            "items_per_sec": (current["items"] - previous["items"]) / elapsed,
+            "responses_per_sec": (current["responses"] - previous["responses"]) / elapsed,
+            "queue_depth": queue_depth,
+            "dupefilter_size": dupefilter_size,
+            "requests_in_flight": len(engine.downloader.active),
+            "items_in_pipelines": engine.scraper.slot.itemproc_size if engine.scraper.slot else 0,
+            "stages": stages,
+            "stats": {
+                key: value for key, value in stats.get_stats().items()
+                if key.startswith(STATS_PREFIXES) and isinstance(value, (int, float))
+            },
+        }
+        self._previous = current
+        return snapshot
+
+    def publish(self):
+        # LoopingCall waits for the Deferred, so a slow count never overlaps the next interval
+        d = self._sizes()
+        d.addErrback(self._sizes_failed)
+        d.addCallback(self._publish)
+        return d
+
+    def _sizes_failed(self, failure):
+        logger.warning(f"Telemetry: failed to read queue and dupefilter sizes: {failure.getErrorMessage()}")
+        return None, None
+
+    def _publish(self, sizes):
+        try:
+            snapshot = self.snapshot(*sizes)
+        except Exception:
+            logger.exception("Telemetry: failed to take a snapshot")
+            return
+        self._families = self._to_families(snapshot)
+        try:
+            with self.server.pipeline() as pipe:
+                pipe.lpush(self.key, json.dumps(snapshot))
+                pipe.ltrim(self.key, 0, self.history - 1)
+                pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Telemetry: failed to publish to Redis: {e}")
+
+    def families(self):
+        """Prometheus metric families from the last snapshot (see utils.prometheus.render). Called from the server thread."""
+        return self._families
+
+    def _to_families(self, snapshot):
+        labels = {"spider": snapshot["spider"], "university": snapshot["university"]}
+        families = {
+            "crawler_items_scraped_total": ("counter", "Items that passed every pipeline.", [("", labels, snapshot["items"])]),
+            "crawler_items_dropped_total": ("counter", "Items dropped by a pipeline.", [("", labels, snapshot["items_dropped"])]),
+            "crawler_items_per_second": ("gauge", "Items scraped per second over the last interval.", [("", labels, snapshot["items_per_sec"])]),
+            "crawler_responses_per_second": ("gauge", "Responses received per second over the last interval.", [("", labels, snapshot["responses_per_sec"])]),
+            "crawler_requests_in_flight": ("gauge", "Requests being downloaded.", [("", labels, snapshot["requests_in_flight"])]),
+            "crawler_items_in_pipelines": ("gauge", "Items being processed by the item pipelines.", [("", labels, snapshot["items_in_pipelines"])]),
+        }
+        if snapshot["queue_depth"] is not None:
+            families["crawler_queue_depth"] = ("gauge", "Requests waiting in the scheduler queue.", [("", labels, snapshot["queue_depth"])])
+        if snapshot["dupefilter_size"] is not None:
+            families["crawler_dupefilter_size"] = ("gauge", "Fingerprints in the dupefilter.", [("", labels, snapshot["dupefilter_size"])])
+
+        buckets, outcomes = [], []
+        for stage, histogram in self.histograms.items():
+            stage_labels = {**labels, "stage": stage}
+            cumulative = 0
+            for bound, count in zip(_bucket_labels(histogram.buckets), histogram.counts):
+                cumulative += count
+                buckets.append(("_bucket", {**stage_labels, "le": bound}, cumulative))
+            buckets.append(("_sum", stage_labels, histogram.sum))
+            buckets.append(("_count", stage_labels, cumulative))
+            for outcome, count in self.outcomes[stage].items():
+                outcomes.append(("", {**stage_labels, "outcome": outcome}, count))
+        if buckets:
+            families["crawler_stage_seconds"] = ("histogram", "Time from an item entering a pipeline stage to leaving it.", buckets)
+            families["crawler_stage_items_total"] = ("counter", "Items that left a pipeline stage, by outcome.", outcomes)
+
+        stat_samples = [("", {**labels, "stat": key}, value) for key, value in snapshot["stats"].items()]
+        if stat_samples:
+            families["crawler_stat"] = ("gauge", "Embedding, vector store, dupefilter and cleaning counters from the crawl stats.", stat_samples)
+        return families
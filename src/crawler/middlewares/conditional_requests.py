@@ -0,0 +1,41 @@
+from scrapy.crawler import Crawler
+from scrapy.exceptions import NotConfigured
+from scrapy_redis.connection import get_redis_from_settings
+
+from utils.page_state import LINKS_TTL, PageStateStore
+
+
+class ConditionalRequestMiddleware:
+    """
+    Turns requests for pages seen in an earlier crawl into conditional GETs
+    (If-None-Match / If-Modified-Since), so unchanged pages come back as 304
+    with no body. Only active when INCREMENTAL_CRAWL is set. Pages whose
+    links were never stored or have expired are fetched in full, since a 304
+    for them could not expand the frontier.
+    """
+
+    def __init__(self, store: PageStateStore, stats=None):
+        self.store = store
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler):
+        settings = crawler.settings
+        if not settings.getbool('INCREMENTAL_CRAWL'):
+            raise NotConfigured
+        store = PageStateStore(get_redis_from_settings(settings), settings.get('UNIVERSITY_NAME'),
+                               settings.getint('PAGE_LINKS_TTL', LINKS_TTL))
+        return cls(store, crawler.stats)
+
+    def process_request(self, request, spider):
+        state = self.store.get(request.url)
+        if not state or not self.store.has_links(request.url):
+            return None
+
+        if state.get('etag') and b'If-None-Match' not in request.headers:
+            request.headers['If-None-Match'] = state['etag']
+        if state.get('last_modified') and b'If-Modified-Since' not in request.headers:
+            request.headers['If-Modified-Since'] = state['last_modified']
+        if self.stats is not None:
+            self.stats.inc_value('incremental/conditional_requests')
+        return None
@@ -0,0 +1,236 @@
+"""
+Crawls many universities at once on one machine.
+
+Each university gets its own worker process (Scrapy's reactor can only run
+once per process) with its own Redis key prefix, so starting or clearing one
+university never touches another's queue, dupefilter or page state.
+
+A fixed budget of crawler instances is shared between the universities in
+proportion to their frontier size (requests waiting in their queue). When a
+crawl finishes, its crawlers go to the next waiting university, or, once
+every university has started, to a helper process that joins the running
+crawl with the largest backlog. Helpers share that university's queue and
+dupefilter in Redis, so they simply take work from the same frontier.
+
+Usage: python orchestrator.py <universities.json> <config.json> [total_crawlers] [max_workers] [true|false|incremental]
+
+universities.json is a list of start URLs or of {"url": ...} objects.
+"""
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from start_crawlers import load_config, prepare_crawl, run_crawlers, university_settings
+from utils.general_utils import add_university_name
+from utils.redis_utils import crawl_frontier_size
+
+
+POLL_INTERVAL = 5
+
+
+def load_universities(path):
+    with open(path, "r") as f:
+        entries = json.load(f)
+    return [entry["url"] if isinstance(entry, dict) else entry for entry in entries]
+
+
+def allocate_crawlers(frontiers, budget, minimum=1):
+    """
+    Splits `budget` crawlers across universities in proportion to their
+    frontier size (+1, so empty frontiers still count), using the largest
+    remainder method. Every university gets at least `minimum` crawlers
+    while the budget allows.
+    """
+    if not frontiers:
+        return {}
+    names = list(frontiers)
+    allocation = {name: 0 for name in names}
+    # Largest frontiers first, so a small budget goes where the work is
+    names.sort(key=lambda name: frontiers[name], reverse=True)
+    for name in names:
+        if budget >= minimum:
+            allocation[name] = minimum
+            budget -= minimum
+    if budget <= 0:
+        return allocation
+
+    weights = {name: frontiers[name] + 1 for name in names}
+    total = sum(weights.values())
+    shares = {name: budget * weights[name] / total for name in names}
+    for name in names:
+        allocation[name] += int(shares[name])
+    leftover = budget - sum(int(share) for share in shares.values())
+    for name in sorted(names, key=lambda name: shares[name] - int(shares[name]), reverse=True)[:leftover]:
+        allocation[name] += 1
+    return allocation
+
+
+def crawl_worker(start_url, count, config_path, mode, overrides, first_id):
+    """Process entry point: one CrawlerProcess running `count` crawlers for one university."""
+    config = load_config(config_path)["settings"]
+    config.update(overrides)
+    if first_id == 1:
+        config = prepare_crawl(config, start_url, count, mode)
+    else:
+        # Helpers join a running crawl, so its queue and dupefilter must be left alone
+        config = university_settings(config, start_url, mode)
+    run_crawlers(config, count, first_id=first_id)
+
+
+class CrawlOrchestrator:
+
+    def __init__(self, start_urls, config_path, total_crawlers, max_workers, mode="true"):
+        self.config_path = config_path
+        self.settings = load_config(config_path)["settings"]
+        self.redis_url = self.settings["REDIS_URL"]
+        self.total_crawlers = total_crawlers
+        self.max_workers = max_workers
+        self.mode = mode
+        self.log_dir = self.settings.get("ORCHESTRATOR_LOG_DIR", "logs")
+        self.max_idle_time = self.settings.get("MAX_IDLE_TIME_BEFORE_CLOSE") or 60
+
+        self.start_urls = {}
+        for start_url in start_urls:
+            name = add_university_name({}, start_url)["UNIVERSITY_NAME"]
+            self.start_urls[name] = start_url
+        self.pending = list(self.start_urls)
+        self.started = set()
+        # name -> list of (process, crawler count)
+        self.running = {}
+        self.next_crawler_id = {}
+        # process -> worker slot, which offsets the worker's Prometheus port from TELEMETRY_PROMETHEUS_PORT
+        self.slots = {}
+        self.context = multiprocessing.get_context("spawn")
+
+    def free_crawlers(self):
+        return self.total_crawlers - sum(count for workers in self.running.values() for _, count in workers)
+
+    def worker_count(self):
+        return sum(len(workers) for workers in self.running.values())
+
+    def frontiers(self, names):
+        return {name: crawl_frontier_size(self.redis_url, name) for name in names}
+
+    def launch(self, name, count):
+        first_id = self.next_crawler_id.get(name, 1)
+        self.next_crawler_id[name] = first_id + count
+        overrides = {
+            # Each process logs to its own file instead of interleaving on stdout
+            "LOG_FILE": os.path.join(self.log_dir, f"{name}.log"),
+            # Without this a RedisSpider idles forever and the worker never frees its crawlers
+            "MAX_IDLE_TIME_BEFORE_CLOSE": self.max_idle_time,
+            # Per-process pools (e.g. DataCleaningPipeline's extraction workers) share the CPUs between workers
+            "CRAWL_PROCESSES": self.max_workers,
+        }
+        slot = min(set(range(self.max_workers)) - set(self.slots.values()))
+        base_port = int(self.settings.get("TELEMETRY_PROMETHEUS_PORT") or 0)
+        if base_port:
+            # Only one process can bind a port, so each worker serves its crawlers' metrics on its own
+            overrides["TELEMETRY_PROMETHEUS_PORT"] = base_port + slot
+        process = self.context.Process(
+            target=crawl_worker,
+            args=(self.start_urls[name], count, self.config_path, self.mode, overrides, first_id),
+            name=f"crawl-{name}-{first_id}",
+        )
+        process.start()
+        self.slots[process] = slot
+        self.running.setdefault(name, []).append((process, count))
+        role = "Starting" if first_id == 1 else "Adding helper to"
+        print(f"{role} {name}: {count} crawlers (#{first_id}-#{first_id + count - 1}), pid {process.pid}")
+
+    def reap(self):
+        for name in list(self.running):
+            alive = []
+            for process, count in self.running[name]:
+                if process.is_alive():
+                    alive.append((process, count))
+                else:
+                    process.join()
+                    self.slots.pop(process, None)
+                    print(f"Worker {process.name} exited with code {process.exitcode}, freed {count} crawlers")
+            if alive:
+                self.running[name] = alive
+            else:
+                del self.running[name]
+                print(f"Finished {name}")
+
+    def start_pending(self):
+        slots = min(self.max_workers - self.worker_count(), len(self.pending))
+        free = self.free_crawlers()
+        if slots <= 0 or free <= 0:
+            return
+        batch = self.pending[:min(slots, free)]
+        # Resumed crawls already have a frontier; fresh ones are split evenly
+        frontiers = self.frontiers(batch) if self.mode == "false" else {name: 0 for name in batch}
+        budget = free
+        if len(self.pending) > len(batch):
+            # Keep a share of the budget back for universities still waiting for a worker slot
+            budget = max(len(batch), free * len(batch) // len(self.pending))
+        allocation = allocate_crawlers(frontiers, budget)
+        for name in batch:
+            if allocation[name] <= 0:
+                continue
+            self.pending.remove(name)
+            self.started.add(name)
+            self.launch(name, allocation[name])
+
+    def add_helpers(self):
+        free = self.free_crawlers()
+        if self.pending or free <= 0 or self.worker_count() >= self.max_workers or not self.running:
+            return
+        frontiers = self.frontiers(self.running)
+        targets = allocate_crawlers(frontiers, self.total_crawlers)
+        deficits = {
+            name: targets[name] - sum(count for _, count in self.running[name])
+            for name in self.running
+            if frontiers[name] > 0
+        }
+        if not deficits:
+            return
+        name = max(deficits, key=deficits.get)
+        if deficits[name] > 0:
+            self.launch(name, min(deficits[name], free))
+
+    def run(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        print(f"Orchestrating {len(self.pending)} universities with {self.total_crawlers} crawlers in up to {self.max_workers} workers")
+        while self.pending or self.running:
+            self.reap()
+            self.start_pending()
+            self.add_helpers()
+            time.sleep(POLL_INTERVAL)
+        print(f"All {len(self.started)} university crawls finished")
+
+    def stop(self):
+        for workers in self.running.values():
+            for process, _ in workers:
+                process.terminate()
+        for workers in self.running.values():
+            for process, _ in workers:
+                process.join()
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python orchestrator.py <universities.json> <config.json> [total_crawlers] [max_workers] [true|false|incremental]")
+        return
+
+    start_urls = load_universities(sys.argv[1])
+    config_path = sys.argv[2]
+    total_crawlers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count() * 2
+    max_workers = int(sys.argv[4]) if len(sys.argv) > 4 else os.cpu_count()
+    mode = sys.argv[5].lower() if len(sys.argv) > 5 else "true"
+
+    orchestrator = CrawlOrchestrator(start_urls, config_path, total_crawlers, max_workers, mode)
+    try:
+        orchestrator.run()
+    except KeyboardInterrupt:
+        print("Stopping crawls...")
+        orchestrator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,79 @@
-from trafilatura import extract
+import os
+
+from scrapy.crawler import Crawler
+from scrapy.exceptions import DropItem
+from scrapy.settings import Settings
+from twisted.internet import threads
+
+from extensions.telemetry import timed_stage
+from utils.extraction_pool import ExtractionPool, ExtractionTimeout
+
 
 class DataCleaningPipeline:
+    def __init__(self, settings: Settings, stats=None):
+        self.stats = stats
+        self.max_html_bytes = settings.getint('DATA_CLEANING_MAX_HTML_BYTES', 5_000_000)
+        # Raw HTML isn't needed once text is extracted, so don't carry it through the rest of the pipelines
+        self.compact_items = settings.getbool('COMPACT_ITEMS', True)
+        # Section chunking needs the page's heading structure, which only the extraction sees
+        self.with_sections = settings.get('CHUNKING_STRATEGY', 'sections') == 'sections'
+        # Extraction is CPU bound, so it runs in worker processes shared by every crawler in this process.
+        # By default the CPUs are split between the crawl processes on the machine (set by the orchestrator).
+        self.pool = ExtractionPool.acquire(
+            size = settings.getint('DATA_CLEANING_WORKERS', 0)
+                or max(1, (os.cpu_count() or 1) // max(1, settings.getint('CRAWL_PROCESSES', 1))),
+            timeout = settings.getfloat('DATA_CLEANING_TIMEOUT', 20.0),
+            start_method = settings.get('DATA_CLEANING_START_METHOD', 'spawn'),
+        )
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler):
+        return cls(crawler.settings, crawler.stats)
+
+    def open_spider(self, spider):
+        # Spawning and warming the workers blocks, so keep it off the reactor thread
+        return threads.deferToThread(self.pool.start)
+
+    def close_spider(self, spider):
+        # The last release joins every worker process, which can take seconds
+        return threads.deferToThread(ExtractionPool.release)
+
+    @timed_stage
     def process_item(self, item, spider):
+        if item.get('deleted'):
+            return item
+
+        html = item['html'] or ""
+        size = len(html)
+        # A character is 1 to 4 bytes of UTF-8, so only pages near the limit need encoding to measure
+        if self.max_html_bytes < size * 4 and size <= self.max_html_bytes:
+            size = len(html.encode('utf-8'))
+        if size > self.max_html_bytes:
+            self._inc('cleaning/oversized')
+            raise DropItem(f"DataCleaningPipeline: HTML over {self.max_html_bytes} bytes for {item['url']}")
+
         # Extracts text from HTML using trafilatura
-        extracted_text = extract(item['html'])
-        item['text'] = extracted_text
+        d = self.pool.submit(html, self.with_sections)
+        d.addCallbacks(self._on_extracted, self._on_failed, callbackArgs=(item, spider), errbackArgs=(item, spider))
+        return d
+
+    def _on_extracted(self, extracted, item, spider):
+        item['text'], sections = extracted
+        if sections is not None:
+            item['sections'] = sections
+        if self.compact_items:
+            item.pop('html', None)
+            item.pop('links', None)
         spider.logger.info(f"DataCleaningPipeline: Text extracted for {item['url']}")
-        return item
\ No newline at end of file
+        return item
+
+    def _on_failed(self, failure, item, spider):
+        if failure.check(ExtractionTimeout):
+            self._inc('cleaning/timeouts')
+        else:
+            self._inc('cleaning/errors')
+        raise DropItem(f"DataCleaningPipeline: Extraction failed for {item['url']}: {failure.value}")
+
+    def _inc(self, key):
+        if self.stats is not None:
+            self.stats.inc_value(key)
@@ -6,50 +6,142 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 from langchain_core.documents import Document
 
+from extensions.telemetry import timed_stage
+from utils.chunking import chunk_sections
+from utils.embedding_batcher import EmbeddingBatcher
+from utils.embedding_cache import EmbeddingCache
+
 
 class EmbeddingPipeline:
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, stats=None):
         print("Starting EmbeddingPipeline")
-        self.embeddings = OllamaEmbeddings(model = 'mxbai-embed-large')
-        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size = 750, chunk_overlap = 150)   
+        self.stats = stats
+        self.model = settings.get('EMBEDDING_MODEL', 'mxbai-embed-large')
+        self.embeddings = OllamaEmbeddings(model = self.model)
+        # "sections" chunks along the page's headings (see utils/chunking.py); "characters" splits
+        # the flat text by length, and is also the fallback for pages extracted without sections
+        self.strategy = settings.get('CHUNKING_STRATEGY', 'sections')
+        self.max_tokens = settings.getint('EMBEDDING_CHUNK_MAX_TOKENS', 200)
+        self.min_tokens = settings.getint('EMBEDDING_CHUNK_MIN_TOKENS', 50)
+        # See the engine's retrieval/sweep.py for measuring other values
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size = settings.getint('EMBEDDING_CHUNK_SIZE', 750),
+            chunk_overlap = settings.getint('EMBEDDING_CHUNK_OVERLAP', 150),
+        )
+
+        # Boilerplate chunks (nav, footers, contact blocks) repeat across pages, crawls and universities
+        self.cache = None
+        if settings.getbool('EMBEDDING_CACHE_ENABLED', True):
+            self.cache = EmbeddingCache(
+                settings.get('EMBEDDING_CACHE_PATH', '../../embedding_cache.sqlite'),
+                self.model,
+                max_entries = settings.getint('EMBEDDING_CACHE_MAX_ENTRIES', 1_000_000),
+            )
+
+        # Chunks from many pages are embedded together off the reactor thread
+        self.batcher = EmbeddingBatcher(
+            self._embed_texts,
+            batch_size = settings.getint('EMBEDDING_BATCH_SIZE', 64),
+            max_delay = settings.getfloat('EMBEDDING_BATCH_MAX_DELAY', 0.25),
+            max_pending = settings.getint('EMBEDDING_MAX_PENDING_CHUNKS', 1024),
+            max_workers = settings.getint('EMBEDDING_WORKERS', 2),
+            stats = stats,
+        )
         print("EmbeddingPipeline initialized")
-        
+
     @classmethod
     def from_crawler(cls, crawler: Crawler):
         # Retrieve the settings object from the crawler
         settings = crawler.settings
-        
+
         # Instantiate the pipeline by passing the settings object
-        return cls(settings)
-    
-    
+        return cls(settings, crawler.stats)
+
+    def open_spider(self, spider):
+        self.batcher.start()
+
+    def close_spider(self, spider):
+        # Wait for chunks still queued or in flight before the spider closes
+        d = self.batcher.close()
+        d.addBoth(self._close_cache)
+        return d
+
+    def _close_cache(self, result):
+        if self.cache is not None:
+            self._report_cache_stats()
+            if self.stats is not None:
+                self.stats.set_value('embedding_cache/size_bytes', self.cache.size_bytes())
+            self.cache.close()
+        return result
+
+    def _embed_texts(self, texts):
+        # Runs on a batcher worker thread
+        if self.cache is None:
+            return self.embeddings.embed_documents(texts)
+        return self.cache.embed_with(self.embeddings.embed_documents, texts)
+
+    def _report_cache_stats(self):
+        if self.stats is None:
+            return
+        for key, value in self.cache.stats().items():
+            self.stats.set_value(f'embedding_cache/{key}', value)
+
     def make_document(self, item):
         content = f"Title: {item['title']}\n\nURL: {item['url']}\n\nContent: {item['text']}"
         metadata = {"url": item["url"], "title": item["title"], "source": "scrapy crawl cuboulder"}
         document = Document(page_content=content, metadata=metadata)
         return document
-    
+
     def embed_document(self, document):
         text_chunks = self.text_splitter.split_documents([document])
         texts = [chunk.page_content for chunk in text_chunks]
-        
-        embeddings = self.embeddings.embed_documents(texts)
-        return list(zip(text_chunks, embeddings))
-        
+
+        d = self.batcher.submit(texts)
+        d.addCallback(lambda embeddings: list(zip(text_chunks, embeddings)))
+        return d
+
+    def embed_sections(self, sections):
+        # The title, URL and heading path go in the chunk metadata, not the embedded text
+        chunks = chunk_sections(sections, self.max_tokens, self.min_tokens)
+        d = self.batcher.submit([chunk["text"] for chunk in chunks])
+        d.addCallback(lambda embeddings: [
+            {"text": chunk["text"], "embedding": emb, "headings": chunk["headings"]}
+            for chunk, emb in zip(chunks, embeddings)
+        ])
+        return d
+
     def process_page(self, item):
+        if self.strategy == 'sections' and item.get('sections'):
+            return self.embed_sections(item['sections'])
         document = self.make_document(item)
-        chunk_embeddings = self.embed_document(document)
+        d = self.embed_document(document)
+        d.addCallback(self._to_results)
+        return d
 
+    def _to_results(self, chunk_embeddings):
         results = []
         for chunk, emb in chunk_embeddings:
             results.append({
                 "text": chunk.page_content,
                 "embedding": emb
             })
-        
+
         return results
 
+    @timed_stage
     def process_item(self, item, spider):
+        if item.get('duplicate_of') or item.get('deleted'):
+            # Linked near-duplicates are already embedded under the original URL, deleted pages have no content
+            item['embeddings'] = []
+            return item
+
         spider.logger.info(f"EmbeddingPipeline: Processing item {item['url']}")
-        item['embeddings'] = self.process_page(item)
-        return item
\ No newline at end of file
+        d = self.process_page(item)
+        d.addCallback(self._attach_embeddings, item)
+        return d
+
+    def _attach_embeddings(self, results, item):
+        item['embeddings'] = results
+        if self.cache is not None:
+            self._report_cache_stats()
+        return item
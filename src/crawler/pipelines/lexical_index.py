@@ -0,0 +1,81 @@
+from scrapy.crawler import Crawler
+from scrapy.settings import Settings
+from twisted.internet import threads
+
+from extensions.telemetry import timed_stage
+from utils.chunking import HEADING_PATH_SEPARATOR
+from utils.lexical_index import LexicalIndexWriter, index_path
+from utils.write_buffer import WriteBehindBuffer
+
+
+class LexicalIndexPipeline:
+    """
+    Adds each item's chunks to the university's BM25 index, under the chunk
+    ids VectorStorePipeline gave them in Chroma. Must run after it.
+
+    Writes go through their own WriteBehindBuffer, so replaced and deleted
+    pages are removed from the index in the same way as from Chroma.
+    """
+
+    def __init__(self, settings: Settings, stats=None):
+        self.enabled = settings.getbool('LEXICAL_INDEX_ENABLED', True)
+        self.university_name = settings.get('UNIVERSITY_NAME')
+        self.path = index_path(settings.get('LEXICAL_INDEX_DIR', '../../lexical_index'), self.university_name)
+        self.index = None
+        self.buffer = None
+        if not self.enabled:
+            return
+        print("Starting LexicalIndexPipeline")
+        self.index = LexicalIndexWriter(self.path)
+        self.buffer = WriteBehindBuffer(
+            self.index.write_batch,
+            flush_size = settings.getint('VECTOR_STORE_FLUSH_CHUNKS', 512),
+            flush_interval = settings.getfloat('VECTOR_STORE_FLUSH_INTERVAL', 5.0),
+            max_retries = settings.getint('VECTOR_STORE_FLUSH_RETRIES', 3),
+            spill_path = settings.get('LEXICAL_INDEX_SPILL_PATH', f"output/{self.university_name}_lexical_unwritten.jsonl"),
+            stats = stats,
+            name = "lexical_index",
+        )
+        print("LexicalIndexPipeline initialized")
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler):
+        return cls(crawler.settings, crawler.stats)
+
+    def open_spider(self, spider):
+        if self.enabled:
+            self.buffer.start()
+
+    def close_spider(self, spider):
+        if not self.enabled:
+            return None
+        spider.logger.info(f"LexicalIndexPipeline: Flushing {len(self.buffer)} buffered chunks to {self.path}")
+        d = self.buffer.close()
+        d.addCallback(lambda _: threads.deferToThread(self.index.close))
+        d.addErrback(self._close_failed, spider)
+        return d
+
+    def _close_failed(self, failure, spider):
+        spider.logger.error(f"LexicalIndexPipeline: Failed to close {self.path}: {failure.getErrorMessage()}")
+        return failure
+
+    @timed_stage
+    def process_item(self, item, spider):
+        if not self.enabled:
+            return item
+        if item.get("deleted") or item.get("replace_existing"):
+            self.buffer.delete_url(item["url"])
+
+        chunk_ids = item.get("chunk_ids")
+        if not chunk_ids:
+            return item
+
+        self.buffer.add(
+            documents=[chunk["text"] for chunk in item["embeddings"]],
+            metadatas=[{"url": item["url"], "title": item.get("title", ""),
+                        "headings": HEADING_PATH_SEPARATOR.join(chunk.get("headings") or [])}
+                       for chunk in item["embeddings"]],
+            ids=chunk_ids,
+            embeddings=[None] * len(chunk_ids),
+        )
+        return item
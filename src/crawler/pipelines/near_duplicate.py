@@ -0,0 +1,150 @@
+import math
+
+from scrapy.crawler import Crawler
+from scrapy.exceptions import DropItem
+from scrapy.settings import Settings
+from scrapy_redis.connection import get_redis_from_settings
+from twisted.internet import threads
+
+from extensions.telemetry import timed_stage
+from utils.simhash import FINGERPRINT_BITS, bands, hamming_distance, simhash
+
+
+class NearDuplicatePipeline:
+    """
+    Drops (or links) pages whose extracted text is a near-duplicate of a page
+    already seen by any crawler of the same university.
+
+    Pages are fingerprinted with a shingle SimHash. The fingerprint is split
+    into bands that act as LSH buckets in Redis, so a lookup only compares
+    against pages that share at least one band. The lookup and the insert run
+    as one WATCH/MULTI transaction, so two crawlers can't both miss each
+    other's copy of a page. A recrawled URL's previous fingerprint is
+    replaced, and a deleted page's is removed. A recrawled page that has
+    become a near-duplicate is passed on as deleted rather than dropped, so
+    the stores remove its chunks from the earlier crawl.
+    """
+
+    def __init__(self, settings: Settings, stats=None):
+        self.stats = stats
+        self.enabled = settings.getbool('NEAR_DUPLICATE_ENABLED', True)
+        self.action = settings.get('NEAR_DUPLICATE_ACTION', 'drop')
+        self.shingle_size = settings.getint('NEAR_DUPLICATE_SHINGLE_SIZE', 4)
+        threshold = settings.getfloat('NEAR_DUPLICATE_THRESHOLD', 0.95)
+        self.max_distance = int((1 - threshold) * FINGERPRINT_BITS)
+        # One more band than the allowed distance guarantees near-duplicates share a bucket
+        self.band_count = self.max_distance + 1
+        if FINGERPRINT_BITS // self.band_count < 2:
+            # Bands of a bit or none put every page in the same few buckets
+            raise ValueError(f"NEAR_DUPLICATE_THRESHOLD {threshold} is too low: "
+                             f"{self.band_count} bands leave under 2 bits per band")
+        self.key = settings.get('NEAR_DUPLICATE_KEY') or f"university_spider_{settings.get('UNIVERSITY_NAME')}:simhash"
+        # Used to estimate the embedding calls saved by each skipped page
+        self.chunk_stride = settings.getint('NEAR_DUPLICATE_CHUNK_STRIDE', 600)
+        self.server = get_redis_from_settings(settings) if self.enabled else None
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler):
+        return cls(crawler.settings, crawler.stats)
+
+    @timed_stage
+    def process_item(self, item, spider):
+        if not self.enabled:
+            return item
+        if item.get('deleted'):
+            d = threads.deferToThread(self._forget, item['url'])
+            d.addCallback(lambda _: item)
+            return d
+        if not item.get('text'):
+            return item
+        d = threads.deferToThread(self._find_duplicate, item['url'], item['text'])
+        d.addCallback(self._handle_result, item, spider)
+        return d
+
+    def _bucket_keys(self, fingerprint):
+        return [f"{self.key}:{i}:{value}" for i, value in enumerate(bands(fingerprint, self.band_count))]
+
+    def _find_duplicate(self, url, text):
+        # Runs in a thread so Redis round trips don't block the reactor
+        fingerprint = simhash(text, self.shingle_size)
+        bucket_keys = self._bucket_keys(fingerprint)
+        fingerprints_key = f"{self.key}:fingerprints"
+
+        def check_and_add(pipe):
+            # Reads run immediately; redis-py retries the whole function if a watched key changes
+            candidates = set().union(*(pipe.smembers(bucket) for bucket in bucket_keys))
+            previous = pipe.hget(fingerprints_key, url)
+
+            best = None
+            for member in candidates:
+                other_fp, other_url = member.decode("utf-8").split("|", 1)
+                if other_url == url:
+                    continue
+                distance = hamming_distance(fingerprint, int(other_fp, 16))
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, other_url)
+
+            pipe.multi()
+            if previous is not None and (best is not None or int(previous, 16) != fingerprint):
+                self._remove(pipe, url, int(previous, 16))
+            if best is not None:
+                if self.action == 'link':
+                    pipe.hset(f"{self.key}:aliases", url, best[1])
+                return best
+
+            member = f"{fingerprint:016x}|{url}"
+            for bucket in bucket_keys:
+                pipe.sadd(bucket, member)
+            pipe.hset(fingerprints_key, url, f"{fingerprint:016x}")
+            pipe.hdel(f"{self.key}:aliases", url)
+            return None
+
+        return self.server.transaction(check_and_add, fingerprints_key, *bucket_keys, value_from_callable=True)
+
+    def _forget(self, url):
+        fingerprints_key = f"{self.key}:fingerprints"
+
+        def remove(pipe):
+            previous = pipe.hget(fingerprints_key, url)
+            pipe.multi()
+            if previous is not None:
+                self._remove(pipe, url, int(previous, 16))
+            pipe.hdel(f"{self.key}:aliases", url)
+
+        self.server.transaction(remove, fingerprints_key)
+
+    def _remove(self, pipe, url, fingerprint):
+        member = f"{fingerprint:016x}|{url}"
+        for bucket in self._bucket_keys(fingerprint):
+            pipe.srem(bucket, member)
+        pipe.hdel(f"{self.key}:fingerprints", url)
+
+    def _handle_result(self, duplicate, item, spider):
+        self._inc('near_duplicate/checked')
+        if duplicate is None:
+            return item
+
+        distance, original_url = duplicate
+        saved_chunks = math.ceil(len(item['text']) / self.chunk_stride)
+        self._inc('near_duplicate/embedding_chunks_saved', saved_chunks)
+
+        if item.get('replace_existing') and self.action != 'link':
+            # A changed page's chunks from the last crawl are stale, so pass it on as a deletion to remove them
+            self._inc('near_duplicate/removed')
+            item['deleted'] = True
+            spider.logger.info(f"NearDuplicatePipeline: {item['url']} is now a near-duplicate of {original_url} "
+                               f"(distance {distance}), removing its old chunks")
+            return item
+
+        if self.action == 'link':
+            self._inc('near_duplicate/linked')
+            item['duplicate_of'] = original_url
+            spider.logger.info(f"NearDuplicatePipeline: {item['url']} linked to {original_url} (distance {distance})")
+            return item
+
+        self._inc('near_duplicate/dropped')
+        raise DropItem(f"NearDuplicatePipeline: {item['url']} is a near-duplicate of {original_url} (distance {distance})")
+
+    def _inc(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(key, count)
@@ -4,45 +4,139 @@ from scrapy.settings import Settings
 from langchain_ollama.embeddings import OllamaEmbeddings
 from langchain_core.documents import Document
 import uuid
+from twisted.internet import threads
+
+from extensions.telemetry import timed_stage
+from utils.write_buffer import WriteBehindBuffer
+from utils.chunking import HEADING_PATH_SEPARATOR
+from utils.chroma_utils import bump_ingest_version
+from utils.quantized_index import QuantizedIndexWriter, index_dir
 
 class VectorStorePipeline:
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, stats=None):
         self.settings = settings
-        self.db_location = "../../chroma_langchain_db"
+        self.db_location = settings.get('CHROMA_DB_PATH', '../../chroma_langchain_db')
         self.university_name = settings.get('UNIVERSITY_NAME')
+        # "chroma", or "quantized" for the engine's memory-mapped int8/binary index (see utils/quantized_index.py)
+        self.backend = settings.get('VECTOR_STORE_BACKEND', 'chroma')
         print("Starting VectorStorePipeline")
-        self.vector_store = Chroma(collection_name = self.university_name, persist_directory = self.db_location, embedding_function=None)  
+        self.vector_store = None
+        self.index = None
+        if self.backend == "quantized":
+            self.index = QuantizedIndexWriter(
+                index_dir(settings.get('QUANTIZED_INDEX_DIR', '../../quantized_index'), self.university_name),
+                ivf_min_rows = settings.getint('QUANTIZED_INDEX_IVF_MIN_ROWS', 50_000),
+                ivf_lists = settings.getint('QUANTIZED_INDEX_IVF_LISTS', 0),
+            )
+        else:
+            self.vector_store = Chroma(collection_name = self.university_name, persist_directory = self.db_location, embedding_function=None)
+
+        # Records are buffered across items and written in large batches off the reactor thread
+        self.buffer = WriteBehindBuffer(
+            self._write_batch,
+            flush_size = settings.getint('VECTOR_STORE_FLUSH_CHUNKS', 512),
+            flush_interval = settings.getfloat('VECTOR_STORE_FLUSH_INTERVAL', 5.0),
+            max_retries = settings.getint('VECTOR_STORE_FLUSH_RETRIES', 3),
+            spill_path = settings.get('VECTOR_STORE_SPILL_PATH', f"output/{self.university_name}_unwritten.jsonl"),
+            stats = stats,
+        )
+        self.stats = stats
+        self.changed = False
         print("VectorStorePipeline initialized")
     @classmethod
     def from_crawler(cls, crawler: Crawler):
         # Retrieve the settings object from the crawler
         settings = crawler.settings
-        
+
         # Instantiate the pipeline by passing the settings object
-        return cls(settings)
-    
-    
-    
+        return cls(settings, crawler.stats)
+
+    def open_spider(self, spider):
+        self.buffer.start()
+
+    def close_spider(self, spider):
+        spider.logger.info(f"VectorStorePipeline: Flushing {len(self.buffer)} buffered embeddings to {self.university_name}")
+        d = self.buffer.close()
+        d.addCallback(lambda _: self._bump_version(spider) if self.changed else None)
+        if self.index is not None:
+            # Compacts deleted rows and retrains the IVF lists when due
+            d.addCallback(lambda _: threads.deferToThread(self.index.close))
+        d.addErrback(self._close_failed, spider)
+        return d
+
+    def _close_failed(self, failure, spider):
+        spider.logger.error(f"VectorStorePipeline: Failed to close {self.university_name}: {failure.getErrorMessage()}")
+        return failure
+
+    def _bump_version(self, spider):
+        # Tells the engine's semantic cache that answers cached before this crawl may be stale
+        if self.index is not None:
+            d = threads.deferToThread(self.index.bump_ingest_version)
+        else:
+            d = threads.deferToThread(bump_ingest_version, self.vector_store._collection)
+
+        def bumped(version):
+            spider.logger.info(f"VectorStorePipeline: Ingest version of {self.university_name} is now {version}")
+            if self.stats:
+                self.stats.set_value("vector_store/ingest_version", version)
+
+        def failed(failure):
+            spider.logger.error(f"VectorStorePipeline: Could not bump ingest version: {failure.getErrorMessage()}")
+
+        d.addCallbacks(bumped, failed)
+        return d
+
+    def _write_batch(self, batch):
+        # Runs on the writer thread. Upsert keeps retries of a partially written batch idempotent.
+        self.changed = True
+        if self.index is not None:
+            self.index.write_batch(batch)
+            return
+        collection = self.vector_store._collection
+        if batch["delete_urls"]:
+            collection.delete(where={"url": {"$in": batch["delete_urls"]}})
+        max_batch = collection._client.get_max_batch_size()
+        for start in range(0, len(batch["ids"]), max_batch):
+            end = start + max_batch
+            collection.upsert(
+                documents=batch["documents"][start:end],
+                metadatas=batch["metadatas"][start:end],
+                ids=batch["ids"][start:end],
+                embeddings=batch["embeddings"][start:end]
+            )
+
+    @timed_stage
     def process_item(self, item, spider):
+        if item.get("deleted") or item.get("replace_existing"):
+            # Old chunks are deleted in the same flush, before any new chunks for the URL are written
+            self.buffer.delete_url(item["url"])
+            spider.logger.info(f"VectorStorePipeline: Replacing chunks for {item['url']}")
+
+        if not item["embeddings"]:
+            return item
+
         spider.logger.info(f"VectorStorePipeline: Storing data for {item['url']}")
-        
+
         texts = [chunk["text"] for chunk in item["embeddings"]]
         embeddings = [chunk["embedding"] for chunk in item["embeddings"]]
         metadatas = [
-            {"url": item["url"], 
-             "title": item.get("title", ""), 
-             "source": "university_scraper"} 
-            for _ in item["embeddings"]
+            {"url": item["url"],
+             "title": item.get("title", ""),
+             "source": "university_scraper",
+             "headings": HEADING_PATH_SEPARATOR.join(chunk.get("headings") or [])}
+            for chunk in item["embeddings"]
         ]
         ids = [str(uuid.uuid4()) for _ in item["embeddings"]]
-        
+        # Lets later stores (the lexical index) reuse the Chroma ids
+        item["chunk_ids"] = ids
+
         # Use underlying collection directly to pass pre-computed embeddings
-        self.vector_store._collection.add(
+        self.buffer.add(
             documents=texts,
             metadatas=metadatas,
             ids=ids,
             embeddings=embeddings
         )
-        spider.logger.info(f"VectorStorePipeline: Added {len(item['embeddings'])} embeddings to {self.university_name}")
+        spider.logger.info(f"VectorStorePipeline: Buffered {len(item['embeddings'])} embeddings for {self.university_name}")
         return item
-    
\ No newline at end of file
+
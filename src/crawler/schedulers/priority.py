@@ -0,0 +1,218 @@
+import json
+import logging
+import re
+import time
+from urllib.parse import urlparse
+
+from scrapy import signals
+from scrapy_redis.scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+def url_group(url):
+    """Groups similar URLs by host and their first two path segments, with numbers collapsed."""
+    parsed = urlparse(url)
+    segments = [s for s in parsed.path.split("/") if s][:2]
+    return "/".join([parsed.netloc] + [re.sub(r"\d+", "#", s) for s in segments])
+
+
+class UrlScorer:
+    """
+    Scores a request by how likely it is to lead to useful content:
+    matching path rules and anchor-text rules add their weights, depth is
+    penalised, and URL groups that already produced useful pages (see
+    `url_group`) get a bonus while groups that produced none are penalised.
+
+    Yield counts are shared in Redis (`<prefix>:url_yield`) by every crawler
+    of the university and cached locally between refreshes.
+    """
+
+    def __init__(self, server, key, rules, depth_weight=3.0, anchor_weight=0.5, yield_weight=30.0, refresh_every=200):
+        self.server = server
+        self.key = key
+        self.rules = [(re.compile(rule["pattern"], re.IGNORECASE), rule["weight"]) for rule in rules]
+        self.depth_weight = depth_weight
+        self.anchor_weight = anchor_weight
+        self.yield_weight = yield_weight
+        self.refresh_every = refresh_every
+        self._yields = {}
+        self._scored_since_refresh = refresh_every
+
+    @classmethod
+    def from_settings(cls, settings, server):
+        university = settings.get("UNIVERSITY_NAME")
+        configured = settings.getdict("URL_PRIORITY_RULES")
+        # The rules live in the crawler config only; without them scoring falls back to depth and yield
+        if "default" not in configured:
+            logger.warning("URL_PRIORITY_RULES has no \"default\" rules, scoring URLs by depth and yield only")
+        # Per-university rules are applied on top of the defaults
+        rules = list(configured.get("default", [])) + list(configured.get(university, []))
+        return cls(
+            server,
+            f"university_spider_{university}:url_yield",
+            rules,
+            depth_weight=settings.getfloat("URL_PRIORITY_DEPTH_WEIGHT", 3.0),
+            anchor_weight=settings.getfloat("URL_PRIORITY_ANCHOR_WEIGHT", 0.5),
+            yield_weight=settings.getfloat("URL_PRIORITY_YIELD_WEIGHT", 30.0),
+        )
+
+    def _rule_score(self, text):
+        return sum(weight for pattern, weight in self.rules if pattern.search(text))
+
+    def _refresh(self):
+        counts = self.server.hgetall(self.key)
+        yields = {}
+        for field, value in counts.items():
+            group, _, kind = field.decode().rpartition("|")
+            yields.setdefault(group, [0, 0])[kind == "useful"] = int(value)
+        self._yields = yields
+        self._scored_since_refresh = 0
+
+    def yield_rate(self, group):
+        requests, useful = self._yields.get(group, (0, 0))
+        # Laplace smoothing: unseen groups sit at 0.5 and move as evidence builds up
+        return (useful + 1) / (requests + 2)
+
+    def score(self, request):
+        self._scored_since_refresh += 1
+        if self._scored_since_refresh >= self.refresh_every:
+            self._refresh()
+
+        parsed = urlparse(request.url)
+        path = parsed.path + ("?" + parsed.query if parsed.query else "")
+        score = self._rule_score(path)
+        anchor = request.meta.get("link_text")
+        if anchor:
+            score += self.anchor_weight * self._rule_score(anchor)
+        score -= self.depth_weight * request.meta.get("depth", 0)
+        score += self.yield_weight * (self.yield_rate(url_group(request.url)) - 0.5)
+        return score
+
+    def record(self, url, useful):
+        self.server.hincrby(self.key, f"{url_group(url)}|{'useful' if useful else 'requests'}", 1)
+
+
+class ValueAwareScheduler(Scheduler):
+    """
+    scrapy_redis scheduler that orders the shared frontier by UrlScorer
+    instead of discovery order, so the CLOSESPIDER_ITEMCOUNT budget goes to
+    admissions, programs and policies before calendars and news archives.
+
+    With URL_PRIORITY_ENABLED off it keeps the configured (FIFO) queue and
+    only tracks yield, which gives a BFS run to compare against.
+
+    Every 100 responses it logs how many useful pages (scraped items with at
+    least URL_PRIORITY_USEFUL_MIN_CHARS of text) were reached. On close the
+    run is stored in `<prefix>:frontier_runs` and compared with the last
+    stored run of the other strategy. That run is historical, not a
+    controlled one: the site, the rules and the yield counts it started from
+    may all have changed since.
+
+    Switching strategies needs a fresh crawl: the priority queue is a sorted
+    set and the FIFO queue a list under the same key.
+    """
+
+    REPORT_EVERY = 100
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.enabled = True
+        self.useful_min_chars = 500
+        self.scorer = None
+        self.runs_key = None
+        self.responses = 0
+        self.useful = 0
+        self.curve = []
+
+    @classmethod
+    def from_settings(cls, settings):
+        instance = super().from_settings(settings)
+        instance.enabled = settings.getbool("URL_PRIORITY_ENABLED", True)
+        instance.useful_min_chars = settings.getint("URL_PRIORITY_USEFUL_MIN_CHARS", 500)
+        if instance.enabled:
+            instance.queue_cls = "scrapy_redis.queue.PriorityQueue"
+        instance.scorer = UrlScorer.from_settings(settings, instance.server)
+        instance.runs_key = f"university_spider_{settings.get('UNIVERSITY_NAME')}:frontier_runs"
+        return instance
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        instance = super().from_crawler(crawler)
+        crawler.signals.connect(instance.response_received, signal=signals.response_received)
+        crawler.signals.connect(instance.item_scraped, signal=signals.item_scraped)
+        return instance
+
+    @property
+    def strategy(self):
+        return "priority" if self.enabled else "fifo"
+
+    def enqueue_request(self, request):
+        if self.enabled:
+            # Request priorities must be ints; one point of score is fine-grained enough
+            request.priority = int(round(self.scorer.score(request)))
+        return super().enqueue_request(request)
+
+    def response_received(self, response, request, spider):
+        if response.status != 200 or response.url.endswith("/robots.txt"):
+            return
+        self.scorer.record(response.url, useful=False)
+        self.responses += 1
+        if self.responses % self.REPORT_EVERY == 0:
+            previous = self.curve[-1] if self.curve else 0
+            self.curve.append(self.useful)
+            logger.info(
+                f"Frontier ({self.strategy}): {self.useful - previous} useful pages in the last "
+                f"{self.REPORT_EVERY} requests, {self.useful}/{self.responses} overall"
+            )
+            if self.stats:
+                self.stats.set_value("frontier/useful_per_100", self.useful - previous, spider=self.spider)
+
+    def item_scraped(self, item, response, spider):
+        if item.get("deleted") or item.get("duplicate_of"):
+            return
+        if len(item.get("text") or "") < self.useful_min_chars:
+            return
+        self.scorer.record(item["url"], useful=True)
+        self.useful += 1
+        if self.stats:
+            self.stats.inc_value("frontier/useful_pages", spider=self.spider)
+
+    def close(self, reason):
+        self.record_run()
+        return super().close(reason)
+
+    def record_run(self):
+        if not self.responses:
+            return
+        run = {
+            "strategy": self.strategy,
+            "spider": self.spider.name,
+            "finished": int(time.time()),
+            "requests": self.responses,
+            "useful": self.useful,
+            "useful_per_100": self.curve,
+        }
+        self.server.lpush(self.runs_key, json.dumps(run))
+        self.server.ltrim(self.runs_key, 0, 99)
+        logger.info(f"Frontier ({self.strategy}): reached {self.useful} useful pages in {self.responses} requests")
+
+        baseline = self.last_run("fifo" if self.enabled else "priority")
+        if baseline is None:
+            return
+        # Compare cumulative useful pages at the same request count
+        points = min(len(self.curve), len(baseline["useful_per_100"]))
+        if points:
+            requests = points * self.REPORT_EVERY
+            finished = time.strftime("%Y-%m-%d %H:%M", time.localtime(baseline["finished"]))
+            logger.info(
+                f"Frontier: after {requests} requests {self.strategy} reached {self.curve[points - 1]} useful pages, "
+                f"{baseline['strategy']} reached {baseline['useful_per_100'][points - 1]} in a historical run "
+                f"({baseline['spider']}, finished {finished}), not a controlled comparison"
+            )
+
+    def last_run(self, strategy):
+        for raw in self.server.lrange(self.runs_key, 0, -1):
+            run = json.loads(raw)
+            if run["strategy"] == strategy:
+                return run
+        return None
@@ -5,6 +5,8 @@ from scrapy.utils.url import canonicalize_url
 import scrapy
 from scrapy.settings import Settings
 
+from utils.page_state import LINKS_TTL, PageStateStore
+
 class UniversitySpider(RedisSpider):
     name = f"university_spider"
     redis_key = "university_spider:start_urls"
@@ -34,6 +36,8 @@ class UniversitySpider(RedisSpider):
         obj.crawler = crawler
         # Call setup_redis explicitly to ensure mixin initialization
         obj.setup_redis(crawler)
+        obj.page_state = PageStateStore(obj.server, settings.get('UNIVERSITY_NAME'),
+                                        settings.getint('PAGE_LINKS_TTL', LINKS_TTL))
         return obj
     
     def __init__(self, settings=None, *args, **kwargs):
@@ -62,6 +66,12 @@ class UniversitySpider(RedisSpider):
             self.logger.info(f"DupeFilter Key: {self.settings.get('SCHEDULER_DUPEFILTER_KEY')}")
             self.logger.info(f"Allowed Domains: {self.allowed_domains}")
 
+        # Incremental crawls need to see 304s (unchanged) and 404/410s (deleted pages)
+        self.incremental = bool(self.settings and self.settings.getbool('INCREMENTAL_CRAWL'))
+        if self.incremental:
+            self.handle_httpstatus_list = [304, 404, 410]
+        self.page_state = None
+
         # Initialize LinkExtractor with the specific allowed_domains for this instance
         self.link_extractor = LinkExtractor(
             allow_domains=self.allowed_domains,
@@ -77,6 +87,17 @@ class UniversitySpider(RedisSpider):
         url = response.url
         self.logger.info(f"[Parse] Parsing URL: {url}")
 
+        if response.status == 304:
+            # Unchanged since the last crawl: nothing to re-embed, but keep expanding the frontier
+            self.crawler.stats.inc_value('incremental/not_modified')
+            yield from self.follow_links(response, self.page_state.get_links(url))
+            return
+
+        if response.status in (404, 410):
+            self.logger.info(f"[Parse] Page removed: {url}")
+            yield {'url': url, 'deleted': True}
+            return
+
         # --------- SET DOMAIN RESTRICTION ON FIRST REQUEST ----------
         # (This acts as a fallback if allowed_domains wasn't passed correctly, 
         # but also handles the case where we want to restrict based on the start URL's redirect)
@@ -99,36 +120,55 @@ class UniversitySpider(RedisSpider):
             page_data = {
                 'url': response.url,
                 'title': response.css('title::text').get(),
-                'links': response.css('a::attr(href)').getall(),
                 'html': response.text,
+                # Validators for conditional requests on the next crawl
+                'etag': response.headers.get('ETag', b'').decode('latin-1') or None,
+                'last_modified': response.headers.get('Last-Modified', b'').decode('latin-1') or None,
             }
+            if not self.settings.getbool('COMPACT_ITEMS', True):
+                page_data['links'] = response.css('a::attr(href)').getall()
         except Exception as e:
             self.logger.error(f"[Parse] Error parsing page: {e}")
             return
         
         yield page_data
 
+        # Extract and follow links
+        extracted = self.link_extractor.extract_links(response)
+        links = [link.url for link in extracted]
+        self.logger.info(f"[Parse] Found {len(links)} links on {url}")
+        # Remembered so an unchanged (304) page can still be expanded next incremental crawl
+        if self.incremental:
+            self.page_state.set_links(url, links)
+
+        # Anchor text feeds the frontier scoring in schedulers.priority
+        anchors = {link.url: link.text.strip() for link in extracted if link.text}
+        yield from self.follow_links(response, links, anchors)
+
+    def follow_links(self, response, links, anchors=None):
+        url = response.url
+
         # ---------- Stop if depth exceeded ----------
         if response.meta.get('depth', 0) >= response.meta.get('max_depth', 10):
             self.logger.info(f"Depth exceeded: {response.url}")
             return
-        
-        # Extract and follow links
-        links = self.link_extractor.extract_links(response)
-        self.logger.info(f"[Parse] Found {len(links)} links on {url}")
-        
-        for link in links:
+
+        for link_url in links:
             # Normalize URLs for comparison to catch all self-referential variants
             # (e.g., with/without trailing slash, query params, etc.)
             canonical_current = canonicalize_url(url)
-            canonical_link = canonicalize_url(link.url)
+            canonical_link = canonicalize_url(link_url)
             
             if canonical_link == canonical_current:
-                self.logger.debug(f"[Parse] Skipping self-referential link: {link.url}")
+                self.logger.debug(f"[Parse] Skipping self-referential link: {link_url}")
                 continue
                  
             yield scrapy.Request(
-                link.url,
+                link_url,
                 callback=self.parse,
-                meta={"depth": response.meta.get("depth", 0) + 1, "max_depth": response.meta.get("max_depth", 10)}
+                meta={
+                    "depth": response.meta.get("depth", 0) + 1,
+                    "max_depth": response.meta.get("max_depth", 10),
+                    "link_text": (anchors or {}).get(link_url),
+                }
             )
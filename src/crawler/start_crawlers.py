@@ -6,9 +6,10 @@ from scrapy.exceptions import ScrapyDeprecationWarning
 from urllib.parse import urlparse
 from scrapy.crawler import CrawlerProcess
 from spiders.university_spider import UniversitySpider
-from utils.redis_utils import clear_redis, add_to_redis
+from utils.redis_utils import clear_university, clear_crawl_queues, add_to_redis
 from utils.general_utils import add_university_name
 from utils.chroma_utils import clear_chroma_db
+from dupefilters.sqlite import SQLiteFingerprintStore
 
 # Suppress Scrapy deprecation warnings from scrapy-redis
 warnings.filterwarnings("ignore", category=ScrapyDeprecationWarning)
@@ -18,58 +19,97 @@ warnings.filterwarnings("ignore", category=ScrapyDeprecationWarning)
 def load_config(path):
     with open(path, "r") as f:
         return json.load(f)
-    
 
-def main():
-    if len(sys.argv) < 4:
-        print("Usage: python create_crawlers.py <start_url> <count> <config.json> <test_mode>")
-        return
 
-    start_url = sys.argv[1]
-    count = int(sys.argv[2])
-    config_path = sys.argv[3]
-    #test_mode = sys.argv[4]
+def clear_local_dupefilter(config):
+    # The SQLite dupefilter lives outside Redis, so clearing Redis doesn't reset it
+    if config.get("DUPEFILTER_BACKEND") != "sqlite":
+        return
+    store = SQLiteFingerprintStore(config["DUPEFILTER_SQLITE_PATH"], config["SCHEDULER_DUPEFILTER_KEY"])
+    store.clear()
+    store.close()
+    
 
-    config = load_config(config_path)
-    config = config["settings"]
+def university_settings(config, start_url, mode="true"):
+    """Fills in the settings that scope a crawl to one university's domain and Redis keys."""
     config = add_university_name(config, start_url)
+    config["ALLOWED_DOMAINS"] = start_url.split("/")[2]
+    
+    # FIX CONFIG FOR REDIS KEYS
+    config["SCHEDULER_QUEUE_KEY"] = f"university_spider_{config['UNIVERSITY_NAME']}:requests"
+    config["SCHEDULER_DUPEFILTER_KEY"] = f"university_spider_{config['UNIVERSITY_NAME']}:dupefilter"    
+
+    if mode == "incremental":
+        config["INCREMENTAL_CRAWL"] = True
+    return config
+
+
+def prepare_crawl(config, start_url, count, mode="true"):
+    """
+    Fills in the per-university settings and resets that university's crawl
+    state in Redis for the given mode. Other universities' keys are never touched.
+    """
+    config = university_settings(config, start_url, mode)
     
     # Check for test mode/clear cache (default to clearing Redis for fresh starts)
     # Pass "false" as 4th argument to resume a previous crawl
-    should_clear = len(sys.argv) <= 4 or sys.argv[4].lower() != "false"
+    # Pass "incremental" to re-crawl, only re-embedding pages that changed since the last crawl
+    should_clear = mode not in ("false", "incremental")
     
-    if should_clear:
-        print("Clearing Redis for fresh start...")
-        clear_redis(config["REDIS_URL"])
+    if mode == "incremental":
+        print("Incremental re-crawl: keeping page state, clearing queues...")
+        clear_crawl_queues(config["REDIS_URL"], config["UNIVERSITY_NAME"])
+    elif should_clear:
+        print(f"Clearing Redis keys for {config['UNIVERSITY_NAME']} for fresh start...")
+        clear_university(config["REDIS_URL"], config["UNIVERSITY_NAME"])
         #clear_chroma_db("chroma_langchain_db/")
     
+    if mode != "false":
+        clear_local_dupefilter(config)
+
     add_to_redis(start_url, config["REDIS_URL"], count, config["UNIVERSITY_NAME"])
 
-    
+    return config
 
 
-    config["ALLOWED_DOMAINS"] = start_url.split("/")[2]
-    
-    # FIX CONFIG FOR REDIS KEYS
-    config["SCHEDULER_QUEUE_KEY"] = f"university_spider_{config['UNIVERSITY_NAME']}:requests"
-    config["SCHEDULER_DUPEFILTER_KEY"] = f"university_spider_{config['UNIVERSITY_NAME']}:dupefilter"    
-    
-    
-
-    # Run N concurrent crawlers
+def run_crawlers(config, count, first_id=1):
+    # Run N concurrent crawlers. Crawler IDs only need to be unique per university,
+    # so extra processes joining a running crawl start after the existing IDs
     process = CrawlerProcess(settings=config)
     
     print(process.settings.get("LOG_LEVEL"))
     
     crawlers = []
 
-    for i in range(count):
-        print(f"Launching crawler #{i+1}")
-        crawler = process.crawl(UniversitySpider, crawler_id=i+1, name=config["UNIVERSITY_NAME"], allowed_domains=[config["ALLOWED_DOMAINS"]])
+    for crawler_id in range(first_id, first_id + count):
+        print(f"Launching crawler #{crawler_id}")
+        crawler = process.crawl(UniversitySpider, crawler_id=crawler_id, name=config["UNIVERSITY_NAME"], allowed_domains=[config["ALLOWED_DOMAINS"]])
         crawlers.append(crawler)
 
     process.start()
 
 
+def crawl_university(start_url, count, config_path, mode="true", overrides=None):
+    config = load_config(config_path)
+    config = config["settings"]
+    config.update(overrides or {})
+    config = prepare_crawl(config, start_url, count, mode)
+    run_crawlers(config, count)
+
+
+def main():
+    if len(sys.argv) < 4:
+        print("Usage: python create_crawlers.py <start_url> <count> <config.json> <test_mode|false|incremental>")
+        return
+
+    start_url = sys.argv[1]
+    count = int(sys.argv[2])
+    config_path = sys.argv[3]
+    #test_mode = sys.argv[4]
+    mode = sys.argv[4].lower() if len(sys.argv) > 4 else "true"
+
+    crawl_university(start_url, count, config_path, mode)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,83 @@
+from lxml import etree
+
+from utils.chunking import chunk_sections, count_tokens, sections_from_xml
+
+BODY = """<body>
+<head rend="h1">Admissions</head>
+<head rend="h2">Undergraduate</head>
+<p>Apply by January 15.</p>
+<list><item>Transcript</item><item>Essay</item></list>
+<head rend="h2">Graduate</head>
+<table><row><cell>Program</cell><cell>Deadline</cell></row><row><cell>MS</cell><cell>March 1</cell></row></table>
+<head rend="h1">Tuition</head>
+<p>  </p>
+<p>Fees are   listed per term.</p>
+</body>"""
+
+
+def test_sections_from_xml():
+    sections = sections_from_xml(etree.fromstring(BODY))
+    # A heading with no text directly under it only appears in its subsections' paths
+    assert [section["headings"] for section in sections] == [
+        ["Admissions", "Undergraduate"],
+        ["Admissions", "Graduate"],
+        ["Tuition"],
+    ]
+    assert sections[0]["blocks"] == ["Apply by January 15.", "- Transcript\n- Essay"]
+    assert sections[1]["blocks"] == ["Program | Deadline\nMS | March 1"]
+    # Empty paragraphs are skipped and whitespace is collapsed
+    assert sections[2]["blocks"] == ["Fees are listed per term."]
+
+
+def test_sections_keep_their_headings():
+    chunks = chunk_sections(sections_from_xml(etree.fromstring(BODY)), max_tokens=200, min_tokens=0)
+    assert chunks == [
+        {"text": "Apply by January 15.\n\n- Transcript\n- Essay", "headings": ["Admissions", "Undergraduate"]},
+        {"text": "Program | Deadline\nMS | March 1", "headings": ["Admissions", "Graduate"]},
+        {"text": "Fees are listed per term.", "headings": ["Tuition"]},
+    ]
+
+
+def test_small_sections_merge():
+    sections = sections_from_xml(etree.fromstring(BODY))
+    chunks = chunk_sections(sections[:2], max_tokens=200, min_tokens=50)
+    # The shared chunk keeps the common heading prefix; the rest of each path becomes a line of text
+    assert chunks == [{
+        "text": "Undergraduate\n\nApply by January 15.\n\n- Transcript\n- Essay\n\nGraduate\n\nProgram | Deadline\nMS | March 1",
+        "headings": ["Admissions"],
+    }]
+
+    chunks = chunk_sections(sections, max_tokens=200, min_tokens=50)
+    assert len(chunks) == 1 and chunks[0]["headings"] == []
+    assert chunks[0]["text"].startswith("Admissions\n\nUndergraduate\n\n")
+
+    # Sections that don't fit together stay apart, however small
+    chunks = chunk_sections(sections, max_tokens=12, min_tokens=50)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk["text"]) <= 12 for chunk in chunks)
+
+
+def test_oversized_blocks_split():
+    sentences = [f"Sentence number {i} is about tuition and fees." for i in range(30)]
+    words = " ".join(f"word{i}" for i in range(100))
+    sections = [
+        {"headings": ["Costs"], "blocks": [" ".join(sentences)]},
+        {"headings": ["Glossary"], "blocks": [words]},
+    ]
+    chunks = chunk_sections(sections, max_tokens=40, min_tokens=0)
+    assert all(count_tokens(chunk["text"]) <= 40 for chunk in chunks)
+
+    costs = [chunk for chunk in chunks if chunk["headings"] == ["Costs"]]
+    glossary = [chunk for chunk in chunks if chunk["headings"] == ["Glossary"]]
+    assert len(costs) > 1 and len(glossary) > 1
+    # Split at sentence boundaries where possible, at words otherwise, with nothing lost or repeated
+    assert all(chunk["text"].endswith(".") for chunk in costs)
+    assert " ".join(chunk["text"] for chunk in costs).split() == " ".join(sentences).split()
+    assert " ".join(chunk["text"] for chunk in glossary).split() == words.split()
+
+
+if __name__ == "__main__":
+    test_sections_from_xml()
+    test_sections_keep_their_headings()
+    test_small_sections_merge()
+    test_oversized_blocks_split()
@@ -0,0 +1,63 @@
+import os
+import sqlite3
+import tempfile
+
+from utils.lexical_index import LexicalIndexWriter, chunk_columns
+
+OLD_CHUNKS = """
+CREATE TABLE chunks (
+    id INTEGER PRIMARY KEY,
+    chunk_id TEXT NOT NULL UNIQUE,
+    url TEXT NOT NULL,
+    title TEXT,
+    text TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    postings BLOB NOT NULL
+);
+"""
+
+
+def _batch(headings):
+    return {
+        "ids": ["a", "b"],
+        "documents": ["Apply by January 15.", "Fees are listed per term."],
+        "metadatas": [{"url": "https://example.edu/admissions", "title": "Admissions", "headings": headings},
+                      {"url": "https://example.edu/tuition", "title": "Tuition"}],
+        "delete_urls": [],
+    }
+
+
+def test_headings_are_stored():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "index.sqlite")
+        writer = LexicalIndexWriter(path)
+        writer.write_batch(_batch("Admissions > Undergraduate"))
+        writer.close()
+        conn = sqlite3.connect(path)
+        rows = dict(conn.execute("SELECT chunk_id, headings FROM chunks").fetchall())
+        conn.close()
+        # Chunks without a heading path store NULL, not an empty string
+        assert rows == {"a": "Admissions > Undergraduate", "b": None}
+
+
+def test_index_without_headings_is_migrated():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "index.sqlite")
+        conn = sqlite3.connect(path)
+        conn.executescript(OLD_CHUNKS)
+        conn.execute("INSERT INTO chunks (chunk_id, url, title, text, length, postings) VALUES ('old', 'u', 't', 'x', 1, x'')")
+        conn.commit()
+        conn.close()
+
+        writer = LexicalIndexWriter(path)
+        writer.write_batch(_batch(""))
+        writer.close()
+        conn = sqlite3.connect(path)
+        assert "headings" in chunk_columns(conn)
+        assert conn.execute("SELECT COUNT(*) FROM chunks WHERE headings IS NULL").fetchone()[0] == 3
+        conn.close()
+
+
+if __name__ == "__main__":
+    test_headings_are_stored()
+    test_index_without_headings_is_migrated()
@@ -0,0 +1,58 @@
+import pytest
+from scrapy.exceptions import DropItem
+from scrapy.settings import Settings
+from scrapy.spiders import Spider
+
+from pipelines.incremental import IncrementalPipeline
+from pipelines.near_duplicate import NearDuplicatePipeline
+from utils.page_state import content_hash
+
+SPIDER = Spider(name="near_duplicate_test")
+SETTINGS = {"UNIVERSITY_NAME": "near_duplicate_test", "NEAR_DUPLICATE_ENABLED": False}
+
+
+class RecordingStore:
+    def __init__(self):
+        self.states = {}
+
+    def set(self, url, etag=None, last_modified=None, text_hash=None):
+        self.states[url] = text_hash
+
+
+def test_new_duplicate_is_dropped():
+    pipeline = NearDuplicatePipeline(Settings(SETTINGS))
+    item = {"url": "https://example.edu/copy", "text": "Apply by January 15."}
+    with pytest.raises(DropItem):
+        pipeline._handle_result((2, "https://example.edu/original"), item, SPIDER)
+
+
+def test_changed_page_that_became_a_duplicate_is_removed():
+    pipeline = NearDuplicatePipeline(Settings(SETTINGS))
+    text = "Apply by January 15."
+    item = {"url": "https://example.edu/copy", "text": text, "content_hash": content_hash(text), "replace_existing": True}
+    # Passed on as a deletion, so the vector store and lexical index remove its old chunks
+    result = pipeline._handle_result((2, "https://example.edu/original"), item, SPIDER)
+    assert result is item and item["deleted"] and item["replace_existing"]
+
+    # Its new hash is remembered, so the next crawl drops it as unchanged before fingerprinting
+    incremental = IncrementalPipeline(Settings(SETTINGS))
+    incremental.store = RecordingStore()
+    incremental.item_scraped(item, None, SPIDER)
+    assert incremental.store.states == {"https://example.edu/copy": content_hash(text)}
+
+    # Pages that were actually removed have no hash and leave no state behind
+    incremental.item_scraped({"url": "https://example.edu/gone", "deleted": True}, None, SPIDER)
+    assert "https://example.edu/gone" not in incremental.store.states
+
+
+def test_changed_page_is_linked_when_linking():
+    pipeline = NearDuplicatePipeline(Settings({**SETTINGS, "NEAR_DUPLICATE_ACTION": "link"}))
+    item = {"url": "https://example.edu/copy", "text": "Apply by January 15.", "replace_existing": True}
+    result = pipeline._handle_result((2, "https://example.edu/original"), item, SPIDER)
+    assert result["duplicate_of"] == "https://example.edu/original" and not result.get("deleted")
+
+
+if __name__ == "__main__":
+    test_new_duplicate_is_dropped()
+    test_changed_page_that_became_a_duplicate_is_removed()
+    test_changed_page_is_linked_when_linking()
@@ -0,0 +1,84 @@
+import os
+import sqlite3
+import tempfile
+
+import numpy as np
+
+from utils.quantized_index import (
+    QuantizedIndexWriter, data_path, ivf_path, read_meta, row_formats,
+)
+
+DIM = 16
+
+
+def _batch(urls_and_vectors, delete_urls=()):
+    ids, embeddings, documents, metadatas = [], [], [], []
+    for url, vectors in urls_and_vectors:
+        for i, vector in enumerate(vectors):
+            ids.append(f"{url}#{i}")
+            embeddings.append(vector)
+            documents.append(f"chunk {i} of {url}")
+            metadatas.append({"url": url, "title": url})
+    return {"ids": ids, "embeddings": embeddings, "documents": documents, "metadatas": metadatas,
+            "delete_urls": list(delete_urls)}
+
+
+def _read(path):
+    conn = sqlite3.connect(os.path.join(path, "index.sqlite"))
+    meta = read_meta(conn)
+    chunks = conn.execute("SELECT row, chunk_id FROM chunks ORDER BY row").fetchall()
+    conn.close()
+    rows, layout = int(meta["rows"]), int(meta["layout"])
+    vectors = np.fromfile(data_path(path, "vectors", layout), dtype=np.float32).reshape(rows, DIM)
+    return meta, chunks, vectors
+
+
+def test_round_trip():
+    rng = np.random.default_rng(0)
+    pages = {f"https://example.edu/{page}": rng.standard_normal((5, DIM)).astype(np.float32) for page in range(8)}
+    expected = {f"{url}#{i}": vector / np.linalg.norm(vector) for url, vectors in pages.items() for i, vector in enumerate(vectors)}
+
+    with tempfile.TemporaryDirectory() as path:
+        # Append: rows are numbered in insertion order and every data file holds all of them
+        writer = QuantizedIndexWriter(path, ivf_min_rows=10)
+        writer.write_batch(_batch(list(pages.items())[:4]))
+        writer.write_batch(_batch(list(pages.items())[4:]))
+        meta, chunks, vectors = _read(path)
+        assert int(meta["rows"]) == 40 and len(chunks) == 40
+        assert [row for row, _ in chunks] == list(range(40))
+        for name, (dtype, width) in row_formats(DIM).items():
+            assert os.path.getsize(data_path(path, name, 0)) == 40 * width * np.dtype(dtype).itemsize
+        for row, chunk_id in chunks:
+            assert np.allclose(vectors[row], expected[chunk_id], atol=1e-6)
+
+        # Deleting over a quarter of the rows makes close() compact them away and renumber the rest
+        deleted = list(pages)[:3]
+        writer.write_batch(_batch([], delete_urls=deleted))
+        writer.close()
+        meta, chunks, vectors = _read(path)
+        assert int(meta["layout"]) == 1 and int(meta["rows"]) == 25
+        assert [row for row, _ in chunks] == list(range(25))
+        assert not any(chunk_id.split("#")[0] in deleted for _, chunk_id in chunks)
+        for row, chunk_id in chunks:
+            assert np.allclose(vectors[row], expected[chunk_id], atol=1e-6)
+        assert not os.path.exists(data_path(path, "vectors", 0))
+
+        # Compaction drops the old IVF lists, and close() retrains them for the new layout
+        assert "ivf_id" in meta and int(meta["ivf_rows"]) == 25
+        lists = int(meta["ivf_lists"])
+        ivf_rows = np.load(ivf_path(path, "rows", 1, int(meta["ivf_id"])))
+        offsets = np.load(ivf_path(path, "offsets", 1, int(meta["ivf_id"])))
+        assert sorted(ivf_rows.tolist()) == list(range(25))
+        assert len(offsets) == lists + 1 and offsets[-1] == 25
+
+        # Rows appended after training are not covered until the uncovered share passes a quarter
+        writer = QuantizedIndexWriter(path, ivf_min_rows=10)
+        writer.write_batch(_batch([("https://example.edu/new", rng.standard_normal((10, DIM)).astype(np.float32))]))
+        writer.close()
+        meta, chunks, _ = _read(path)
+        assert int(meta["rows"]) == 35 and int(meta["ivf_rows"]) == 35
+        assert len([name for name in os.listdir(path) if name.startswith("ivf_rows.")]) == 1
+
+
+if __name__ == "__main__":
+    test_round_trip()
@@ -1,7 +1,12 @@
 import os
 import shutil
+import time
+import uuid
 import chromadb
 
+# Collection metadata key the engine's semantic cache compares to spot stale answers
+INGEST_VERSION_KEY = "ingest_version"
+
 def clear_chroma_db(db_location):
     if os.path.exists(db_location):
         shutil.rmtree(db_location)
@@ -16,4 +21,18 @@ def list_chroma_collections(db_location):
     chroma_client = chromadb.PersistentClient(path=db_location)
     return chroma_client.list_collections()
 
-print(list_chroma_collections("/Users/lukepitstick/university-search/chroma_langchain_db"))
\ No newline at end of file
+
+def bump_ingest_version(collection) -> str:
+    """Marks the collection as changed by a new ingest. Returns the new version."""
+    # modify() replaces the metadata and rejects hnsw:* keys, even unchanged; the index keeps
+    # its own copy of those in the segment metadata, so dropping them here is safe
+    metadata = {key: value for key, value in (collection.metadata or {}).items() if not key.startswith("hnsw:")}
+    version = uuid.uuid4().hex
+    metadata[INGEST_VERSION_KEY] = version
+    metadata["ingested_at"] = time.time()
+    collection.modify(metadata=metadata)
+    return version
+
+
+if __name__ == "__main__":
+    print(list_chroma_collections("/Users/lukepitstick/university-search/chroma_langchain_db"))
\ No newline at end of file
@@ -0,0 +1,152 @@
+import re
+
+# Words and punctuation marks, the pieces WordPiece/BPE tokenizers start from before splitting rare words
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+HEADING_PATH_SEPARATOR = " > "
+
+
+def count_tokens(text):
+    # A lower bound on model tokens, so limits should leave headroom below the model's context
+    return len(_TOKEN.findall(text))
+
+
+def _text(element):
+    return " ".join("".join(element.itertext()).split())
+
+
+def _heading_level(head):
+    rend = head.get("rend") or ""
+    return int(rend[1:]) if rend[:1] == "h" and rend[1:].isdigit() else 2
+
+
+def sections_from_xml(body):
+    """
+    Splits trafilatura's XML body into sections at its headings. Returns a
+    list of {"headings": [...], "blocks": [...]}, where headings is the path
+    of enclosing headings (h1 first) and blocks are the section's
+    paragraphs, lists and tables as text. Headings with no text under them
+    only appear in the paths of their subsections.
+    """
+    sections, path, current = [], [], None
+    for element in body:
+        if element.tag == "head":
+            title = _text(element)
+            if title:
+                level = _heading_level(element)
+                path = [(lvl, heading) for lvl, heading in path if lvl < level] + [(level, title)]
+                current = None
+            continue
+        if element.tag == "list":
+            text = "\n".join(f"- {item}" for item in map(_text, element.findall("item")) if item)
+        elif element.tag == "table":
+            text = "\n".join(" | ".join(_text(cell) for cell in row.findall("cell")) for row in element.iter("row"))
+        else:
+            text = _text(element)
+        if not text.strip():
+            continue
+        if current is None:
+            current = {"headings": [heading for _, heading in path], "blocks": []}
+            sections.append(current)
+        current["blocks"].append(text)
+    return sections
+
+
+def extract(html, with_sections=False):
+    """
+    A page's main text, as trafilatura's extract() returns it, and with
+    `with_sections` its sections (see `sections_from_xml`), from a single
+    extraction. Returns (None, None) when there is no main text.
+    """
+    from trafilatura import bare_extraction
+    from trafilatura.core import determine_returnstring
+    from trafilatura.settings import Extractor
+
+    options = Extractor(output_format="txt")
+    document = bare_extraction(html, options=options, as_dict=False)
+    if document is None:
+        return None, None
+    sections = sections_from_xml(document.body) if with_sections else None
+    return determine_returnstring(document, options), sections
+
+
+def _split_block(block, max_tokens):
+    """A block as pieces of at most max_tokens: whole sentences where possible, runs of words otherwise."""
+    if count_tokens(block) <= max_tokens:
+        return [block]
+    units = []
+    for sentence in _SENTENCE.split(block):
+        if count_tokens(sentence) <= max_tokens:
+            units.append(sentence)
+        else:
+            units.extend(sentence.split())
+
+    pieces, current, size = [], [], 0
+    for unit in units:
+        tokens = count_tokens(unit)
+        if current and size + tokens > max_tokens:
+            pieces.append(" ".join(current))
+            current, size = [], 0
+        current.append(unit)
+        size += tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def _common_prefix(a, b):
+    prefix = []
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        prefix.append(x)
+    return prefix
+
+
+def chunk_sections(sections, max_tokens=200, min_tokens=50):
+    """
+    Packs sections (see `sections_from_xml`) into chunks of at most
+    `max_tokens`, as [{"text", "headings"}]. A chunk never spans a section
+    boundary, except that a section or leftover under `min_tokens` shares
+    a chunk with its neighbour when both fit. The headings of a shared
+    chunk are the two paths' common prefix, and the rest of each path is
+    kept as a line of text. Blocks are only split when one alone is over
+    the limit. No text is repeated between chunks.
+    """
+    chunks = []
+    headings, parts, size = [], [], 0
+
+    def flush():
+        if parts:
+            chunks.append({"text": "\n\n".join(parts), "headings": headings})
+
+    for section in sections:
+        path = section["headings"]
+        pieces = [piece for block in section["blocks"] for piece in _split_block(block, max_tokens)]
+        section_size = sum(count_tokens(piece) for piece in pieces)
+
+        if parts and (size < min_tokens or section_size < min_tokens):
+            shared = _common_prefix(headings, path)
+            before = HEADING_PATH_SEPARATOR.join(headings[len(shared):])
+            after = HEADING_PATH_SEPARATOR.join(path[len(shared):])
+            if size + section_size + count_tokens(before) + count_tokens(after) <= max_tokens:
+                if before:
+                    parts.insert(0, before)
+                if after:
+                    parts.append(after)
+                parts.extend(pieces)
+                headings = shared
+                size += section_size + count_tokens(before) + count_tokens(after)
+                continue
+
+        flush()
+        headings, parts, size = path, [], 0
+        for piece in pieces:
+            tokens = count_tokens(piece)
+            if parts and size + tokens > max_tokens:
+                flush()
+                parts, size = [], 0
+            parts.append(piece)
+            size += tokens
+    flush()
+    return chunks
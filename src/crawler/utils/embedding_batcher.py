@@ -0,0 +1,177 @@
+from collections import deque
+
+from twisted.internet import defer, threads
+from twisted.python.threadpool import ThreadPool
+
+
+class _PendingRequest:
+    """Chunks submitted together by one item, filled in as batches complete."""
+
+    def __init__(self, texts, deferred):
+        self.texts = texts
+        self.vectors = [None] * len(texts)
+        self.remaining = len(texts)
+        self.deferred = deferred
+        self.failed = False
+
+
+class EmbeddingBatcher:
+    """
+    Collects chunks from many items into batches and embeds them on a worker
+    thread pool, so the reactor thread never waits on the embedding model.
+
+    A batch is sent when `batch_size` chunks are queued or when the oldest
+    queued chunk has waited `max_delay` seconds. At most `max_pending` chunks
+    are held at once; submissions beyond that wait until earlier batches finish.
+    All state is only touched from the reactor thread.
+    """
+
+    def __init__(self, embed_fn, batch_size=64, max_delay=0.25, max_pending=1024, max_workers=2, stats=None):
+        self.embed_fn = embed_fn
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_pending = max(max_pending, batch_size)
+        self.max_workers = max_workers
+        self.stats = stats
+
+        self._queue = deque()       # (request, index) per chunk
+        self._waiting = deque()     # (texts, deferred) held back by backpressure
+        self._pending_chunks = 0    # queued + in flight
+        self._in_flight = 0
+        self._timer = None
+        self._deadline_passed = False
+        self._outstanding = set()
+        self._pool = None
+        self._reactor = None
+
+    def start(self):
+        from twisted.internet import reactor
+        self._reactor = reactor
+        self._pool = ThreadPool(minthreads=1, maxthreads=self.max_workers, name="embedding-batcher")
+        self._pool.start()
+
+    def submit(self, texts):
+        """Returns a Deferred firing with one vector per text, in order."""
+        d = defer.Deferred()
+        if not texts:
+            d.callback([])
+            return d
+
+        self._outstanding.add(d)
+        d.addBoth(self._forget, d)
+
+        if self._waiting or (self._pending_chunks and self._pending_chunks + len(texts) > self.max_pending):
+            self._waiting.append((texts, d))
+            self._inc("embedding/backpressure_waits")
+        else:
+            self._enqueue(texts, d)
+        return d
+
+    def close(self):
+        """Flushes everything still queued and stops the worker pool."""
+        self._deadline_passed = True
+        self._maybe_dispatch()
+        d = defer.DeferredList(list(self._outstanding), consumeErrors=True)
+        d.addBoth(self._stop_pool)
+        return d
+
+    # ---------- Internals ----------
+    def _forget(self, result, d):
+        self._outstanding.discard(d)
+        return result
+
+    def _stop_pool(self, _):
+        if self._timer is not None and self._timer.active():
+            self._timer.cancel()
+        if self._pool is not None:
+            self._pool.stop()
+            self._pool = None
+
+    def _enqueue(self, texts, d):
+        request = _PendingRequest(texts, d)
+        for index in range(len(texts)):
+            self._queue.append((request, index))
+        self._pending_chunks += len(texts)
+        self._set_value("embedding/queue_depth", self._pending_chunks)
+        self._max_value("embedding/queue_depth_max", self._pending_chunks)
+
+        if self._timer is None or not self._timer.active():
+            self._timer = self._reactor.callLater(self.max_delay, self._on_deadline)
+        self._maybe_dispatch()
+
+    def _on_deadline(self):
+        self._deadline_passed = True
+        self._maybe_dispatch()
+
+    def _maybe_dispatch(self):
+        while self._queue and self._in_flight < self.max_workers:
+            if len(self._queue) < self.batch_size and not self._deadline_passed:
+                break
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            self._dispatch(batch)
+            self._deadline_passed = False
+
+        if not self._queue:
+            if self._timer is not None and self._timer.active():
+                self._timer.cancel()
+            self._deadline_passed = False
+        elif self._timer is None or not self._timer.active():
+            self._timer = self._reactor.callLater(self.max_delay, self._on_deadline)
+
+    def _dispatch(self, batch):
+        self._in_flight += 1
+        self._inc("embedding/batches")
+        self._inc("embedding/chunks", len(batch))
+        self._max_value("embedding/batch_size_max", len(batch))
+
+        texts = [request.texts[index] for request, index in batch]
+        d = threads.deferToThreadPool(self._reactor, self._pool, self.embed_fn, texts)
+        d.addCallbacks(self._on_batch_done, self._on_batch_failed, callbackArgs=(batch,), errbackArgs=(batch,))
+        d.addBoth(self._on_batch_finished, len(batch))
+
+    def _on_batch_done(self, vectors, batch):
+        for (request, index), vector in zip(batch, vectors):
+            request.vectors[index] = vector
+            request.remaining -= 1
+            if request.remaining == 0 and not request.failed:
+                request.deferred.callback(request.vectors)
+
+    def _on_batch_failed(self, failure, batch):
+        self._inc("embedding/batch_errors")
+        for request, _ in batch:
+            request.remaining -= 1
+            if not request.failed:
+                request.failed = True
+                request.deferred.errback(failure)
+        # Drop chunks of failed requests that are still waiting in the queue
+        dropped = [entry for entry in self._queue if entry[0].failed]
+        if dropped:
+            self._queue = deque(entry for entry in self._queue if not entry[0].failed)
+            self._pending_chunks -= len(dropped)
+
+    def _on_batch_finished(self, _, batch_len):
+        self._in_flight -= 1
+        self._pending_chunks -= batch_len
+        self._set_value("embedding/queue_depth", self._pending_chunks)
+
+        # Admit submissions held back by backpressure
+        while self._waiting:
+            texts, d = self._waiting[0]
+            if self._pending_chunks and self._pending_chunks + len(texts) > self.max_pending:
+                break
+            self._waiting.popleft()
+            self._enqueue(texts, d)
+
+        self._maybe_dispatch()
+
+    def _inc(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(key, count)
+
+    def _set_value(self, key, value):
+        if self.stats is not None:
+            self.stats.set_value(key, value)
+
+    def _max_value(self, key, value):
+        if self.stats is not None:
+            self.stats.max_value(key, value)
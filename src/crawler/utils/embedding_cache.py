@@ -0,0 +1,144 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    Disk-backed cache of chunk embeddings shared by every crawler on the machine.
+
+    Entries are keyed by a hash of the model name and the normalized chunk
+    text, and vectors are stored as packed float32. When the cache grows past
+    `max_entries` the least recently used entries are evicted. Safe to use
+    from several threads and processes.
+    """
+
+    def __init__(self, path, model, max_entries=1_000_000):
+        self.path = path
+        self.model = model
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def key(self, text):
+        return hashlib.sha1(f"{self.model}\0{normalize_text(text)}".encode("utf-8")).digest()
+
+    def get_many(self, texts):
+        """Returns a list aligned with `texts`, holding a vector for hits and None for misses."""
+        keys = [self.key(text) for text in texts]
+        unique_keys = list(set(keys))
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique_keys), 500):
+                part = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = int(time.time())
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+                self._conn.commit()
+
+        vectors = [self._unpack(found[k]) if k in found else None for k in keys]
+        hits = sum(v is not None for v in vectors)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(self, texts, vectors):
+        now = int(time.time())
+        rows = [(self.key(text), self._pack(vector), now) for text, vector in zip(texts, vectors)]
+        with self._lock:
+            cursor = self._conn.executemany("INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            self._entries += max(cursor.rowcount, 0)
+            if self._entries > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def embed_with(self, embed_fn, texts):
+        """Embeds `texts`, sending only uncached (and de-duplicated) texts to `embed_fn`."""
+        vectors = self.get_many(texts)
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(normalize_text(texts[i]), []).append(i)
+        if not missing:
+            return vectors
+
+        miss_texts = [texts[indexes[0]] for indexes in missing.values()]
+        new_vectors = embed_fn(miss_texts)
+        for indexes, vector in zip(missing.values(), new_vectors):
+            for i in indexes:
+                vectors[i] = vector
+        self.put_many(miss_texts, new_vectors)
+        return vectors
+
+    def size_bytes(self):
+        with self._lock:
+            page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": self._entries,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---------- Internals ----------
+    def _evict(self):
+        # Other processes may have written too, so recount before trimming to 90% of the cap
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._entries - int(self.max_entries * 0.9)
+        if excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self._entries -= excess
+
+    @staticmethod
+    def _pack(vector):
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _unpack(blob):
+        vector = array("f")
+        vector.frombytes(blob)
+        return vector.tolist()
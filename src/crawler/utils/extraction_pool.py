@@ -0,0 +1,183 @@
+import logging
+import multiprocessing
+import queue
+import threading
+
+from twisted.internet import threads
+from twisted.python.threadpool import ThreadPool
+
+from utils.chunking import extract
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+class ExtractionError(Exception):
+    pass
+
+
+def _worker_main(conn):
+    # Import (and warm up) trafilatura once per worker rather than per page
+    extract("<html><body><p>warm up</p></body></html>", True)
+    conn.send("ready")
+
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        try:
+            conn.send(("ok", extract(*request)))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+
+
+class ExtractionWorker:
+    """One extraction process. A worker that times out is killed, never reused."""
+
+    def __init__(self, context):
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self, timeout):
+        if not self._conn.poll(timeout):
+            raise ExtractionError("Extraction worker did not start in time")
+        self._conn.recv()
+
+    def run(self, html, with_sections, timeout):
+        self._conn.send((html, with_sections))
+        if not self._conn.poll(timeout):
+            raise ExtractionTimeout(f"Extraction took longer than {timeout}s")
+        status, value = self._conn.recv()
+        if status == "error":
+            raise ExtractionError(value)
+        return value
+
+    def stop(self, timeout=5):
+        try:
+            self._conn.send(None)
+        except (OSError, EOFError):
+            pass
+        self.process.join(timeout)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self._conn.close()
+
+
+class ExtractionPool:
+    """
+    Runs trafilatura extraction in a pool of pre-warmed worker processes.
+
+    `submit` returns a Deferred, so the reactor thread never runs extraction
+    itself. Each page gets `timeout` seconds; a worker that exceeds it is
+    killed and replaced, so one pathological document cannot wedge the crawl.
+    One pool is shared by every crawler in the process (see `acquire`).
+    """
+
+    _shared = None
+    _users = 0
+    _shared_lock = threading.Lock()
+
+    def __init__(self, size, timeout=20.0, start_method="spawn"):
+        self.size = size
+        self.timeout = timeout
+        self.context = multiprocessing.get_context(start_method)
+        self._idle = queue.Queue()
+        self._threads = None
+        self._started = False
+        self._ready = threading.Event()
+
+    @classmethod
+    def acquire(cls, size, timeout=20.0, start_method="spawn"):
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(size, timeout, start_method)
+            cls._users += 1
+            return cls._shared
+
+    @classmethod
+    def release(cls):
+        with cls._shared_lock:
+            cls._users -= 1
+            if cls._users > 0 or cls._shared is None:
+                return
+            pool, cls._shared = cls._shared, None
+        pool.close()
+
+    def start(self):
+        """Starts the workers and blocks until each has imported trafilatura. Safe to call more than once."""
+        with self._shared_lock:
+            starting = not self._started
+            self._started = True
+        if not starting:
+            self._ready.wait()
+            return
+
+        try:
+            workers = [ExtractionWorker(self.context) for _ in range(self.size)]
+            for worker in workers:
+                worker.wait_ready(timeout=60)
+                self._idle.put(worker)
+            self._threads = ThreadPool(minthreads=1, maxthreads=self.size, name="extraction-pool")
+            self._threads.start()
+            logger.info(f"Extraction pool started with {self.size} workers")
+        finally:
+            self._ready.set()
+
+    def submit(self, html, with_sections=False):
+        """
+        Returns a Deferred firing with (text, sections): the extracted text, or
+        None if trafilatura found nothing, and with `with_sections` the page's
+        heading sections (see utils.chunking.sections_from_xml), else None.
+        """
+        from twisted.internet import reactor
+        return threads.deferToThreadPool(reactor, self._threads, self._run, html, with_sections)
+
+    def close(self):
+        if self._threads is not None:
+            self._threads.stop()
+            self._threads = None
+        while not self._idle.empty():
+            worker = self._idle.get_nowait()
+            if worker is not None:
+                worker.stop()
+
+    def _run(self, html, with_sections):
+        # Runs on a pool thread; each thread holds one worker process for the duration of a page
+        worker = self._idle.get()
+        if worker is None:
+            # This slot's last restart failed; try again before giving up on the page
+            try:
+                worker = self._new_worker()
+            except Exception as e:
+                self._idle.put(None)
+                raise ExtractionError(f"Extraction worker could not be restarted: {e!r}")
+        try:
+            return worker.run(html, with_sections, self.timeout)
+        except (ExtractionTimeout, EOFError, OSError) as e:
+            worker.kill()
+            worker = None
+            worker = self._new_worker()
+            if isinstance(e, ExtractionTimeout):
+                raise
+            raise ExtractionError(f"Extraction worker died: {e!r}")
+        finally:
+            # A slot whose worker couldn't be restarted goes back empty, never with the broken worker
+            self._idle.put(worker)
+
+    def _new_worker(self):
+        worker = ExtractionWorker(self.context)
+        try:
+            worker.wait_ready(timeout=60)
+        except BaseException:
+            worker.kill()
+            raise
+        return worker
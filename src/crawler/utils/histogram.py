@@ -0,0 +1,45 @@
+import bisect
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram with cumulative-style bucket counts, as Prometheus
+    keeps them. Unit-agnostic: the buckets are upper bounds in whatever unit
+    is observed. Used by the crawl telemetry and the engine's tracer.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, q, counts=None):
+        """
+        Estimate by linear interpolation inside the bucket, like
+        histogram_quantile(), capped at the largest value seen. `counts`
+        (e.g. the difference of two snapshots) defaults to all observations.
+        """
+        counts = self.counts if counts is None else counts
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(counts):
+            if n and seen + n >= rank:
+                if i == len(self.buckets):
+                    return self.max
+                lower = self.buckets[i - 1] if i else 0.0
+                return min(lower + (self.buckets[i] - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
@@ -0,0 +1,226 @@
+import os
+import re
+import sqlite3
+from array import array
+from collections import Counter
+from functools import lru_cache
+
+# The index format: schema, tokenizer, impact quantization and writer. The engine imports this
+# module (as crawler.utils.lexical_index) to read the index and to write it in benchmarks.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    chunk_id TEXT NOT NULL UNIQUE,
+    url TEXT NOT NULL,
+    title TEXT,
+    text TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    postings BLOB NOT NULL,
+    headings TEXT
+);
+CREATE INDEX IF NOT EXISTS chunks_url ON chunks(url);
+CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT NOT NULL UNIQUE, df INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS postings (
+    term INTEGER NOT NULL,
+    impact INTEGER NOT NULL,
+    chunk INTEGER NOT NULL,
+    PRIMARY KEY (term, impact, chunk)
+) WITHOUT ROWID;
+"""
+
+K1 = 1.2
+B = 0.75
+IMPACT_LEVELS = 255
+# Impacts are requantized when the average chunk length moves this far from the one they were computed with
+REQUANTIZE_DRIFT = 0.1
+REQUANTIZE_BATCH = 5000
+
+TOKEN_RE = re.compile(r"\w+")
+# Very common words only add cost to a query; BM25's IDF would rank them near zero anyway
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or that the this to "
+    "was what when where which who why will with you your".split()
+)
+
+
+@lru_cache(maxsize=200_000)
+def normalize(term: str) -> str | None:
+    """Index form of a lowercased word, or None for stopwords and junk."""
+    if term in STOPWORDS or len(term) >= 40:
+        return None
+    # Plural folding only: enough to match "requirements" with "requirement"
+    if len(term) > 4 and term.endswith("ies"):
+        return term[:-3] + "y"
+    if len(term) > 3 and term.endswith("s") and not term.endswith(("ss", "us", "is")):
+        return term[:-1]
+    return term
+
+
+def tokenize(text: str) -> list[str]:
+    terms = map(normalize, TOKEN_RE.findall(text.lower()))
+    return [term for term in terms if term is not None]
+
+
+def impact(tf: int, length: int, avg_length: float) -> int:
+    """BM25 term-frequency component, quantized to 1..IMPACT_LEVELS. IDF is applied at query time."""
+    weight = tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+    return max(1, round(IMPACT_LEVELS * weight / (K1 + 1)))
+
+
+def create_schema(conn: sqlite3.Connection) -> None:
+    conn.executescript(SCHEMA)
+    # Indexes written before chunks had a heading path
+    if "headings" not in chunk_columns(conn):
+        conn.execute("ALTER TABLE chunks ADD COLUMN headings TEXT")
+
+
+def chunk_columns(conn: sqlite3.Connection) -> set[str]:
+    return {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}
+
+
+def index_path(directory: str, university_name: str) -> str:
+    return os.path.join(directory, f"{university_name}.sqlite")
+
+
+class LexicalIndexWriter:
+    """
+    Writes the per-university BM25 index that the engine queries alongside
+    Chroma: an impact-ordered inverted index in SQLite, holding the same
+    chunks under the same chunk ids so the two result lists can be fused.
+    See the engine's LexicalIndex for the format.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Only used from the buffer's single writer thread, but opened on the reactor thread
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Postings are inserted in term order, not file order, so keep more of the b-tree cached
+        self._conn.execute("PRAGMA cache_size=-65536")
+        create_schema(self._conn)
+
+    def write_batch(self, batch):
+        """Applies a WriteBehindBuffer batch (deletes, then upserts) in one transaction."""
+        rows = [
+            (chunk_id, metadata["url"], metadata.get("title"), text, metadata.get("headings") or None)
+            for chunk_id, metadata, text in zip(batch["ids"], batch["metadatas"], batch["documents"])
+        ]
+        with self._conn:
+            write_chunks(self._conn, batch["delete_urls"], rows)
+
+    def __len__(self):
+        return int(dict(self._conn.execute("SELECT key, value FROM meta").fetchall()).get("chunk_count", 0))
+
+    def close(self):
+        self._conn.execute("PRAGMA optimize")
+        self._conn.close()
+
+
+def _term_ids(conn: sqlite3.Connection, terms: set) -> dict:
+    ids = {}
+    terms = list(terms)
+    # Stay under SQLite's bound-parameter limit
+    for start in range(0, len(terms), 900):
+        part = terms[start:start + 900]
+        ids.update(conn.execute(f"SELECT term, id FROM terms WHERE term IN ({','.join('?' * len(part))})", part).fetchall())
+    return ids
+
+
+def write_chunks(conn: sqlite3.Connection, delete_urls: list[str], rows: list[tuple]) -> None:
+    """
+    Deletes every chunk of `delete_urls`, then adds or replaces `rows` of
+    (chunk_id, url, title, text, headings), where headings is the chunk's
+    heading path as one string or None. Runs inside the caller's transaction.
+    """
+    meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+    df_changes = Counter()
+
+    # Each chunk keeps its (term, impact) pairs, so its postings are deleted by primary key
+    doomed = {}
+    for url in delete_urls:
+        doomed.update((row[0], row) for row in conn.execute("SELECT id, length, postings FROM chunks WHERE url = ?", (url,)))
+    for chunk_id, *_ in rows:
+        doomed.update((row[0], row) for row in conn.execute("SELECT id, length, postings FROM chunks WHERE chunk_id = ?", (chunk_id,)))
+    removed = []
+    for row, length, blob in doomed.values():
+        postings = array("I")
+        postings.frombytes(blob)
+        removed.extend((postings[i], postings[i + 1], row) for i in range(0, len(postings), 2))
+        df_changes.subtract(postings[::2])
+        meta["chunk_count"] = meta.get("chunk_count", 0) - 1
+        meta["total_length"] = meta.get("total_length", 0) - length
+    # Sorted keys touch each b-tree page once instead of jumping around the file
+    removed.sort()
+    conn.executemany("DELETE FROM postings WHERE term = ? AND impact = ? AND chunk = ?", removed)
+    conn.executemany("DELETE FROM chunks WHERE id = ?", [(row,) for row in doomed])
+
+    counts = [Counter(tokenize(text)) for _, _, _, text, _ in rows]
+    vocabulary = set().union(*counts) if counts else set()
+    term_ids = _term_ids(conn, vocabulary)
+    conn.executemany("INSERT INTO terms (term, df) VALUES (?, 0)", [(term,) for term in vocabulary - term_ids.keys()])
+    term_ids.update(_term_ids(conn, vocabulary - term_ids.keys()))
+
+    for terms in counts:
+        meta["chunk_count"] = meta.get("chunk_count", 0) + 1
+        meta["total_length"] = meta.get("total_length", 0) + sum(terms.values())
+    avg_length = max(meta["total_length"] / meta["chunk_count"], 1.0) if meta.get("chunk_count") else 1.0
+    # Every posting is quantized against the same average, so impacts written at different times compare
+    reference = meta.setdefault("impact_avg_length", avg_length)
+
+    added = []
+    for (chunk_id, url, title, text, headings), terms in zip(rows, counts):
+        length = sum(terms.values())
+        postings = array("I")
+        for term, tf in terms.items():
+            postings.append(term_ids[term])
+            postings.append(impact(tf, length, reference))
+        row = conn.execute(
+            "INSERT INTO chunks (chunk_id, url, title, text, length, postings, headings) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (chunk_id, url, title, text, length, postings.tobytes(), headings),
+        ).lastrowid
+        added.extend((postings[i], postings[i + 1], row) for i in range(0, len(postings), 2))
+        df_changes.update(postings[::2])
+    added.sort()
+    conn.executemany("INSERT INTO postings (term, impact, chunk) VALUES (?, ?, ?)", added)
+
+    conn.executemany("UPDATE terms SET df = df + ? WHERE id = ?", [(change, term) for term, change in df_changes.items() if change])
+    if meta.get("chunk_count") and abs(avg_length / reference - 1) > REQUANTIZE_DRIFT:
+        requantize(conn, avg_length)
+        meta["impact_avg_length"] = avg_length
+    conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", meta.items())
+
+
+def requantize(conn: sqlite3.Connection, avg_length: float) -> None:
+    """
+    Recomputes every posting's impact against `avg_length`. BM25 length
+    normalization is baked into the impacts, so without this the scores of
+    chunks written early and late would drift apart as the index grows.
+    Costs a pass over the whole index, but the average settles quickly, so
+    it runs a few times early in a university's first crawl and rarely
+    after. Runs inside the caller's transaction.
+    """
+    conn.execute("DELETE FROM postings")
+    last = 0
+    while True:
+        chunks = conn.execute(
+            "SELECT id, text, length FROM chunks WHERE id > ? ORDER BY id LIMIT ?", (last, REQUANTIZE_BATCH)
+        ).fetchall()
+        if not chunks:
+            break
+        counts = [Counter(tokenize(text)) for _, text, _ in chunks]
+        term_ids = _term_ids(conn, set().union(*counts))
+        added, blobs = [], []
+        for (row, _, length), terms in zip(chunks, counts):
+            postings = array("I")
+            for term, tf in terms.items():
+                postings.append(term_ids[term])
+                postings.append(impact(tf, length, avg_length))
+            added.extend((postings[i], postings[i + 1], row) for i in range(0, len(postings), 2))
+            blobs.append((postings.tobytes(), row))
+        added.sort()
+        conn.executemany("INSERT INTO postings (term, impact, chunk) VALUES (?, ?, ?)", added)
+        conn.executemany("UPDATE chunks SET postings = ? WHERE id = ?", blobs)
+        last = chunks[-1][0]
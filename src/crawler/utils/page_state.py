@@ -0,0 +1,58 @@
+import hashlib
+import json
+import zlib
+
+# Links of a page not re-crawled within this long are forgotten
+LINKS_TTL = 30 * 24 * 3600
+
+
+def content_hash(text):
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+
+class PageStateStore:
+    """
+    Per-URL crawl state kept in Redis between crawls of a university.
+
+    `<prefix>:page_state` maps each URL to its ETag, Last-Modified and the hash
+    of its extracted text. `<prefix>:page_links:<sha1 of URL>` holds the links
+    followed from a URL in an incremental crawl, newline-joined and
+    compressed, so a 304 response can still expand the frontier. Link keys
+    expire after `links_ttl` seconds unless the page is crawled again.
+    """
+
+    def __init__(self, server, university_name, links_ttl=LINKS_TTL):
+        self.server = server
+        prefix = f"university_spider_{university_name}"
+        self.state_key = f"{prefix}:page_state"
+        self.links_prefix = f"{prefix}:page_links"
+        self.links_ttl = links_ttl
+
+    def _links_key(self, url):
+        return f"{self.links_prefix}:{hashlib.sha1(url.encode('utf-8')).hexdigest()}"
+
+    def get(self, url):
+        raw = self.server.hget(self.state_key, url)
+        return json.loads(raw) if raw else None
+
+    def set(self, url, etag=None, last_modified=None, text_hash=None):
+        state = {"etag": etag, "last_modified": last_modified, "content_hash": text_hash}
+        self.server.hset(self.state_key, url, json.dumps(state))
+
+    def has_links(self, url):
+        return bool(self.server.exists(self._links_key(url)))
+
+    def get_links(self, url):
+        raw = self.server.get(self._links_key(url))
+        text = zlib.decompress(raw).decode("utf-8") if raw else ""
+        return text.split("\n") if text else []
+
+    def set_links(self, url, links):
+        raw = zlib.compress("\n".join(links).encode("utf-8"))
+        self.server.set(self._links_key(url), raw, ex=self.links_ttl)
+
+    def delete(self, url):
+        pipe = self.server.pipeline(transaction=False)
+        pipe.hdel(self.state_key, url)
+        pipe.delete(self._links_key(url))
+        pipe.execute()
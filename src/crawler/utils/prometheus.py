@@ -0,0 +1,122 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(families):
+    """
+    Prometheus text exposition format. `families` maps a metric name to
+    (type, help, samples), each sample a (suffix, labels, value) where the
+    suffix is "" or e.g. "_bucket" for histograms.
+    """
+    lines = []
+    for name, (kind, help_text, samples) in families.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{format_labels(labels)} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render(self.server.metrics.collect()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """
+    Serves GET /metrics in the Prometheus text format from a daemon thread.
+    Sources are callables returning metric families (see `render`); the
+    families of every source are merged, so several crawlers in one process
+    share one endpoint with their own labels. One server is shared by every
+    crawler in the process (see `acquire`).
+    """
+
+    _shared = None
+    _users = 0
+    _shared_lock = threading.Lock()
+
+    def __init__(self, host, port):
+        self.sources = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.metrics = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name="prometheus-metrics", daemon=True)
+        self._thread.start()
+        logger.info(f"Serving Prometheus metrics on http://{host}:{self._server.server_port}/metrics")
+
+    @classmethod
+    def acquire(cls, host, port):
+        """The process' server, started on first use. None if the port can't be bound (e.g. another crawl process has it)."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                try:
+                    cls._shared = cls(host, port)
+                except OSError as e:
+                    logger.warning(f"Prometheus metrics disabled, can't listen on {host}:{port}: {e}")
+                    return None
+            cls._users += 1
+            return cls._shared
+
+    @classmethod
+    def release(cls):
+        with cls._shared_lock:
+            cls._users -= 1
+            if cls._users > 0 or cls._shared is None:
+                return
+            server, cls._shared = cls._shared, None
+        server.close()
+
+    def add(self, source):
+        with self._lock:
+            self.sources.append(source)
+
+    def remove(self, source):
+        with self._lock:
+            if source in self.sources:
+                self.sources.remove(source)
+
+    def collect(self):
+        with self._lock:
+            sources = list(self.sources)
+        families = {}
+        for source in sources:
+            for name, (kind, help_text, samples) in source().items():
+                families.setdefault(name, (kind, help_text, []))[2].extend(samples)
+        return families
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
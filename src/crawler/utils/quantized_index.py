@@ -0,0 +1,276 @@
+import os
+import sqlite3
+import time
+import uuid
+
+import numpy as np
+
+# The index format and writer. The engine imports this module (as crawler.utils.quantized_index)
+# to read the index and to write it in benchmarks.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS chunks (
+    row INTEGER PRIMARY KEY,
+    chunk_id TEXT NOT NULL UNIQUE,
+    url TEXT NOT NULL,
+    title TEXT,
+    text TEXT NOT NULL,
+    headings TEXT
+);
+CREATE INDEX IF NOT EXISTS chunks_url ON chunks(url);
+"""
+
+# Compact the data files once more than this share of their rows belong to deleted chunks
+COMPACT_RATIO = 0.25
+BLOCK_ROWS = 32_768
+INGEST_VERSION_KEY = "ingest_version"
+
+
+def index_dir(directory: str, university_name: str) -> str:
+    return os.path.join(directory, university_name)
+
+
+def data_path(path: str, name: str, layout: int) -> str:
+    # Compaction writes a new layout under new names, so readers never see a file change under them
+    return os.path.join(path, f"{name}.{layout}")
+
+
+def ivf_path(path: str, name: str, layout: int, ivf_id: int) -> str:
+    return os.path.join(path, f"ivf_{name}.{layout}.{ivf_id}.npy")
+
+
+def row_formats(dim: int) -> dict:
+    """Data file name -> (dtype, values per row). Row i of every file belongs to chunks.row = i."""
+    return {
+        "vectors": (np.float32, dim),
+        "codes_int8": (np.int8, dim),
+        "scales": (np.float32, 1),
+        "codes_binary": (np.uint8, (dim + 7) // 8),
+    }
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 codes; row i is approximately codes[i] * scales[i]."""
+    scales = np.abs(vectors).max(axis=1) / 127
+    codes = np.round(vectors / np.where(scales == 0, 1, scales)[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    """One sign bit per dimension, packed 8 to a byte."""
+    return np.packbits(vectors > 0, axis=1)
+
+
+def create_schema(conn: sqlite3.Connection) -> None:
+    conn.executescript(SCHEMA)
+    # Indexes written before chunks had a heading path
+    if "headings" not in chunk_columns(conn):
+        conn.execute("ALTER TABLE chunks ADD COLUMN headings TEXT")
+
+
+def chunk_columns(conn: sqlite3.Connection) -> set[str]:
+    return {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}
+
+
+def read_meta(conn: sqlite3.Connection) -> dict:
+    return dict(conn.execute("SELECT key, value FROM meta").fetchall())
+
+
+def write_meta(conn: sqlite3.Connection, meta: dict) -> None:
+    conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [(key, str(value)) for key, value in meta.items()])
+
+
+def _write_at(path: str, offset: int, data: np.ndarray) -> None:
+    # Writing at the committed row count (not the end of the file) overwrites rows left by a failed batch
+    with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+        f.seek(offset)
+        f.write(np.ascontiguousarray(data).tobytes())
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def append_rows(conn: sqlite3.Connection, path: str, delete_urls: list[str], chunk_ids: list[str],
+                embeddings: list, texts: list[str], metadatas: list[dict]) -> None:
+    """
+    Deletes every chunk of `delete_urls` and any existing copies of `chunk_ids`,
+    then appends the new chunks. Runs inside the caller's transaction: the data
+    files are written and synced before the new row count is committed, so a
+    reader never maps rows that aren't fully on disk.
+    """
+    meta = read_meta(conn)
+    rows = int(meta.get("rows", 0))
+    layout = int(meta.get("layout", 0))
+
+    # Deleted chunks leave their rows in the data files until the next compaction
+    conn.executemany("DELETE FROM chunks WHERE url = ?", [(url,) for url in delete_urls])
+    conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+
+    if chunk_ids:
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        dim = int(meta.get("dim", vectors.shape[1]))
+        if vectors.shape[1] != dim:
+            raise ValueError(f"Index holds {dim}-d vectors, got {vectors.shape[1]}-d")
+        codes, scales = quantize_int8(vectors)
+        data = {"vectors": vectors, "codes_int8": codes, "scales": scales[:, None], "codes_binary": quantize_binary(vectors)}
+        for name, (dtype, width) in row_formats(dim).items():
+            _write_at(data_path(path, name, layout), rows * width * np.dtype(dtype).itemsize, data[name])
+        conn.executemany(
+            "INSERT INTO chunks (row, chunk_id, url, title, text, headings) VALUES (?, ?, ?, ?, ?, ?)",
+            [(rows + i, chunk_id, metadata["url"], metadata.get("title"), text, metadata.get("headings") or None)
+             for i, (chunk_id, text, metadata) in enumerate(zip(chunk_ids, texts, metadatas))],
+        )
+        meta["rows"] = rows + len(chunk_ids)
+        meta["dim"] = dim
+
+    meta["layout"] = layout
+    meta["revision"] = int(meta.get("revision", 0)) + 1
+    write_meta(conn, meta)
+
+
+def compact(conn: sqlite3.Connection, path: str) -> bool:
+    """Rewrites the data files without the rows of deleted chunks, if enough of them have piled up."""
+    meta = read_meta(conn)
+    rows, layout = int(meta.get("rows", 0)), int(meta.get("layout", 0))
+    live = np.array(conn.execute("SELECT row FROM chunks ORDER BY row").fetchall(), dtype=np.int64).reshape(-1)
+    if rows == 0 or rows - len(live) <= COMPACT_RATIO * rows:
+        return False
+
+    dim = int(meta["dim"])
+    for name, (dtype, width) in row_formats(dim).items():
+        source = np.memmap(data_path(path, name, layout), dtype=dtype, mode="r", shape=(rows, width))
+        with open(data_path(path, name, layout + 1), "wb") as f:
+            for start in range(0, len(live), BLOCK_ROWS):
+                f.write(np.ascontiguousarray(source[live[start:start + BLOCK_ROWS]]).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        del source
+
+    old_files = _ivf_files(path, meta) + [data_path(path, name, layout) for name in row_formats(dim)]
+    with conn:
+        # New row numbers are assigned in ascending order and never exceed the old ones, so no update collides
+        conn.executemany("UPDATE chunks SET row = ? WHERE row = ?",
+                         [(new, int(old)) for new, old in enumerate(live) if new != old])
+        conn.execute("DELETE FROM meta WHERE key LIKE 'ivf_%'")
+        write_meta(conn, {"rows": len(live), "layout": layout + 1, "revision": int(meta.get("revision", 0)) + 1})
+    # Readers still holding the old layout keep their mappings; the files go once they let go
+    for old in old_files:
+        os.remove(old)
+    return True
+
+
+def _ivf_files(path: str, meta: dict) -> list[str]:
+    if "ivf_id" not in meta:
+        return []
+    layout, ivf_id = int(meta["layout"]), int(meta["ivf_id"])
+    return [ivf_path(path, name, layout, ivf_id) for name in ("centroids", "rows", "offsets")]
+
+
+def nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the most similar centroid for each row."""
+    if len(vectors) == 0:
+        return np.zeros(0, dtype=np.int32)
+    return np.concatenate([
+        np.argmax(np.asarray(vectors[start:start + BLOCK_ROWS], dtype=np.float32) @ centroids.T, axis=1)
+        for start in range(0, len(vectors), BLOCK_ROWS)
+    ]).astype(np.int32)
+
+
+def spherical_kmeans(vectors: np.ndarray, lists: int, iterations: int = 10, sample: int = 20_000, seed: int = 0) -> np.ndarray:
+    """Cosine k-means on a sample of rows; returns unit-length centroids."""
+    rng = np.random.default_rng(seed)
+    picked = np.sort(rng.choice(len(vectors), min(sample, len(vectors)), replace=False))
+    data = np.asarray(vectors[picked], dtype=np.float32)
+    centroids = data[rng.choice(len(data), min(lists, len(data)), replace=False)].copy()
+    for _ in range(iterations):
+        assign = nearest(data, centroids)
+        order = np.argsort(assign, kind="stable")
+        sorted_assign = assign[order]
+        starts = np.flatnonzero(np.r_[True, sorted_assign[1:] != sorted_assign[:-1]])
+        # Empty lists keep their previous centroid
+        centroids[sorted_assign[starts]] = normalize_rows(np.add.reduceat(data[order], starts, axis=0))
+    return centroids
+
+
+def train_ivf(conn: sqlite3.Connection, path: str, lists: int = 0) -> int:
+    """
+    Clusters the stored vectors into `lists` inverted lists (default
+    sqrt(rows)) so queries only scan the lists nearest to them. Rows
+    appended later are scanned exhaustively until the next training.
+    Returns the number of lists.
+    """
+    meta = read_meta(conn)
+    rows, dim, layout = int(meta.get("rows", 0)), int(meta.get("dim", 0)), int(meta.get("layout", 0))
+    if rows == 0:
+        return 0
+    lists = lists or max(1, int(np.sqrt(rows)))
+    vectors = np.memmap(data_path(path, "vectors", layout), dtype=np.float32, mode="r", shape=(rows, dim))
+    centroids = spherical_kmeans(vectors, lists)
+    assign = nearest(vectors, centroids)
+    order = np.argsort(assign, kind="stable").astype(np.int32)
+    offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1)).astype(np.int64)
+    del vectors
+
+    ivf_id = int(meta.get("revision", 0))
+    for name, array in (("centroids", centroids), ("rows", order), ("offsets", offsets)):
+        np.save(ivf_path(path, name, layout, ivf_id), array)
+    old_files = _ivf_files(path, meta)
+    with conn:
+        # Every write bumps the revision, so ivf_id never names files an earlier training wrote
+        write_meta(conn, {"ivf_id": ivf_id, "ivf_lists": len(centroids), "ivf_rows": rows, "revision": ivf_id + 1})
+    for old in old_files:
+        os.remove(old)
+    return len(centroids)
+
+
+class QuantizedIndexWriter:
+    """
+    Writes the per-university quantized vector index that the engine can
+    search instead of Chroma. See the engine's QuantizedIndex for the format
+    and search.
+
+    Batches come from a WriteBehindBuffer on its single writer thread. On
+    close, deleted rows are compacted away and, for large enough indexes,
+    the IVF lists are retrained.
+    """
+
+    def __init__(self, path: str, ivf_min_rows: int = 50_000, ivf_lists: int = 0):
+        self.path = path
+        self.ivf_min_rows = ivf_min_rows
+        self.ivf_lists = ivf_lists
+        os.makedirs(path, exist_ok=True)
+        # Only used from the buffer's single writer thread, but opened on the reactor thread
+        self._conn = sqlite3.connect(os.path.join(path, "index.sqlite"), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        create_schema(self._conn)
+
+    def write_batch(self, batch):
+        """Applies a WriteBehindBuffer batch (deletes, then upserts) in one transaction."""
+        with self._conn:
+            append_rows(self._conn, self.path, batch["delete_urls"], batch["ids"], batch["embeddings"],
+                        batch["documents"], batch["metadatas"])
+
+    def bump_ingest_version(self) -> str:
+        """Marks the index as changed by a new ingest, like chroma_utils.bump_ingest_version. Returns the new version."""
+        version = uuid.uuid4().hex
+        with self._conn:
+            write_meta(self._conn, {INGEST_VERSION_KEY: version, "ingested_at": time.time()})
+        return version
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def close(self):
+        compacted = compact(self._conn, self.path)
+        meta = read_meta(self._conn)
+        rows = int(meta.get("rows", 0))
+        # Retrain when there is no IVF yet, or when the rows it doesn't cover have grown past a quarter
+        if rows >= self.ivf_min_rows and (compacted or rows - int(meta.get("ivf_rows", 0)) > rows // 4):
+            train_ivf(self._conn, self.path, self.ivf_lists)
+        self._conn.close()
@@ -6,6 +6,47 @@ def clear_redis(redis_url):
     r.flushall()
     print(f"Cleared Redis for {redis_url}")
 
+# History that outlives a crawl: learned URL yields and past frontier runs (see schedulers.priority)
+PERSISTENT_SUFFIXES = (b":url_yield", b":frontier_runs")
+
+def university_keys(r, university_name):
+    """All crawl state of one university: shared keys and per-crawler keys (start URLs, items)."""
+    prefix = f"university_spider_{university_name}"
+    keys = [key for key in r.scan_iter(match=f"{prefix}:*") if not key.endswith(PERSISTENT_SUFFIXES)]
+    keys.extend(r.scan_iter(match=f"{prefix}_[0-9]*:*"))
+    return keys
+
+def clear_university(redis_url, university_name):
+    """Deletes only this university's keys, so crawls of other universities keep running."""
+    r = redis.from_url(redis_url)
+    keys = university_keys(r, university_name)
+    if keys:
+        r.delete(*keys)
+    print(f"Cleared {len(keys)} Redis keys for {university_name}")
+
+def crawl_frontier_size(redis_url, university_name):
+    """Number of requests waiting in a university's scheduler queue."""
+    r = redis.from_url(redis_url)
+    key = f"university_spider_{university_name}:requests"
+    key_type = r.type(key)
+    if key_type == b"zset":
+        return r.zcard(key)
+    if key_type == b"list":
+        return r.llen(key)
+    return 0
+
+def clear_crawl_queues(redis_url, university_name):
+    """Deletes a university's request queue, dupefilter and start URLs but keeps its page state."""
+    r = redis.from_url(redis_url)
+    prefix = f"university_spider_{university_name}"
+    keys = [f"{prefix}:requests"]
+    # Covers the plain set and the Bloom filter bitmaps (<key>:bloom:*)
+    keys.extend(r.scan_iter(match=f"{prefix}:dupefilter*"))
+    keys.extend(r.scan_iter(match=f"{prefix}_[0-9]*:start_urls"))
+    if keys:
+        r.delete(*keys)
+    print(f"Cleared crawl queues for {university_name}")
+
 def add_to_redis(start_url, redis_url, count, university_name):
     r = redis.from_url(redis_url)
     # Crawler IDs are 1-based in start_crawlers.py
@@ -0,0 +1,17 @@
+from scrapy.utils.serialize import ScrapyJSONEncoder
+
+_encoder = ScrapyJSONEncoder()
+
+# Heavy fields that are only needed while the item moves through the pipelines
+HEAVY_FIELDS = ("html", "links", "embeddings", "sections", "chunk_ids")
+
+
+def serialize_lean_item(item):
+    """
+    REDIS_ITEMS_SERIALIZER for scrapy_redis' RedisPipeline: stores the page
+    record without raw HTML, links or embedding vectors.
+    """
+    lean = {key: value for key, value in dict(item).items() if key not in HEAVY_FIELDS}
+    if "embeddings" in item:
+        lean["chunk_count"] = len(item["embeddings"])
+    return _encoder.encode(lean)
@@ -0,0 +1,48 @@
+import hashlib
+import re
+from collections import Counter
+
+_WORD = re.compile(r"\w+")
+
+FINGERPRINT_BITS = 64
+
+
+def shingles(text, size=4):
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return Counter([" ".join(words)]) if words else Counter()
+    return Counter(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def simhash(text, shingle_size=4):
+    """64-bit SimHash of the word shingles in `text`, weighted by shingle frequency."""
+    weights = [0] * FINGERPRINT_BITS
+    for shingle, count in shingles(text, shingle_size).items():
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += count if h >> bit & 1 else -count
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def bands(fingerprint, band_count):
+    """
+    Splits a fingerprint into `band_count` bit ranges. Two fingerprints within
+    `band_count - 1` bits of each other share at least one band exactly, which
+    makes the bands usable as LSH buckets.
+    """
+    width = FINGERPRINT_BITS // band_count
+    result = []
+    for band in range(band_count):
+        start = band * width
+        end = FINGERPRINT_BITS if band == band_count - 1 else start + width
+        result.append((fingerprint >> start) & ((1 << (end - start)) - 1))
+    return result
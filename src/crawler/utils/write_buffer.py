@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import time
+
+from twisted.internet import defer, task, threads
+from twisted.python.threadpool import ThreadPool
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("documents", "metadatas", "ids", "embeddings", "delete_urls")
+
+
+def empty_batch():
+    return {field: [] for field in FIELDS}
+
+
+class WriteBehindBuffer:
+    """
+    Buffers vector store records across items and writes them in large batches
+    on a single background thread. `name` prefixes the stats keys and log
+    messages, so several stores can each have their own buffer.
+
+    A flush happens when `flush_size` records are buffered, every
+    `flush_interval` seconds, and on close. A failed batch is retried with
+    exponential backoff; if it still fails at close it is spilled to
+    `spill_path` as JSON lines so no records are lost.
+
+    URLs queued with `delete_url` are deleted at the start of the next flush,
+    before that batch's records are written.
+
+    Each successful write adds its duration to `<name>/flush_ms_total` and
+    `<name>/flush_ms_max`, and the time its oldest record spent between
+    `add` and being written to `<name>/buffered_ms_max`.
+    """
+
+    def __init__(self, write_fn, flush_size=512, flush_interval=5.0, max_retries=3, retry_delay=1.0,
+                 spill_path=None, stats=None, name="vector_store"):
+        self.write_fn = write_fn
+        self.name = name
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.spill_path = spill_path
+        self.stats = stats
+
+        self._buffer = empty_batch()
+        # When the oldest record in the buffer was added
+        self._buffered_at = None
+        self._in_flight = set()
+        self._failed = []
+        self._pool = None
+        self._loop = None
+        self._reactor = None
+
+    def __len__(self):
+        return len(self._buffer["ids"])
+
+    def start(self):
+        from twisted.internet import reactor
+        self._reactor = reactor
+        # One writer thread keeps batches ordered and avoids concurrent SQLite writes
+        self._pool = ThreadPool(minthreads=1, maxthreads=1, name=f"{self.name}-writer")
+        self._pool.start()
+        self._loop = task.LoopingCall(self.flush)
+        self._loop.start(self.flush_interval, now=False)
+
+    def add(self, documents, metadatas, ids, embeddings):
+        if self._buffered_at is None:
+            self._buffered_at = time.perf_counter()
+        self._buffer["documents"].extend(documents)
+        self._buffer["metadatas"].extend(metadatas)
+        self._buffer["ids"].extend(ids)
+        self._buffer["embeddings"].extend(embeddings)
+        self._max_value(f"{self.name}/buffered_max", len(self))
+        if len(self) >= self.flush_size:
+            self.flush()
+
+    def delete_url(self, url):
+        # Records for the URL still in the buffer are superseded too
+        keep = [i for i, metadata in enumerate(self._buffer["metadatas"]) if metadata.get("url") != url]
+        if len(keep) != len(self):
+            for field in ("documents", "metadatas", "ids", "embeddings"):
+                self._buffer[field] = [self._buffer[field][i] for i in keep]
+        self._buffer["delete_urls"].append(url)
+
+    def flush(self):
+        if not len(self) and not self._buffer["delete_urls"]:
+            return
+        batch, self._buffer = self._buffer, empty_batch()
+        batch_started, self._buffered_at = self._buffered_at, None
+        d = self._write(batch, attempt=0, buffered_at=batch_started)
+        self._in_flight.add(d)
+        d.addBoth(self._forget, d)
+
+    def close(self):
+        """Flushes the buffer, waits for pending writes and retries failed batches once more."""
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+        self.flush()
+        d = defer.DeferredList(list(self._in_flight))
+        d.addCallback(self._final_retry)
+        d.addBoth(self._stop_pool)
+        return d
+
+    # ---------- Internals ----------
+    def _forget(self, result, d):
+        self._in_flight.discard(d)
+        return result
+
+    def _write(self, batch, attempt, buffered_at=None):
+        d = threads.deferToThreadPool(self._reactor, self._pool, self._timed_write, batch)
+        d.addCallbacks(self._on_written, self._on_write_failed,
+                       callbackArgs=(batch, buffered_at), errbackArgs=(batch, attempt, buffered_at))
+        return d
+
+    def _timed_write(self, batch):
+        # Runs on the writer thread, so the time excludes waiting behind earlier batches
+        start = time.perf_counter()
+        self.write_fn(batch)
+        return time.perf_counter() - start
+
+    def _on_written(self, seconds, batch, buffered_at):
+        self._inc(f"{self.name}/flushes")
+        self._inc(f"{self.name}/records_written", len(batch["ids"]))
+        self._max_value(f"{self.name}/flush_size_max", len(batch["ids"]))
+        self._inc(f"{self.name}/flush_ms_total", seconds * 1000)
+        self._max_value(f"{self.name}/flush_ms_max", seconds * 1000)
+        if buffered_at is not None:
+            self._max_value(f"{self.name}/buffered_ms_max", (time.perf_counter() - buffered_at) * 1000)
+
+    def _on_write_failed(self, failure, batch, attempt, buffered_at=None):
+        self._inc(f"{self.name}/flush_errors")
+        if attempt >= self.max_retries:
+            logger.error(f"{self.name} write of {len(batch['ids'])} records failed after {attempt + 1} attempts: {failure.value}")
+            self._failed.append(batch)
+            return None
+
+        delay = self.retry_delay * (2 ** attempt)
+        logger.warning(f"{self.name} write failed ({failure.value}), retrying in {delay:.1f}s")
+        return task.deferLater(self._reactor, delay, self._write, batch, attempt + 1, buffered_at)
+
+    def _final_retry(self, _):
+        if not self._failed:
+            return None
+        failed, self._failed = self._failed, []
+        retries = [self._write(batch, attempt=self.max_retries) for batch in failed]
+        d = defer.DeferredList(retries)
+        d.addCallback(self._spill_failed)
+        return d
+
+    def _spill_failed(self, _):
+        if not self._failed:
+            return
+        if not self.spill_path:
+            logger.error(f"Dropping {sum(len(b['ids']) for b in self._failed)} unwritten records (no spill path set)")
+            return
+        os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+        with open(self.spill_path, "a") as f:
+            for batch in self._failed:
+                f.write(json.dumps(batch) + "\n")
+        spilled = sum(len(b["ids"]) for b in self._failed)
+        self._inc(f"{self.name}/records_spilled", spilled)
+        logger.error(f"Spilled {spilled} unwritten records to {self.spill_path}")
+        self._failed = []
+
+    def _stop_pool(self, result):
+        if self._pool is not None:
+            self._pool.stop()
+            self._pool = None
+        return result
+
+    def _inc(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(key, count)
+
+    def _max_value(self, key, value):
+        if self.stats is not None:
+            self.stats.max_value(key, value)
@@ -1,63 +1,206 @@
 from langchain_ollama.embeddings import OllamaEmbeddings
-from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
 from langchain_core.documents import Document
-from utils.general_utils import SearchResult
+from utils.general_utils import SemanticSearchResult
 from loguru import logger
-import uuid
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+import json
+import threading
+import time
 
+import numpy as np
+
+
+@dataclass
+class CacheEntry:
+    query: str
+    result: str
+    sources: list[dict]
+    version: str | None
+    expires: float
+    size: int
+    last_used: float = 0.0
+
+
+@dataclass
+class Namespace:
+    # Slot i of `vectors` belongs to entries[i]; freed slots are reused and masked out of searches
+    vectors: np.ndarray
+    expires: np.ndarray
+    entries: OrderedDict[int, CacheEntry] = field(default_factory=OrderedDict)
+    free: list[int] = field(default_factory=list)
+    used: int = 0
+    version: str | None = None
 
 
 class SemanticCache:
-    def __init__(self, chroma_db_path: str = './chroma_cache', threshold: float = 0.45):
-        self.chroma_db_path: str = chroma_db_path
-        self.embeddings: OllamaEmbeddings = self._initialize_embeddings()
-        self.vector_store: Chroma = self._initialize_chroma(self.chroma_db_path)
-        
+    """
+    In-process semantic cache of answered queries, one namespace per university.
+
+    - A lookup returns the most similar cached query if its cosine
+      similarity is at least `threshold`.
+    - Each namespace holds at most `max_entries`, and all namespaces
+      together about `max_bytes` (vectors plus stored answers); the least
+      recently used entries are evicted first.
+    - Entries expire `ttl_seconds` after they are written.
+    - Entries are tagged with the collection's ingestion version. When a
+      lookup arrives with a different version (the crawler bumps it after
+      every ingest) the namespace is emptied; writes made under the old
+      version are dropped.
+    """
+
+    def __init__(self, threshold: float = 0.8, max_entries: int = 10_000, max_bytes: int = 256 * 1024 * 1024,
+                 ttl_seconds: float = 24 * 3600, embeddings: Embeddings | None = None):
         self.threshold = threshold
-    
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # Pass the engine's QueryEmbedder so queries aren't embedded again here
+        self.embeddings: Embeddings = embeddings or self._initialize_embeddings()
+        self.namespaces: dict[str, Namespace] = {}
+        self.bytes = 0
+        self.stats: Counter = Counter()
+        self._lock = threading.Lock()
+
     def _initialize_embeddings(self) -> OllamaEmbeddings:
         logger.info("Initializing embedding model.")
         embeddings = OllamaEmbeddings(model = 'mxbai-embed-large')
         logger.info("Model Initialized!")
         return embeddings
-    
-    def _initialize_chroma(self, path) -> Chroma:
-        logger.info("Initializing Chroma DB.")
-        chroma = Chroma("cache_db", persist_directory = path, embedding_function = self.embeddings)
-        logger.info("Chroma Initialized!")
-        return chroma
-    
-    def search(self, query):
-        results = self.vector_store.similarity_search_with_score(query, k = 1)
-        
-        if not results:
-            return None
-        
-        # Check threshold
-        
-        best_doc, score = results[0]
-        
-        if score < self.threshold:
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) + 1e-12)
+
+    def _namespace(self, name: str, dim: int, version: str | None) -> Namespace:
+        namespace = self.namespaces.get(name)
+        if namespace is None:
+            namespace = Namespace(vectors=np.zeros((64, dim), dtype=np.float32), expires=np.zeros(64), version=version)
+            self.namespaces[name] = namespace
+        elif version != namespace.version:
+            logger.info(f"Ingestion version of {name} changed ({namespace.version} -> {version}); dropping {len(namespace.entries)} cached answers")
+            self.stats["invalidated"] += len(namespace.entries)
+            self._clear(namespace)
+            namespace.version = version
+        return namespace
+
+    def _clear(self, namespace: Namespace) -> None:
+        for entry in namespace.entries.values():
+            self.bytes -= entry.size
+        namespace.entries.clear()
+        namespace.free.clear()
+        namespace.used = 0
+        namespace.expires[:] = 0
+
+    def _remove(self, namespace: Namespace, slot: int) -> None:
+        entry = namespace.entries.pop(slot)
+        self.bytes -= entry.size
+        namespace.expires[slot] = 0
+        namespace.free.append(slot)
+
+    def search(self, namespace: str, query: str, embedding: list[float] | None = None,
+               version: str | None = None) -> SemanticSearchResult | None:
+        vector = self._normalize(embedding if embedding is not None else self.embeddings.embed_query(query))
+        with self._lock:
+            self.stats["lookups"] += 1
+            cache = self._namespace(namespace, len(vector), version)
+            if not cache.entries:
+                self.stats["misses"] += 1
+                return None
+
+            similarities = cache.vectors[:cache.used] @ vector
+            # Free and expired slots can never match
+            similarities[cache.expires[:cache.used] <= time.time()] = -np.inf
+            slot = int(np.argmax(similarities))
+            similarity = float(similarities[slot])
+
+            if similarity < self.threshold:
+                self.stats["misses"] += 1
+                logger.info(f"Cache Miss (best similarity {similarity:.3f} < {self.threshold}).")
+                return None
+
+            entry = cache.entries[slot]
+            entry.last_used = time.time()
+            cache.entries.move_to_end(slot)
+            self.stats["hits"] += 1
             logger.info("Cache Hit!")
-            result = SearchResult(score, best_doc)
-            return result
-        
-        logger.info("Cache Miss (Score too high/distance too far).")
-        return None
-        
-    def cache(self, query: str, result: str) -> bool:
-        doc = Document(
-            page_content = query,
-            metadata = {
-                "model_result": result
-            },
-            id = str(uuid.uuid4())
-        )
-        
-        ids = self.vector_store.add_documents([doc])
-        
-        if len(ids) > 0:
-            logger.info(f"Cached query with ID: {ids[0]}")
-            return True
-        
-        return False
\ No newline at end of file
+            doc = Document(
+                page_content = entry.query,
+                metadata = {"model_result": entry.result, "sources": entry.sources, "version": entry.version},
+            )
+            return SemanticSearchResult(similarity, doc)
+
+    def cache(self, namespace: str, query: str, result: str, sources: list[dict] | None = None,
+              embedding: list[float] | None = None, version: str | None = None) -> bool:
+        vector = self._normalize(embedding if embedding is not None else self.embeddings.embed_query(query))
+        sources = sources or []
+        size = vector.nbytes + len(query) + len(result or "") + len(json.dumps(sources))
+        with self._lock:
+            current = self.namespaces.get(namespace)
+            if current is not None and current.version != version:
+                # Answered from an index version a lookup has since replaced; don't let it flip the namespace back
+                self.stats["stale_writes"] += 1
+                return False
+            cache = self._namespace(namespace, len(vector), version)
+            self._purge_expired(cache)
+
+            if cache.free:
+                slot = cache.free.pop()
+            else:
+                if cache.used == len(cache.vectors):
+                    cache.vectors = np.concatenate([cache.vectors, np.zeros_like(cache.vectors)])
+                    cache.expires = np.concatenate([cache.expires, np.zeros_like(cache.expires)])
+                slot = cache.used
+                cache.used += 1
+
+            now = time.time()
+            entry = CacheEntry(query, result, sources, version, now + self.ttl_seconds, size, now)
+            cache.vectors[slot] = vector
+            cache.expires[slot] = entry.expires
+            cache.entries[slot] = entry
+            self.bytes += size
+            self.stats["writes"] += 1
+
+            while len(cache.entries) > self.max_entries:
+                self._remove(cache, next(iter(cache.entries)))
+                self.stats["evicted"] += 1
+            self._evict_to_memory_bound()
+
+        logger.info(f"Cached query in {namespace} ({len(self.namespaces[namespace].entries)} entries, {self.bytes / 1e6:.1f}MB)")
+        return True
+
+    def _purge_expired(self, namespace: Namespace) -> None:
+        expires = namespace.expires[:namespace.used]
+        # Free slots have expires == 0
+        for slot in np.flatnonzero((expires > 0) & (expires <= time.time())).tolist():
+            self._remove(namespace, slot)
+            self.stats["expired"] += 1
+
+    def _evict_to_memory_bound(self) -> None:
+        # Evict the least recently used entry of whichever namespace's is oldest; namespaces are few
+        while self.bytes > self.max_bytes:
+            victims = [namespace for namespace in self.namespaces.values() if namespace.entries]
+            if not victims:
+                return
+            oldest = min(victims, key=lambda namespace: next(iter(namespace.entries.values())).last_used)
+            self._remove(oldest, next(iter(oldest.entries)))
+            self.stats["evicted"] += 1
+
+    def invalidate(self, namespace: str | None = None) -> None:
+        """Drops one namespace's entries, or every namespace's."""
+        with self._lock:
+            for name, cache in self.namespaces.items():
+                if namespace is None or name == namespace:
+                    self.stats["invalidated"] += len(cache.entries)
+                    self._clear(cache)
+
+    def report(self) -> dict:
+        lookups = self.stats["lookups"]
+        return {
+            **self.stats,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "entries": sum(len(namespace.entries) for namespace in self.namespaces.values()),
+            "bytes": self.bytes,
+        }
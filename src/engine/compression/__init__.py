@@ -0,0 +1,3 @@
+from .context import CompressedContext, ContextCompressor, count_tokens, format_uncompressed
+
+__all__ = ["CompressedContext", "ContextCompressor", "count_tokens", "format_uncompressed"]
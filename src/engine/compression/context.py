@@ -0,0 +1,161 @@
+import math
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+import numpy as np
+from langchain_core.documents import Document
+
+from retrieval.lexical_index import tokenize
+
+# Header EmbeddingPipeline.make_document puts in front of each page's first chunk. The splitter
+# breaks on blank lines, so a chunk can also hold just the Title/URL part or start at "Content:".
+HEADER_RE = re.compile(r"^\s*(?:Title:[^\n]*\n\s*\nURL:[^\n]*(?:\n\s*\n|$))?(?:Content:[ \t]*)?")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def count_tokens(text: str) -> int:
+    # About 4 characters per token for English with llama-style tokenizers; close enough for a budget
+    return math.ceil(len(text) / 4)
+
+
+def strip_header(text: str) -> str:
+    return HEADER_RE.sub("", text, count=1)
+
+
+def citation(doc: Document) -> str:
+    """A chunk's source as "title (url)", with the heading path after the title for section chunks."""
+    url = doc.metadata.get("url")
+    title = doc.metadata.get("title") or url
+    headings = doc.metadata.get("headings")
+    return f"{title} > {headings} ({url})" if headings else f"{title} ({url})"
+
+
+def split_sentences(text: str) -> list[str]:
+    return [sentence.strip() for sentence in SENTENCE_RE.split(text) if sentence and sentence.strip()]
+
+
+@dataclass
+class CompressedContext:
+    text: str
+    # One entry per cited document: {"id": n, "url": ..., "title": ...}, matching the [n] markers in text
+    sources: list[dict] = field(default_factory=list)
+    tokens_before: int = 0
+    tokens_after: int = 0
+    seconds: float = 0.0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+class ContextCompressor:
+    """
+    Shrinks retrieved chunks to the sentences that matter for the query
+    before they go into the prompt.
+
+    - The Title/URL header is stripped; the source is cited once per
+      document as "[n] title (url)" instead, or "[n] title > headings (url)"
+      for chunks the crawler cut along the page's sections.
+    - Sentences repeated by the chunk overlap, and fragments of sentences
+      already kept, are dropped.
+    - Sentences are ranked by similarity to the query: cosine similarity
+      when `embed_fn` is given, otherwise IDF-weighted term overlap. A
+      small bonus keeps higher-ranked documents ahead on ties.
+    - Sentences scoring at least `min_similarity` are taken best first
+      until `token_budget` is reached, then put back in reading order under
+      their document's citation.
+    """
+
+    def __init__(self, token_budget: int = 1200, embed_fn: Callable[[list[str]], list[list[float]]] | None = None,
+                 min_similarity: float = 0.05, rank_weight: float = 0.1):
+        self.token_budget = token_budget
+        self.embed_fn = embed_fn
+        self.min_similarity = min_similarity
+        self.rank_weight = rank_weight
+
+    def compress(self, query: str, docs: list[Document]) -> CompressedContext:
+        start = time.perf_counter()
+        tokens_before = sum(count_tokens(doc.page_content) for doc in docs)
+
+        # (doc index, position, sentence) with overlap duplicates removed
+        candidates = []
+        kept_keys: list[str] = []
+        for d, doc in enumerate(docs):
+            for position, sentence in enumerate(split_sentences(strip_header(doc.page_content))):
+                key = " ".join(sentence.lower().split())
+                if len(key) < 3 or any(key in other for other in kept_keys):
+                    continue
+                kept_keys.append(key)
+                candidates.append((d, position, sentence))
+
+        similarities = self._score(query, [sentence for _, _, sentence in candidates])
+        eligible = [i for i, similarity in enumerate(similarities) if similarity >= self.min_similarity]
+        if not eligible:
+            # Nothing resembles the query (e.g. it was all stopwords): fall back to retrieval order
+            eligible = list(range(len(candidates)))
+        # Earlier (better retrieved) documents win ties
+        scores = [similarity + self.rank_weight / (1 + d) for similarity, (d, _, _) in zip(similarities, candidates)]
+
+        selected = []
+        used = 0
+        for i in sorted(eligible, key=scores.__getitem__, reverse=True):
+            cost = count_tokens(candidates[i][2])
+            if used + cost > self.token_budget:
+                continue
+            selected.append(i)
+            used += cost
+
+        by_doc: dict[int, list[tuple[int, str]]] = {}
+        for i in selected:
+            d, position, sentence = candidates[i]
+            by_doc.setdefault(d, []).append((position, sentence))
+
+        blocks, sources = [], []
+        for d in sorted(by_doc):
+            doc = docs[d]
+            source_id = len(sources) + 1
+            url = doc.metadata.get("url")
+            title = doc.metadata.get("title") or url
+            sources.append({"id": source_id, "url": url, "title": title})
+            body = " ".join(sentence for _, sentence in sorted(by_doc[d]))
+            blocks.append(f"[{source_id}] {citation(doc)}\n{body}")
+
+        text = "\n\n---\n\n".join(blocks)
+        return CompressedContext(
+            text=text,
+            sources=sources,
+            tokens_before=tokens_before,
+            tokens_after=count_tokens(text),
+            seconds=time.perf_counter() - start,
+        )
+
+    def _score(self, query: str, sentences: list[str]) -> list[float]:
+        if not sentences:
+            return []
+        if self.embed_fn is not None:
+            vectors = np.asarray(self.embed_fn([query] + sentences), dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+            return (vectors[1:] @ vectors[0]).tolist()
+
+        query_terms = set(tokenize(query))
+        sentence_terms = [set(tokenize(sentence)) for sentence in sentences]
+        # IDF over the retrieved sentences: terms in every sentence say little about relevance
+        n = len(sentences)
+        idf = {term: math.log(1 + n / (1 + sum(term in terms for terms in sentence_terms))) for term in query_terms}
+        total = sum(idf.values()) or 1.0
+        return [sum(idf[term] for term in query_terms & terms) / total for terms in sentence_terms]
+
+
+def format_uncompressed(docs: list[Document]) -> CompressedContext:
+    """The whole retrieved chunks with citations, for when compression is off."""
+    blocks, sources = [], []
+    for i, doc in enumerate(docs, start=1):
+        url = doc.metadata.get("url")
+        title = doc.metadata.get("title") or url
+        sources.append({"id": i, "url": url, "title": title})
+        blocks.append(f"[{i}] {citation(doc)}\n{doc.page_content}")
+    text = "\n\n---\n\n".join(blocks)
+    tokens = count_tokens(text)
+    return CompressedContext(text=text, sources=sources, tokens_before=tokens, tokens_after=tokens)
@@ -3,16 +3,26 @@ from langchain_ollama import OllamaLLM
 from langchain_ollama.embeddings import OllamaEmbeddings
 from langchain_core.runnables import RunnablePassthrough, RunnableParallel, RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 from operator import itemgetter
-from langchain_community.retrievers import BM25Retriever  # pyright: ignore[reportMissingImports]
 from loguru import logger  # pyright: ignore[reportMissingImports]
 import os
 import sys
+import time
 from dataclasses import dataclass
+from typing import AsyncIterator, Iterator
 
-from utils.general_utils import NormalSearchResult
+from utils.general_utils import NormalSearchResult, StreamEvent
+from retrieval import LexicalIndex, QuantizedIndex, QueryEmbedder, reciprocal_rank_fusion
+from rerank import CrossEncoderReranker, load_cross_encoder
+from compression import ContextCompressor, format_uncompressed
 from tests.verify_chromadb_exists import verify_chromadb_exists
+from tracing import span
+
+# Rough per-chunk HNSW overhead on top of the vector itself (links at M=16, ids, labels)
+HNSW_OVERHEAD_BYTES = 200
+
 @dataclass
 class SearchConfig:
     db_path: str = "../../chroma_langchain_db"
@@ -20,20 +30,48 @@ class SearchConfig:
     embedding_model: str = "mxbai-embed-large"
     llm_model: str = "llama3.2"
     top_k: int = 5
-
-def format_docs(docs):
-    return "\n\n---\n\n".join(doc.page_content for doc in docs)
+    # LRU of query -> embedding, shared with the semantic cache when run under UniversityEngine
+    query_embedding_cache_size: int = 1024
+    # Dense index: "chroma", or "quantized" for the crawler's memory-mapped int8/binary index
+    vector_backend: str = "chroma"
+    quantized_index_dir: str = "../../quantized_index"
+    quantization: str = "int8"
+    ivf_nprobe: int = 16
+    # Hybrid retrieval: BM25 candidates from the crawler's lexical index fused with dense results
+    hybrid: bool = True
+    lexical_index_dir: str = "../../lexical_index"
+    candidate_k: int = 20
+    rrf_k: int = 60
+    # Cross-encoder reranking of rerank_candidates first-stage results ("stub" model for tests)
+    rerank: bool = True
+    rerank_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    rerank_candidates: int = 30
+    rerank_budget_ms: float = 250.0
+    rerank_cache_size: int = 10_000
+    # Extractive compression of the retrieved chunks down to context_token_budget prompt tokens
+    compress: bool = True
+    context_token_budget: int = 1200
 
 class NormalSearch:
-    def __init__(self, config: SearchConfig):
+    def __init__(self, config: SearchConfig, embeddings: QueryEmbedder | None = None, llm: OllamaLLM | None = None,
+                 reranker: CrossEncoderReranker | None = None, chroma_client=None):
+        # The optional clients let a TenantRegistry share one of each across universities
         self.config = config
         self._validate_paths()
         
         logger.info(f"Initializing NormalSearch with config: {self.config}")
         
-        self.embeddings = OllamaEmbeddings(model=self.config.embedding_model)
-        self.vector_store = self._initialize_chroma(self.config.db_path, self.config.university_name)
-        self.llm = OllamaLLM(model=self.config.llm_model)
+        self.embeddings = embeddings or QueryEmbedder(
+            OllamaEmbeddings(model=self.config.embedding_model), cache_size=self.config.query_embedding_cache_size
+        )
+        if self.config.vector_backend == "quantized":
+            self.vector_store = self._initialize_quantized()
+        else:
+            self.vector_store = self._initialize_chroma(self.config.db_path, self.config.university_name, chroma_client)
+        self.lexical_index = LexicalIndex.open(self.config.lexical_index_dir, self.config.university_name) if self.config.hybrid else None
+        self.reranker = (reranker or self._initialize_reranker()) if self.config.rerank else None
+        self.compressor = ContextCompressor(token_budget=self.config.context_token_budget) if self.config.compress else None
+        self.llm = llm or OllamaLLM(model=self.config.llm_model)
         
         
         # Uncomment to test the vector store
@@ -54,6 +92,7 @@ class NormalSearch:
         - If the answer is not in the context, state that you do not know.
         - Use bullet points for clarity.
         - Be concise.
+        - Cite the sources you use by their [number].
         """
         
         # Using the standard ChatPromptTemplate.from_messages syntax
@@ -63,55 +102,256 @@ class NormalSearch:
         ])
 
     def _build_chain(self):
-        retriever = self._get_retriever()
+        self.retriever = self._get_retriever()
         prompt = self._get_prompt_template()
 
         retrieval_step = RunnableParallel(
-            {"docs": itemgetter("question") | retriever, "question": itemgetter("question")}
+            {"docs": RunnableLambda(lambda x: self.retrieve(x["question"], x.get("embedding"), x.get("dense"))), "question": itemgetter("question")}
         )
 
-        answer_step = RunnablePassthrough.assign(
-            answer=(
-                RunnablePassthrough.assign(
-                    context=itemgetter("docs") | RunnableLambda(format_docs)
-                )
-                | prompt
-                | self.llm
-                | StrOutputParser()
+        compression_step = RunnablePassthrough.assign(context=RunnableLambda(self._compress))
+
+        # Kept separate so streaming can emit sources between the two halves
+        self.context_chain = retrieval_step | compression_step
+        self.answer_chain = (
+            RunnablePassthrough.assign(
+                context=lambda x: x["context"].text
             )
+            | RunnableLambda(lambda x: self._build_prompt(prompt, x))
+            | self.llm
+            | StrOutputParser()
         )
 
-        chain = retrieval_step | answer_step
+        chain = self.context_chain | RunnablePassthrough.assign(answer=self.answer_chain)
         
         return chain
     
+    def _first_stage_k(self) -> int:
+        # Over-retrieve when a reranker will pick the final top_k
+        return self.config.rerank_candidates if self.reranker is not None else self.config.top_k
+
     def _get_retriever(self):
-        return self.vector_store.as_retriever(
-            search_type = "similarity", 
-            search_kwargs = {"k": self.config.top_k}
+        # Takes {"question", "embedding", "dense"} so the query vector, and optionally the dense results, are computed upstream
+        if self.lexical_index is None:
+            return RunnableLambda(self._dense_search)
+
+        # Both searches run concurrently; fusion only needs their ranks
+        return RunnableParallel(
+            {"dense": RunnableLambda(self._dense_search), "lexical": itemgetter("question") | RunnableLambda(self._lexical_search)}
+        ) | RunnableLambda(self._fuse)
+
+    def dense_k(self) -> int:
+        return self._first_stage_k() if self.lexical_index is None else max(self.config.candidate_k, self._first_stage_k())
+
+    def _dense_search(self, inputs: dict):
+        if inputs.get("dense") is not None:
+            return inputs["dense"]
+        with span("dense_search"):
+            return self.vector_store.similarity_search_by_vector(inputs["embedding"], k = self.dense_k())
+
+    def dense_search_many(self, embeddings: list[list[float]]) -> list[list[Document]]:
+        """Dense results for several query vectors in one collection query, for batched serving."""
+        if self.config.vector_backend == "quantized":
+            return [[doc for doc, _ in hits] for hits in self.vector_store.search_many(embeddings, self.dense_k())]
+        results = self.vector_store._collection.query(
+            query_embeddings = embeddings, n_results = self.dense_k(), include = ["documents", "metadatas"]
         )
+        return [
+            [Document(page_content=text, metadata=metadata or {}, id=id) for text, metadata, id in zip(texts, metadatas, ids)]
+            for texts, metadatas, ids in zip(results["documents"], results["metadatas"], results["ids"])
+        ]
+
+    def _lexical_search(self, query: str):
+        with span("lexical_search"):
+            return [doc for doc, _ in self.lexical_index.search(query, max(self.config.candidate_k, self._first_stage_k()))]
+
+    def _fuse(self, results: dict):
+        with span("fusion"):
+            return reciprocal_rank_fusion(
+                [results["dense"], results["lexical"]], k = self.config.rrf_k, top_k = self._first_stage_k()
+            )
+
+    def _compress(self, inputs: dict):
+        with span("compress"):
+            if self.compressor is None:
+                return format_uncompressed(inputs["docs"])
+            return self.compressor.compress(inputs["question"], inputs["docs"])
+
+    def _build_prompt(self, prompt: ChatPromptTemplate, inputs: dict):
+        with span("prompt"):
+            return prompt.invoke(inputs)
+
+    def retrieve(self, question: str, embedding: list[float] | None = None, dense: list[Document] | None = None):
+        """
+        First-stage retrieval, then cross-encoder reranking down to top_k when enabled.
+        Pass `embedding` when the query vector is already known; otherwise it comes from the embedding LRU.
+        Pass `dense` when the dense results were fetched in a batch (see `dense_search_many`).
+        """
+        started = time.perf_counter()
+        if embedding is None and dense is None:
+            embedding = self.embeddings.embed_query(question)
+        docs = self.retriever.invoke({"question": question, "embedding": embedding, "dense": dense})
+        if self.reranker is None:
+            return docs
+        with span("rerank"):
+            # The rerank budget covers the whole retrieval, not just the cross-encoder
+            return self.reranker.rerank(question, docs, self.config.top_k, started=started)
     
+    def ingest_version(self) -> str | None:
+        """The collection's ingestion version, bumped by the crawler's VectorStorePipeline after each crawl."""
+        # Fetched fresh: the crawler changes it from another process
+        if self.config.vector_backend == "quantized":
+            return self.vector_store.ingest_version()
+        collection = self.vector_store._client.get_collection(self.config.university_name)
+        return (collection.metadata or {}).get("ingest_version")
+
+    def index_bytes(self) -> int:
+        """Estimated memory the dense index needs to be searched quickly."""
+        if self.config.vector_backend == "quantized":
+            return self.vector_store.resident_bytes()
+        collection = self.vector_store._collection
+        sample = collection.get(limit=1, include=["embeddings"])["embeddings"]
+        dim = len(sample[0]) if sample is not None and len(sample) else 0
+        return collection.count() * (dim * 4 + HNSW_OVERHEAD_BYTES)
+
+    def warm(self) -> None:
+        """Loads the dense index into memory ahead of the first query."""
+        if self.config.vector_backend == "quantized":
+            self.vector_store.warm()
+            return
+        sample = self.vector_store._collection.get(limit=1, include=["embeddings"])["embeddings"]
+        if sample is not None and len(sample):
+            self.vector_store.similarity_search_by_vector(list(sample[0]), k=1)
+
+    def close(self):
+        if self.lexical_index is not None:
+            self.lexical_index.close()
+        if self.config.vector_backend == "quantized":
+            self.vector_store.close()
+
     def _validate_paths(self):
         if not os.path.exists(self.config.db_path):
             logger.warning(f"Chroma DB path does not exist: {self.config.db_path}")
         
-    def _initialize_chroma(self, path, university_name) -> Chroma:
+    def _initialize_reranker(self) -> CrossEncoderReranker:
+        return CrossEncoderReranker(
+            load_cross_encoder(self.config.rerank_model),
+            cache_size = self.config.rerank_cache_size,
+            latency_budget_ms = self.config.rerank_budget_ms,
+        )
+
+    def _initialize_quantized(self) -> QuantizedIndex:
+        logger.info("Opening quantized index.")
+        index = QuantizedIndex.open(
+            self.config.quantized_index_dir, self.config.university_name,
+            quantization = self.config.quantization, nprobe = self.config.ivf_nprobe,
+        )
+        if index is None:
+            raise FileNotFoundError(f"No quantized index for {self.config.university_name} in {self.config.quantized_index_dir}")
+        return index
+
+    def _initialize_chroma(self, path, university_name, client=None) -> Chroma:
         logger.info("Initializing Chroma DB.")
-        chroma = Chroma(collection_name=university_name, persist_directory = path, embedding_function = self.embeddings)
+        if client is not None:
+            chroma = Chroma(collection_name=university_name, client = client, embedding_function = self.embeddings)
+        else:
+            chroma = Chroma(collection_name=university_name, persist_directory = path, embedding_function = self.embeddings)
         logger.info("Chroma Initialized!")
         return chroma
     
     
+    def _finish(self, response: dict, answer: str, start: float, retrieved: float,
+                first_token: float | None = None, tokens: int = 0) -> NormalSearchResult:
+        end = time.perf_counter()
+        context = response['context']
+        metrics = {"retrieval_s": retrieved - start, "total_s": end - start}
+        if first_token is not None:
+            # Ollama streams about one token per chunk
+            metrics["ttft_s"] = first_token - start
+            metrics["tokens"] = tokens
+            metrics["tokens_per_sec"] = tokens / (end - first_token) if end > first_token else 0.0
+            logger.info(f"First token after {metrics['ttft_s']:.2f}s; {tokens} tokens at {metrics['tokens_per_sec']:.1f} tokens/s")
+        logger.info(
+            f"Answered in {metrics['total_s']:.2f}s; context {context.tokens_before} -> "
+            f"{context.tokens_after} tokens ({context.tokens_saved} saved, compressed in {context.seconds * 1000:.1f}ms)"
+        )
+        return NormalSearchResult(answer, response['docs'], context.sources, metrics)
+
     def query(self, user_query) -> NormalSearchResult:
         logger.info(f"Querying: {user_query}")
         try:
-            response = self.rag_chain.invoke({"question": user_query})
-            output = NormalSearchResult(response['answer'], response['docs'])
+            start = time.perf_counter()
+            response = self.context_chain.invoke({"question": user_query})
+            retrieved = time.perf_counter()
+            answer = self.answer_chain.invoke(response)
+            output = self._finish(response, answer, start, retrieved)
             return output
         except Exception as e:
             logger.error(f"Error during query execution: {e}")
             return NormalSearchResult(None, "An error occurred while processing your request.")
-        
+
+    async def aretrieve_context(self, user_query, embedding: list[float] | None = None,
+                                dense: list[Document] | None = None) -> dict:
+        """Retrieval and compression only: {"question", "docs", "context"} for `agenerate`."""
+        return await self.context_chain.ainvoke({"question": user_query, "embedding": embedding, "dense": dense})
+
+    async def agenerate(self, response: dict, start: float, retrieved: float) -> NormalSearchResult:
+        """Answers from an `aretrieve_context` response; `start` and `retrieved` are perf_counter() values for the metrics."""
+        answer = await self.answer_chain.ainvoke(response)
+        return self._finish(response, answer, start, retrieved)
+
+    async def astream_answer(self, response: dict, start: float, retrieved: float) -> AsyncIterator[StreamEvent]:
+        """The "token" and "result" events for an `aretrieve_context` response."""
+        chunks, first_token = [], None
+        async for chunk in self.answer_chain.astream(response):
+            if not chunk:
+                continue
+            if first_token is None:
+                first_token = time.perf_counter()
+            chunks.append(chunk)
+            yield StreamEvent("token", chunk)
+        yield StreamEvent("result", self._finish(response, "".join(chunks), start, retrieved, first_token, len(chunks)))
+
+    def stream(self, user_query) -> Iterator[StreamEvent]:
+        """
+        Yields a "sources" event as soon as retrieval finishes, then a "token"
+        event per answer chunk as the model produces it, then a "result" event
+        with the assembled NormalSearchResult.
+        """
+        logger.info(f"Streaming: {user_query}")
+        try:
+            start = time.perf_counter()
+            response = self.context_chain.invoke({"question": user_query})
+            retrieved = time.perf_counter()
+            yield StreamEvent("sources", response['context'].sources)
+
+            chunks, first_token = [], None
+            for chunk in self.answer_chain.stream(response):
+                if not chunk:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter()
+                chunks.append(chunk)
+                yield StreamEvent("token", chunk)
+            yield StreamEvent("result", self._finish(response, "".join(chunks), start, retrieved, first_token, len(chunks)))
+        except Exception as e:
+            logger.error(f"Error during streaming query execution: {e}")
+            yield StreamEvent("result", NormalSearchResult(None, "An error occurred while processing your request."))
+
+    async def astream(self, user_query) -> AsyncIterator[StreamEvent]:
+        """Async version of `stream`, yielding the same events."""
+        logger.info(f"Streaming: {user_query}")
+        try:
+            start = time.perf_counter()
+            response = await self.context_chain.ainvoke({"question": user_query})
+            retrieved = time.perf_counter()
+            yield StreamEvent("sources", response['context'].sources)
+            async for event in self.astream_answer(response, start, retrieved):
+                yield event
+        except Exception as e:
+            logger.error(f"Error during streaming query execution: {e}")
+            yield StreamEvent("result", NormalSearchResult(None, "An error occurred while processing your request."))
+
 
 
 if __name__ == "__main__":
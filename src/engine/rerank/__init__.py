@@ -0,0 +1,4 @@
+from .models import StubCrossEncoder, load_cross_encoder
+from .reranker import CrossEncoderReranker, RerankStats
+
+__all__ = ["CrossEncoderReranker", "RerankStats", "StubCrossEncoder", "load_cross_encoder"]
@@ -0,0 +1,68 @@
+import json
+import sys
+import time
+from typing import Callable
+
+from langchain_core.documents import Document
+from loguru import logger
+
+from rerank.reranker import CrossEncoderReranker, percentile
+
+
+def recall_at_k(docs: list[Document], relevant_urls: set[str], k: int) -> float:
+    if not relevant_urls:
+        return 0.0
+    found = {doc.metadata.get("url") for doc in docs[:k]}
+    return len(found & relevant_urls) / len(relevant_urls)
+
+
+def evaluate(retrieve: Callable[[str], list[Document]], reranker: CrossEncoderReranker, labelled: list[dict], k: int = 5) -> dict:
+    """
+    Compares recall@k of first-stage retrieval with recall@k after reranking.
+
+    `labelled` is a list of {"query": ..., "relevant_urls": [...]} and
+    `retrieve` returns the over-retrieved candidates for a query.
+    """
+    first_stage, reranked, retrieval_ms = [], [], []
+    for example in labelled:
+        relevant = set(example["relevant_urls"])
+        start = time.perf_counter()
+        candidates = retrieve(example["query"])
+        retrieval_ms.append((time.perf_counter() - start) * 1000)
+        first_stage.append(recall_at_k(candidates, relevant, k))
+        reranked.append(recall_at_k(reranker.rerank(example["query"], candidates, k), relevant, k))
+
+    report = {
+        "queries": len(labelled),
+        "k": k,
+        f"recall@{k}_first_stage": sum(first_stage) / max(len(first_stage), 1),
+        f"recall@{k}_reranked": sum(reranked) / max(len(reranked), 1),
+        "retrieval_ms_p50": percentile(retrieval_ms, 0.50),
+        "retrieval_ms_p95": percentile(retrieval_ms, 0.95),
+    }
+    report.update({f"rerank_{key}": value for key, value in reranker.report().items()})
+    return report
+
+
+if __name__ == "__main__":
+    # python -m rerank.evaluate <labelled_queries.json> <university_name> [model]
+    from dataclasses import replace
+
+    from llm.normal_search import NormalSearch, SearchConfig
+    from rerank.models import load_cross_encoder
+
+    if len(sys.argv) < 3:
+        print("Usage: python -m rerank.evaluate <labelled_queries.json> <university_name> [model]")
+        sys.exit(1)
+
+    with open(sys.argv[1], "r") as f:
+        labelled = json.load(f)
+    config = SearchConfig(university_name=sys.argv[2], rerank=False)
+    model_name = sys.argv[3] if len(sys.argv) > 3 else config.rerank_model
+
+    # Over-retrieve with reranking off, then rerank those candidates here
+    search = NormalSearch(replace(config, top_k=config.rerank_candidates))
+    reranker = CrossEncoderReranker(load_cross_encoder(model_name), latency_budget_ms=config.rerank_budget_ms)
+    report = evaluate(search.retrieve, reranker, labelled, k=config.top_k)
+    logger.info(json.dumps(report, indent=2))
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,43 @@
+import re
+import time
+
+from loguru import logger
+
+STUB_MODEL = "stub"
+
+
+def load_cross_encoder(model_name: str, max_length: int = 512):
+    """Loads a sentence-transformers CrossEncoder on CPU, or the stub model when model_name is "stub"."""
+    if model_name == STUB_MODEL:
+        return StubCrossEncoder()
+    # Imported here so the engine still starts (and tests run) without torch installed
+    from sentence_transformers import CrossEncoder  # pyright: ignore[reportMissingImports]
+
+    logger.info(f"Loading cross-encoder {model_name}")
+    model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+    logger.info("Cross-encoder loaded!")
+    return model
+
+
+class StubCrossEncoder:
+    """
+    Stand-in for a CrossEncoder with the same `predict` interface. Scores a
+    (query, passage) pair by the fraction of query words found in the
+    passage, and can sleep `seconds_per_pair` to simulate inference cost
+    when testing the latency budget.
+    """
+
+    def __init__(self, seconds_per_pair: float = 0.0):
+        self.seconds_per_pair = seconds_per_pair
+        self.calls = 0
+
+    def predict(self, pairs, batch_size: int = 32, show_progress_bar: bool = False):
+        self.calls += 1
+        if self.seconds_per_pair:
+            time.sleep(self.seconds_per_pair * len(pairs))
+        scores = []
+        for query, passage in pairs:
+            words = set(re.findall(r"\w+", query.lower()))
+            found = set(re.findall(r"\w+", passage.lower()))
+            scores.append(len(words & found) / max(len(words), 1))
+        return scores
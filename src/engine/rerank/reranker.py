@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass
+
+from langchain_core.documents import Document
+from loguru import logger
+
+from retrieval.fusion import document_key
+
+
+@dataclass
+class RerankStats:
+    latency_ms: float
+    candidates: int
+    cached: int
+    scored: int
+    # "full", "partial" (budget ran out) or "fallback" (first-stage order)
+    mode: str
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CrossEncoderReranker:
+    """
+    Reranks first-stage candidates with a cross-encoder.
+
+    Uncached (query, chunk) pairs are scored in a single batched `predict`
+    call. Scores are kept in an LRU cache keyed by the normalized query and
+    chunk id, so repeated and popular queries skip inference.
+
+    Each query has a latency budget. The cost per pair is estimated from
+    previous calls; if scoring every candidate would overrun the budget,
+    only the best first-stage candidates that fit are scored and reranked,
+    and the rest keep their first-stage order after them. While any budget
+    is left at least the best candidate is scored, even if the estimate
+    says it won't fit. With no time left at all, the first-stage order is
+    returned unchanged.
+    """
+
+    def __init__(self, model, batch_size: int = 32, cache_size: int = 10_000, latency_budget_ms: float = 250.0,
+                 initial_seconds_per_pair: float = 0.005, history: int = 1000):
+        self.model = model
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.latency_budget = latency_budget_ms / 1000
+        self.seconds_per_pair = initial_seconds_per_pair
+        self._cache: OrderedDict[tuple[str, str], float] = OrderedDict()
+        # One reranker serves every tenant from asyncio.to_thread workers
+        self._lock = threading.Lock()
+        self.history: deque[RerankStats] = deque(maxlen=history)
+
+    @staticmethod
+    def _normalize(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def _cached(self, key: tuple[str, str]) -> float | None:
+        with self._lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _store(self, key: tuple[str, str], score: float) -> None:
+        with self._lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rerank(self, query: str, docs: list[Document], top_k: int | None = None, started: float | None = None) -> list[Document]:
+        """
+        Returns `docs` reordered by cross-encoder score, best first, cut to top_k.
+        `started` (a time.perf_counter() value) lets the budget include time already spent retrieving.
+        """
+        start = time.perf_counter()
+        started = started if started is not None else start
+        normalized = self._normalize(query)
+        keys = [(normalized, document_key(doc)) for doc in docs]
+
+        scores: dict[int, float] = {}
+        for i, key in enumerate(keys):
+            score = self._cached(key)
+            if score is not None:
+                scores[i] = score
+        cached = len(scores)
+
+        # Candidates arrive in first-stage order, so when the budget is short the best ones get scored
+        missing = [i for i in range(len(docs)) if i not in scores]
+        remaining = self.latency_budget - (time.perf_counter() - started)
+        fits = max(0, int(remaining / self.seconds_per_pair)) if self.seconds_per_pair > 0 else len(missing)
+        if remaining > 0:
+            # Scoring at least one pair keeps the estimate measured, so one slow call can't switch reranking off for good
+            fits = max(1, fits)
+        to_score = missing[:fits]
+
+        if to_score:
+            inference_start = time.perf_counter()
+            pairs = [(query, docs[i].page_content) for i in to_score]
+            predicted = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            elapsed = time.perf_counter() - inference_start
+            # The per-pair cost estimate decides how much fits in the next query's budget. It rises
+            # immediately on a slower call, so one overrun isn't repeated, and decays slowly.
+            observed = elapsed / len(pairs)
+            if observed > self.seconds_per_pair:
+                self.seconds_per_pair = observed
+            else:
+                self.seconds_per_pair = 0.8 * self.seconds_per_pair + 0.2 * observed
+            for i, score in zip(to_score, predicted):
+                scores[i] = float(score)
+                self._store(keys[i], float(score))
+
+        if len(scores) == len(docs):
+            mode = "full"
+        elif scores:
+            mode = "partial"
+        else:
+            mode = "fallback"
+
+        # Scored candidates are reranked among themselves; unscored ones follow in first-stage order
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        ranked += [i for i in range(len(docs)) if i not in scores]
+        result = [docs[i] for i in ranked][:top_k]
+
+        stats = RerankStats(
+            latency_ms=(time.perf_counter() - start) * 1000,
+            candidates=len(docs),
+            cached=cached,
+            scored=len(to_score),
+            mode=mode,
+        )
+        self.history.append(stats)
+        if mode != "full":
+            logger.warning(f"Rerank budget exhausted: {mode} rerank, scored {cached + len(to_score)}/{len(docs)} candidates")
+        logger.info(f"Reranked {len(docs)} candidates in {stats.latency_ms:.1f}ms ({cached} cached, {len(to_score)} scored)")
+        return result
+
+    def report(self) -> dict:
+        """Latency percentiles, cache hit rate and how often the budget forced a partial or fallback rerank."""
+        latencies = [stats.latency_ms for stats in self.history]
+        candidates = sum(stats.candidates for stats in self.history)
+        modes = Counter(stats.mode for stats in self.history)
+        return {
+            "queries": len(self.history),
+            "latency_ms_p50": percentile(latencies, 0.50),
+            "latency_ms_p95": percentile(latencies, 0.95),
+            "latency_ms_max": max(latencies, default=0.0),
+            "cache_hit_rate": sum(stats.cached for stats in self.history) / candidates if candidates else 0.0,
+            "seconds_per_pair": self.seconds_per_pair,
+            "full": modes["full"],
+            "partial": modes["partial"],
+            "fallback": modes["fallback"],
+        }
@@ -0,0 +1,14 @@
+import os
+import sys
+
+# The on-disk index formats are the crawler's (src/crawler); they are imported from there as crawler.*
+_SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if _SRC_DIR not in sys.path:
+    sys.path.append(_SRC_DIR)
+
+from .fusion import reciprocal_rank_fusion
+from .lexical_index import LexicalIndex
+from .quantized_index import QuantizedIndex
+from .query_embedding import QueryEmbedder
+
+__all__ = ["LexicalIndex", "QuantizedIndex", "QueryEmbedder", "reciprocal_rank_fusion"]
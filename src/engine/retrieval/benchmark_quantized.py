@@ -0,0 +1,153 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+from loguru import logger
+
+from llm.normal_search import HNSW_OVERHEAD_BYTES
+from rerank.reranker import percentile
+from retrieval.quantized_index import QuantizedIndex, index_dir, normalize_rows
+
+
+def load_collection(collection, page_size: int = 5000) -> dict:
+    """Every chunk of a Chroma collection: ids, embeddings, documents and metadatas."""
+    data = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+    for offset in range(0, collection.count(), page_size):
+        page = collection.get(offset=offset, limit=page_size, include=["embeddings", "documents", "metadatas"])
+        data["ids"].extend(page["ids"])
+        data["embeddings"].extend(page["embeddings"])
+        data["documents"].extend(page["documents"])
+        data["metadatas"].extend(page["metadatas"])
+    data["embeddings"] = np.asarray(data["embeddings"], dtype=np.float32)
+    return data
+
+
+def sample_queries(vectors: np.ndarray, n: int, noise: float = 0.3, seed: int = 0) -> np.ndarray:
+    """Stored vectors pushed off their chunk by Gaussian noise, so queries have near but not exact matches."""
+    rng = np.random.default_rng(seed)
+    picked = normalize_rows(vectors[rng.choice(len(vectors), min(n, len(vectors)), replace=False)])
+    jitter = rng.standard_normal(picked.shape).astype(np.float32) / np.sqrt(vectors.shape[1])
+    return normalize_rows(picked + noise * jitter)
+
+
+def recall(found: list[list[str]], truth: list[list[str]], k: int) -> float:
+    return float(np.mean([len(set(ids[:k]) & set(expected)) / k for ids, expected in zip(found, truth)]))
+
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def time_queries(search, queries: np.ndarray) -> tuple[list[list[str]], list[float]]:
+    found, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found.append(search(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return found, latencies
+
+
+def benchmark(collection, k: int = 10, queries: int = 200, out_dir: str | None = None) -> dict:
+    """
+    Compares Chroma's HNSW index with the quantized index (int8 and binary,
+    exhaustive and IVF) on one collection. Recall@k is measured against
+    exact float32 cosine search over the same vectors.
+    """
+    data = load_collection(collection)
+    count, dim = data["embeddings"].shape
+    if count < k:
+        raise ValueError(f"Collection has {count} chunks, fewer than k={k}")
+    logger.info(f"Loaded {count} {dim}-d vectors from {collection.name}")
+
+    query_vectors = sample_queries(data["embeddings"], queries)
+    exact = normalize_rows(data["embeddings"])
+    truth = [[data["ids"][i] for i in np.argsort(-(exact @ query))[:k]] for query in query_vectors]
+
+    path = index_dir(out_dir or tempfile.mkdtemp(prefix="quantized_benchmark_"), collection.name)
+    shutil.rmtree(path, ignore_errors=True)
+    start = time.perf_counter()
+    writer = QuantizedIndex(path, readonly=False)
+    for offset in range(0, count, 5000):
+        end = offset + 5000
+        writer.add(data["ids"][offset:end], data["embeddings"][offset:end], data["documents"][offset:end], data["metadatas"][offset:end])
+    build_seconds = time.perf_counter() - start
+
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    report = {
+        "collection": collection.name,
+        "chunks": count,
+        "dim": dim,
+        "k": k,
+        "queries": len(query_vectors),
+        "chroma_space": space,
+        "quantized_build_s": build_seconds,
+    }
+
+    def chroma_search(query):
+        return collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])["ids"][0]
+
+    def record(name: str, search, batch_search, resident_bytes: int) -> None:
+        found, latencies = time_queries(search, query_vectors)
+        start = time.perf_counter()
+        batch_search(query_vectors)
+        batch_ms = (time.perf_counter() - start) * 1000 / len(query_vectors)
+        report[name] = {
+            f"recall@{k}": recall(found, truth, k),
+            "latency_ms_p50": percentile(latencies, 0.50),
+            "latency_ms_p95": percentile(latencies, 0.95),
+            "batched_ms_per_query": batch_ms,
+            "resident_mb": resident_bytes / 1e6,
+        }
+        logger.info(f"{name}: {json.dumps(report[name])}")
+
+    record(
+        "chroma",
+        chroma_search,
+        lambda batch: collection.query(query_embeddings=batch.tolist(), n_results=k, include=[]),
+        count * (dim * 4 + HNSW_OVERHEAD_BYTES),
+    )
+
+    def quantized_variants(label: str) -> None:
+        for quantization in ("int8", "binary"):
+            index = QuantizedIndex(path, quantization=quantization)
+            index.warm()
+            record(
+                f"{quantization}_{label}",
+                lambda query: [doc.id for doc in index.similarity_search_by_vector(query.tolist(), k)],
+                lambda batch: index.search_many(batch.tolist(), k),
+                index.resident_bytes(),
+            )
+            index.close()
+
+    quantized_variants("flat")
+    start = time.perf_counter()
+    report["ivf_lists"] = writer.train_ivf()
+    report["ivf_train_s"] = time.perf_counter() - start
+    quantized_variants("ivf")
+
+    report["quantized_disk_mb"] = directory_bytes(path) / 1e6
+    writer.close()
+    if out_dir is None:
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+    return report
+
+
+if __name__ == "__main__":
+    # python -m retrieval.benchmark_quantized <university_name> [k] [queries] [db_path] [out_dir]
+    if len(sys.argv) < 2:
+        print("Usage: python -m retrieval.benchmark_quantized <university_name> [k] [queries] [db_path] [out_dir]")
+        sys.exit(1)
+
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    queries = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    db_path = sys.argv[4] if len(sys.argv) > 4 else "../../chroma_langchain_db"
+    out_dir = sys.argv[5] if len(sys.argv) > 5 else None
+
+    collection = chromadb.PersistentClient(path=db_path).get_collection(sys.argv[1])
+    report = benchmark(collection, k=k, queries=queries, out_dir=out_dir)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,27 @@
+from langchain_core.documents import Document
+
+
+def document_key(doc: Document) -> str:
+    # Chroma and the lexical index share chunk ids; fall back to content for documents without one
+    if doc.id:
+        return doc.id
+    return f"{doc.metadata.get('url')}\n{doc.page_content}"
+
+
+def reciprocal_rank_fusion(rankings: list[list[Document]], k: int = 60, top_k: int | None = None) -> list[Document]:
+    """
+    Merges ranked lists with reciprocal rank fusion: each document scores
+    sum(1 / (k + rank)) over the lists it appears in. Only ranks are used,
+    so BM25 scores and vector distances never need to be put on one scale.
+    """
+    scores: dict[str, float] = {}
+    docs: dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = document_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    fused = sorted(scores, key=scores.get, reverse=True)
+    if top_k is not None:
+        fused = fused[:top_k]
+    return [docs[key] for key in fused]
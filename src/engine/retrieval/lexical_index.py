@@ -0,0 +1,149 @@
+import heapq
+import math
+import os
+import sqlite3
+import threading
+
+from langchain_core.documents import Document
+from loguru import logger
+
+from crawler.utils.lexical_index import IMPACT_LEVELS, K1, chunk_columns, create_schema, index_path, tokenize, write_chunks
+
+MMAP_SIZE = 1 << 30
+
+
+class LexicalIndex:
+    """
+    Per-university BM25 index on disk, written by the crawler's
+    LexicalIndexPipeline as chunks are ingested and read here.
+
+    It is an impact-ordered inverted index in SQLite: each posting stores
+    the chunk's quantized BM25 term weight, and postings are kept sorted
+    by that weight. A query reads only the `depth` highest-impact postings
+    of each term and adds them up with the term's current IDF, so lookup
+    cost depends on `depth` and the number of query terms, not on how many
+    chunks contain a term. Chunks that only appear deep in every posting
+    list can be missed, which is the usual trade-off of impact pruning.
+
+    The format, tokenizer and writer are the crawler's
+    (crawler.utils.lexical_index). Impacts are quantized against one
+    reference average chunk length and recomputed for the whole index when
+    the real average drifts from it, so scores stay comparable.
+
+    Opening it costs nothing up front: the file is memory-mapped and pages
+    are loaded on demand. Each thread gets its own connection, so lexical
+    and dense retrieval can run in parallel. `close()` closes the
+    connections of every thread; a thread that uses the index afterwards
+    opens a new one.
+    """
+
+    def __init__(self, path: str, readonly: bool = True, depth: int = 500):
+        self.path = path
+        self.readonly = readonly
+        self.depth = depth
+        self._local = threading.local()
+        # Every thread's connection, so close() can reach those it didn't open
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._generation = 0
+        # Indexes written before chunks had a heading path have no headings column; read-only opens can't add it
+        self._headings: bool | None = None
+        if not readonly:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            create_schema(self._connection())
+
+    @classmethod
+    def open(cls, directory: str, university_name: str, depth: int = 500) -> "LexicalIndex | None":
+        path = index_path(directory, university_name)
+        if not os.path.exists(path):
+            logger.warning(f"Lexical index not found: {path}")
+            return None
+        return cls(path, depth=depth)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.generation != self._generation:
+            # check_same_thread=False only so close() can close it from another thread
+            if self.readonly:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            else:
+                conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                # Postings are inserted in term order, not file order, so keep more of the b-tree cached
+                conn.execute("PRAGMA cache_size=-65536")
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            if self._headings is None:
+                self._headings = "headings" in chunk_columns(conn)
+            with self._connections_lock:
+                self._connections.append(conn)
+                self._local.generation = self._generation
+            self._local.conn = conn
+        return conn
+
+    # ---------- Reading ----------
+    def search(self, query: str, k: int = 20) -> list[tuple[Document, float]]:
+        """Returns up to k chunks ranked by BM25, best first, with their score (higher is better)."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        conn = self._connection()
+        chunk_count = self._meta(conn).get("chunk_count", 0)
+        placeholders = ",".join("?" * len(terms))
+        found = conn.execute(f"SELECT id, df FROM terms WHERE term IN ({placeholders})", terms).fetchall()
+
+        scores: dict[int, float] = {}
+        for term_id, df in found:
+            idf = math.log(1 + (chunk_count - df + 0.5) / (df + 0.5))
+            postings = conn.execute(
+                "SELECT impact, chunk FROM postings WHERE term = ? ORDER BY impact DESC LIMIT ?",
+                (term_id, self.depth),
+            )
+            for weight, chunk in postings:
+                scores[chunk] = scores.get(chunk, 0.0) + idf * weight
+        if not scores:
+            return []
+
+        best = heapq.nlargest(k, scores.items(), key=lambda entry: entry[1])
+        ids = [chunk for chunk, _ in best]
+        rows = conn.execute(
+            f"SELECT id, chunk_id, url, title, text, {'headings' if self._headings else 'NULL'} "
+            f"FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids
+        ).fetchall()
+        by_id = {row[0]: row for row in rows}
+        results = []
+        for chunk, score in best:
+            _, chunk_id, url, title, text, headings = by_id[chunk]
+            metadata = {"url": url, "title": title, "source": "university_scraper"}
+            if headings:
+                metadata["headings"] = headings
+            results.append((Document(page_content=text, metadata=metadata, id=chunk_id), score / IMPACT_LEVELS * (K1 + 1)))
+        return results
+
+    def __len__(self) -> int:
+        return int(self._meta(self._connection()).get("chunk_count", 0))
+
+    @staticmethod
+    def _meta(conn: sqlite3.Connection) -> dict:
+        return dict(conn.execute("SELECT key, value FROM meta").fetchall())
+
+    # ---------- Writing (benchmarks and backfills, through the crawler's writer) ----------
+    def add(self, chunk_ids: list[str], texts: list[str], metadatas: list[dict]) -> None:
+        """Adds or replaces chunks in one transaction."""
+        conn = self._connection()
+        with conn:
+            write_chunks(conn, [], [(chunk_id, metadata["url"], metadata.get("title"), text, metadata.get("headings") or None)
+                                    for chunk_id, text, metadata in zip(chunk_ids, texts, metadatas)])
+
+    def delete_urls(self, urls: list[str]) -> None:
+        conn = self._connection()
+        with conn:
+            write_chunks(conn, urls, [])
+
+    def close(self) -> None:
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for conn in connections:
+            conn.close()
+
@@ -0,0 +1,324 @@
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from langchain_core.documents import Document
+from loguru import logger
+
+from crawler.utils.quantized_index import (
+    BLOCK_ROWS, INGEST_VERSION_KEY, append_rows, chunk_columns, create_schema, data_path, index_dir, ivf_path,
+    normalize_rows, quantize_binary, read_meta, row_formats, train_ivf,
+)
+
+# From this many queries on, int8 blocks are converted to float32 for one BLAS matmul
+BLAS_MIN_QUERIES = 4
+# Candidates rescored at full precision per result, by quantization
+RESCORE_FACTORS = {"int8": 4, "binary": 16}
+
+
+if hasattr(np, "bitwise_count"):
+    popcount = np.bitwise_count
+else:
+    _POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(bits: np.ndarray) -> np.ndarray:
+        return _POPCOUNT[bits]
+
+
+@dataclass
+class _Mapped:
+    """One consistent view of the index files, swapped whole when the writer commits."""
+    revision: int
+    layout: int
+    rows: int
+    dim: int
+    vectors: np.ndarray | None = None
+    codes_int8: np.ndarray | None = None
+    scales: np.ndarray | None = None
+    codes_binary: np.ndarray | None = None
+    live: np.ndarray | None = None
+    centroids: np.ndarray | None = None
+    ivf_rows: np.ndarray | None = None
+    ivf_offsets: np.ndarray | None = None
+    # Rows appended after the IVF lists were trained, scanned exhaustively
+    ivf_covered: int = 0
+    # False for indexes written before chunks had a heading path
+    headings: bool = True
+
+
+class QuantizedIndex:
+    """
+    Per-university dense index on disk, written by the crawler's
+    VectorStorePipeline (VECTOR_STORE_BACKEND = "quantized") and searched
+    here instead of Chroma.
+
+    Each chunk's vector is stored three ways in flat, memory-mapped files:
+    int8 codes with a per-row scale (a quarter of float32), sign bits
+    (1/32), and the normalized float32 vector. A query scans the int8 or
+    binary codes with NumPy, over every row or, once the crawler has trained
+    them, only the IVF lists nearest the query; then rescores the best
+    `rescore_factor * k` candidates exactly against the float32 rows, which
+    are read from disk only for those candidates. Scores are cosine
+    similarities. Chunk text and metadata live in SQLite next to the files.
+
+    Only the codes need to stay in memory, and as mapped pages the OS can
+    drop them under pressure and share them between processes. The index
+    notices new crawler commits (and compactions) on the next query. Each
+    thread reads through its own SQLite connection; `close()` closes all of
+    them.
+
+    The format and writer are the crawler's (crawler.utils.quantized_index).
+    """
+
+    def __init__(self, path: str, quantization: str = "int8", rescore_factor: int | None = None,
+                 nprobe: int = 16, readonly: bool = True):
+        if quantization not in RESCORE_FACTORS:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.path = path
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor or RESCORE_FACTORS[quantization]
+        self.nprobe = nprobe
+        self.readonly = readonly
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Every thread's connection, so close() can reach those it didn't open
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._generation = 0
+        self._mapped: _Mapped | None = None
+        if not readonly:
+            os.makedirs(path, exist_ok=True)
+            create_schema(self._connection())
+
+    @classmethod
+    def open(cls, directory: str, university_name: str, **kwargs) -> "QuantizedIndex | None":
+        path = index_dir(directory, university_name)
+        if not os.path.exists(os.path.join(path, "index.sqlite")):
+            logger.warning(f"Quantized index not found: {path}")
+            return None
+        return cls(path, **kwargs)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.generation != self._generation:
+            database = os.path.join(self.path, "index.sqlite")
+            # check_same_thread=False only so close() can close it from another thread
+            if self.readonly:
+                conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True, check_same_thread=False, isolation_level=None)
+            else:
+                conn = sqlite3.connect(database, timeout=30, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+            with self._connections_lock:
+                self._connections.append(conn)
+                self._local.generation = self._generation
+            self._local.conn = conn
+        return conn
+
+    # ---------- Mapping ----------
+    def _current(self) -> _Mapped:
+        """The mapped files, remapped first if the writer has committed since."""
+        revision = self._connection().execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()
+        revision = int(revision[0]) if revision else 0
+        mapped = self._mapped
+        if mapped is None or mapped.revision != revision:
+            with self._lock:
+                if self._mapped is None or self._mapped.revision != revision:
+                    try:
+                        self._mapped = self._map()
+                    except FileNotFoundError:
+                        # A compaction removed the layout just read; the next read sees its replacement
+                        self._mapped = self._map()
+                mapped = self._mapped
+        return mapped
+
+    def _map(self) -> _Mapped:
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            meta = read_meta(conn)
+            live_rows = np.array(conn.execute("SELECT row FROM chunks").fetchall(), dtype=np.int64).reshape(-1)
+            headings = "headings" in chunk_columns(conn)
+        finally:
+            conn.execute("COMMIT")
+        mapped = _Mapped(int(meta.get("revision", 0)), int(meta.get("layout", 0)), int(meta.get("rows", 0)), int(meta.get("dim", 0)),
+                         headings=headings)
+        if mapped.rows == 0:
+            return mapped
+
+        for name, (dtype, width) in row_formats(mapped.dim).items():
+            array = np.memmap(data_path(self.path, name, mapped.layout), dtype=dtype, mode="r", shape=(mapped.rows, width))
+            setattr(mapped, name, array[:, 0] if name == "scales" else array)
+        mapped.live = np.zeros(mapped.rows, dtype=bool)
+        mapped.live[live_rows] = True
+        if "ivf_id" in meta:
+            ivf_id = int(meta["ivf_id"])
+            mapped.centroids = np.load(ivf_path(self.path, "centroids", mapped.layout, ivf_id))
+            mapped.ivf_rows = np.load(ivf_path(self.path, "rows", mapped.layout, ivf_id), mmap_mode="r")
+            mapped.ivf_offsets = np.load(ivf_path(self.path, "offsets", mapped.layout, ivf_id))
+            mapped.ivf_covered = int(meta["ivf_rows"])
+        logger.info(f"Mapped quantized index {self.path}: {len(live_rows)} chunks, revision {mapped.revision}")
+        return mapped
+
+    # ---------- Reading ----------
+    def _approximate(self, mapped: _Mapped, queries: np.ndarray, rows) -> np.ndarray:
+        """(len(queries), len(rows)) similarity estimates from the codes; deleted rows score -inf."""
+        if self.quantization == "int8":
+            codes = mapped.codes_int8[rows]
+            if len(queries) < BLAS_MIN_QUERIES:
+                # einsum reads the int8 codes directly; converting a block to float32 costs more than it saves
+                scores = np.einsum("ij,kj->ki", codes, queries)
+            else:
+                scores = (codes.astype(np.float32) @ queries.T).T
+            scores *= mapped.scales[rows]
+        else:
+            codes = mapped.codes_binary[rows]
+            bits = quantize_binary(queries)
+            # Agreeing signs: 1 - 2 * hamming / dim tracks cosine similarity
+            scores = np.stack([1 - 2 * popcount(codes ^ query_bits).sum(axis=1, dtype=np.int32) / mapped.dim for query_bits in bits])
+            scores = scores.astype(np.float32)
+        scores[:, ~mapped.live[rows]] = -np.inf
+        return scores
+
+    def _candidates(self, mapped: _Mapped, queries: np.ndarray, n: int) -> list[np.ndarray]:
+        """For each query, the rows of its n best code scores."""
+        if mapped.centroids is not None:
+            candidates = []
+            nprobe = min(self.nprobe, len(mapped.centroids))
+            tail = np.arange(mapped.ivf_covered, mapped.rows)
+            for query, centroid_scores in zip(queries, queries @ mapped.centroids.T):
+                lists = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+                rows = np.concatenate([mapped.ivf_rows[mapped.ivf_offsets[i]:mapped.ivf_offsets[i + 1]] for i in lists] + [tail])
+                scores = self._approximate(mapped, query[None], rows)[0]
+                candidates.append(rows[self._top(scores, n)])
+            return candidates
+
+        # Exhaustive scan in blocks, keeping a running best n per query
+        best_rows = [np.zeros(0, dtype=np.int64) for _ in queries]
+        best_scores = [np.zeros(0, dtype=np.float32) for _ in queries]
+        for start in range(0, mapped.rows, BLOCK_ROWS):
+            block = slice(start, min(start + BLOCK_ROWS, mapped.rows))
+            scores = self._approximate(mapped, queries, block)
+            for i, row_scores in enumerate(scores):
+                rows = np.concatenate([best_rows[i], np.arange(block.start, block.stop)])
+                merged = np.concatenate([best_scores[i], row_scores])
+                keep = self._top(merged, n)
+                best_rows[i], best_scores[i] = rows[keep], merged[keep]
+        return best_rows
+
+    @staticmethod
+    def _top(scores: np.ndarray, n: int) -> np.ndarray:
+        """Indexes of the n largest finite scores, unordered."""
+        if len(scores) > n:
+            top = np.argpartition(-scores, n - 1)[:n]
+        else:
+            top = np.arange(len(scores))
+        return top[np.isfinite(scores[top])]
+
+    def search_many(self, embeddings: list[list[float]], k: int = 20) -> list[list[tuple[Document, float]]]:
+        """Up to k chunks per query vector, best first, with cosine similarity. One pass over the codes serves the whole batch."""
+        mapped = self._current()
+        if mapped.rows == 0 or not embeddings:
+            return [[] for _ in embeddings]
+        queries = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        results = []
+        for query, candidates in zip(queries, self._candidates(mapped, queries, k * self.rescore_factor)):
+            # Sorted reads touch the float32 file front to back
+            candidates = np.sort(candidates)
+            exact = mapped.vectors[candidates] @ query
+            order = np.argsort(-exact)[:k]
+            results.append([(int(candidates[i]), float(exact[i])) for i in order])
+        return self._documents(mapped, results)
+
+    def _documents(self, mapped: _Mapped, results: list[list[tuple[int, float]]]) -> list[list[tuple[Document, float]]]:
+        rows = sorted({row for hits in results for row, _ in hits})
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            layout = conn.execute("SELECT value FROM meta WHERE key = 'layout'").fetchone()
+            by_row = {}
+            for start in range(0, len(rows), 900):
+                part = rows[start:start + 900]
+                by_row.update((row[0], row) for row in conn.execute(
+                    f"SELECT row, chunk_id, url, title, text, {'headings' if mapped.headings else 'NULL'} "
+                    f"FROM chunks WHERE row IN ({','.join('?' * len(part))})", part
+                ))
+        finally:
+            conn.execute("COMMIT")
+        if layout is not None and int(layout[0]) != mapped.layout:
+            # Compacted between the scan and the lookup: row numbers changed, so the hits are stale
+            return [[] for _ in results]
+
+        documents = []
+        for hits in results:
+            found = []
+            for row, score in hits:
+                # Chunks deleted since the index was mapped are skipped
+                if row in by_row:
+                    _, chunk_id, url, title, text, headings = by_row[row]
+                    metadata = {"url": url, "title": title, "source": "university_scraper"}
+                    if headings:
+                        metadata["headings"] = headings
+                    found.append((Document(page_content=text, metadata=metadata, id=chunk_id), score))
+            documents.append(found)
+        return documents
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4) -> list[Document]:
+        """The Chroma vector store method NormalSearch calls, so either backend can sit behind it."""
+        return [doc for doc, _ in self.search_many([embedding], k)[0]]
+
+    def similarity_search_by_vector_with_score(self, embedding: list[float], k: int = 4) -> list[tuple[Document, float]]:
+        return self.search_many([embedding], k)[0]
+
+    def ingest_version(self) -> str | None:
+        row = self._connection().execute("SELECT value FROM meta WHERE key = ?", (INGEST_VERSION_KEY,)).fetchone()
+        return row[0] if row else None
+
+    def resident_bytes(self) -> int:
+        """Bytes a query scans: the codes for the chosen quantization plus the IVF centroids."""
+        mapped = self._current()
+        if mapped.rows == 0:
+            return 0
+        if self.quantization == "int8":
+            size = mapped.codes_int8.nbytes + mapped.scales.nbytes
+        else:
+            size = mapped.codes_binary.nbytes
+        if mapped.centroids is not None:
+            size += mapped.centroids.nbytes + mapped.ivf_rows.nbytes
+        return size + mapped.live.nbytes
+
+    def warm(self) -> None:
+        """Reads the codes once so their pages are in memory before the first query."""
+        mapped = self._current()
+        codes = mapped.codes_int8 if self.quantization == "int8" else mapped.codes_binary
+        if codes is not None:
+            for start in range(0, mapped.rows, BLOCK_ROWS):
+                np.asarray(codes[start:start + BLOCK_ROWS]).sum()
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    # ---------- Writing (benchmarks and backfills, through the crawler's writer) ----------
+    def add(self, chunk_ids: list[str], embeddings: list, texts: list[str], metadatas: list[dict]) -> None:
+        """Adds or replaces chunks in one transaction."""
+        conn = self._connection()
+        with conn:
+            append_rows(conn, self.path, [], chunk_ids, embeddings, texts, metadatas)
+
+    def train_ivf(self, lists: int = 0) -> int:
+        start = time.perf_counter()
+        lists = train_ivf(self._connection(), self.path, lists)
+        logger.info(f"Trained {lists} IVF lists for {self.path} in {time.perf_counter() - start:.1f}s")
+        return lists
+
+    def close(self) -> None:
+        """Closes every thread's connection and drops the mapped files, which are unmapped once no query holds them."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for conn in connections:
+            conn.close()
+        self._mapped = None
+
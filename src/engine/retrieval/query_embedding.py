@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+
+class QueryEmbedder(Embeddings):
+    """
+    Wraps an embeddings client with an LRU of query -> vector.
+
+    The engine embeds each query once and passes the vector on; anything
+    that still calls `embed_query` with the same text (e.g. a Chroma store
+    built with this as its embedding function) gets the cached vector.
+    `embed_documents` reuses cached vectors but doesn't add to the LRU, so
+    bulk document embedding can't evict hot queries.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache_size: int = 1024):
+        self.embeddings = embeddings
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hits = 0
+        self.embed_calls = 0
+        self.embed_seconds = 0.0
+
+    def _cached(self, text: str) -> list[float] | None:
+        with self._lock:
+            vector = self._cache.get(text)
+            if vector is not None:
+                self._cache.move_to_end(text)
+            return vector
+
+    def _store(self, text: str, vector: list[float], seconds: float) -> None:
+        with self._lock:
+            self.embed_calls += 1
+            self.embed_seconds += seconds
+            self._cache[text] = vector
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def __contains__(self, text: str) -> bool:
+        with self._lock:
+            return text in self._cache
+
+    def lookup(self, text: str) -> tuple[list[float], bool]:
+        """Returns (vector, was_cached)."""
+        self.calls += 1
+        vector = self._cached(text)
+        if vector is not None:
+            self.hits += 1
+            return vector, True
+        start = time.perf_counter()
+        vector = self.embeddings.embed_query(text)
+        self._store(text, vector, time.perf_counter() - start)
+        return vector, False
+
+    async def alookup(self, text: str) -> tuple[list[float], bool]:
+        self.calls += 1
+        vector = self._cached(text)
+        if vector is not None:
+            self.hits += 1
+            return vector, True
+        start = time.perf_counter()
+        vector = await self.embeddings.aembed_query(text)
+        self._store(text, vector, time.perf_counter() - start)
+        return vector, False
+
+    def lookup_many(self, texts: list[str]) -> list[tuple[list[float], bool]]:
+        """`lookup` for a batch of queries: every miss is embedded in one call."""
+        self.calls += len(texts)
+        found = {text: self._cached(text) for text in texts}
+        missing = [text for text, vector in found.items() if vector is None]
+        self.hits += sum(found[text] is not None for text in texts)
+        if missing:
+            start = time.perf_counter()
+            vectors = self.embeddings.embed_documents(missing)
+            # The batch's time is shared between the queries it embedded
+            seconds = (time.perf_counter() - start) / len(missing)
+            for text, vector in zip(missing, vectors):
+                self._store(text, vector, seconds)
+                found[text] = vector
+        return [(found[text], text not in missing) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.lookup(text)[0]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.alookup(text))[0]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors = [self._cached(text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            for i, vector in zip(missing, self.embeddings.embed_documents([texts[i] for i in missing])):
+                vectors[i] = vector
+        return vectors
+
+    def report(self) -> dict:
+        """Embedding calls made, LRU hit rate and the embedding time the hits saved."""
+        average = self.embed_seconds / self.embed_calls if self.embed_calls else 0.0
+        return {
+            "embedding_lookups": self.calls,
+            "embedding_calls": self.embed_calls,
+            "embedding_cache_hit_rate": self.hits / self.calls if self.calls else 0.0,
+            "embedding_ms_avg": average * 1000,
+            "embedding_ms_saved": self.hits * average * 1000,
+        }
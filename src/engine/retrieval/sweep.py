@@ -0,0 +1,400 @@
+"""
+Offline retrieval quality-vs-latency sweep.
+
+Rebuilds a university's indexes from a recorded corpus (the crawler's
+benchmarks/corpus.py format) under every combination of a parameter grid,
+and runs a labelled question set against each. Each chunking is one index
+build: every chunking_strategy, with chunk_size and chunk_overlap for
+"characters" and chunk_max_tokens and chunk_min_tokens for "sections" (the
+crawler's CHUNKING_STRATEGY, EMBEDDING_CHUNK_SIZE/OVERLAP and
+EMBEDDING_CHUNK_MAX_TOKENS/MIN_TOKENS). Each build is then searched with
+every combination of top_k, hybrid, rerank and vector_backend. Each configuration reports recall@top_k, MRR, index size on
+disk, ingestion time and query latency, and the configurations no other one
+beats on all of recall, MRR, p95 latency and index size are marked as the
+Pareto front.
+
+Questions are {"query": ..., "relevant_urls": [...]} as for rerank.evaluate;
+`questions` generates known-item ones from the corpus when there are none.
+Embeddings come from "embedding_model" in the grid: "hash" (the default) is
+a local bag-of-words hashing model that needs no server; an Ollama model is
+embedded through the crawler's embedding cache, so chunks the crawler or an
+earlier sweep already embedded cost nothing. Query latency is retrieval
+only: query vectors are computed up front.
+
+Usage (from src/engine):
+    python -m retrieval.sweep questions <corpus_dir> <questions.json> [count] [seed]
+    python -m retrieval.sweep run <corpus_dir> <questions.json> [grid.json] [results.json]
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import chromadb
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_ollama.embeddings import OllamaEmbeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from loguru import logger
+
+from crawler.benchmarks import corpus
+from crawler.utils.chunking import HEADING_PATH_SEPARATOR, chunk_sections, extract
+from crawler.utils.embedding_cache import EmbeddingCache
+from llm.normal_search import NormalSearch, SearchConfig
+from rerank import CrossEncoderReranker, load_cross_encoder
+from rerank.evaluate import recall_at_k
+from rerank.reranker import percentile
+from retrieval.benchmark_quantized import directory_bytes
+from retrieval.lexical_index import LexicalIndex, index_path
+from retrieval.quantized_index import QuantizedIndex, index_dir
+from retrieval.query_embedding import QueryEmbedder
+
+UNIVERSITY = "sweep"
+HASH_MODEL = "hash"
+DEFAULT_GRID = {
+    "chunking_strategy": ["characters", "sections"],
+    "chunk_size": [500, 750, 1000],
+    "chunk_overlap": [0, 150],
+    "chunk_max_tokens": [100, 200, 400],
+    "chunk_min_tokens": [50],
+    "top_k": [3, 5, 10],
+    "hybrid": [False, True],
+    "rerank": [False],
+    "vector_backend": ["chroma"],
+    "embedding_model": HASH_MODEL,
+    "embedding_cache": "../../embedding_cache.sqlite",
+    "rerank_model": SearchConfig.rerank_model,
+}
+# Pareto objectives: (metric, True when higher is better)
+OBJECTIVES = (("recall", True), ("mrr", True), ("latency_ms_p95", False), ("index_mb", False))
+# EmbeddingPipeline's character chunking, for pages the "sections" strategy gets no sections for
+FALLBACK_CHUNK_SIZE = 750
+FALLBACK_CHUNK_OVERLAP = 150
+# Chroma rejects larger add() batches
+ADD_BATCH = 5000
+_TOKEN = re.compile(r"\w+")
+
+
+# ---------- Corpus and questions ----------
+def load_pages(corpus_dir: str) -> list[dict]:
+    """The corpus' pages as {"url", "title", "text", "sections"}, extracted as DataCleaningPipeline does."""
+    recorded = corpus.load(corpus_dir)
+    pages = []
+    for page in recorded:
+        text, sections = extract(page["html"], with_sections=True)
+        if text:
+            pages.append({"url": page["url"], "title": page.get("title"), "text": text, "sections": sections})
+    logger.info(f"Extracted text from {len(pages)} of {len(recorded)} pages")
+    return pages
+
+
+def synthesize_questions(pages: list[dict], count: int = 100, seed: int = 0, words: int = 8) -> list[dict]:
+    """
+    Known-item questions: a run of `words` words from a random page, with
+    every page containing the run as relevant. They measure whether
+    retrieval finds a passage again, not whether it answers real questions,
+    so prefer a hand-labelled set when there is one.
+    """
+    rng = random.Random(seed)
+    texts = [" ".join(_TOKEN.findall(page["text"].lower())) for page in pages]
+    questions, seen = [], set()
+    for _ in range(count * 10):
+        if len(questions) >= count:
+            break
+        tokens = texts[rng.randrange(len(texts))].split()
+        if len(tokens) < words:
+            continue
+        start = rng.randrange(len(tokens) - words + 1)
+        query = " ".join(tokens[start:start + words])
+        if query in seen:
+            continue
+        seen.add(query)
+        questions.append({"query": query, "relevant_urls": [page["url"] for page, text in zip(pages, texts) if query in text]})
+    return questions
+
+
+# ---------- Embeddings ----------
+class HashingEmbeddings(Embeddings):
+    """Signed feature hashing of lowercased words into `dim` buckets, L2-normalized. Deterministic and free, for offline sweeps."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in _TOKEN.findall(text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+class CachedEmbeddings(Embeddings):
+    """An embedding model behind the crawler's EmbeddingCache, so a sweep only sends the model chunks nobody has embedded yet."""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.cache.embed_with(self.embeddings.embed_documents, texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    def close(self) -> None:
+        self.cache.close()
+
+
+def load_embeddings(model: str, cache_path: str) -> Embeddings:
+    if model == HASH_MODEL:
+        return HashingEmbeddings()
+    return CachedEmbeddings(OllamaEmbeddings(model=model), EmbeddingCache(cache_path, model))
+
+
+# ---------- Index builds ----------
+def chunk_pages(pages: list[dict], chunking: dict) -> tuple[list[str], list[str], list[dict]]:
+    """Chunk ids, texts and metadatas, split as EmbeddingPipeline splits a page under `chunking` (see `expand`)."""
+    sections = chunking["chunking_strategy"] == "sections"
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunking.get("chunk_size", FALLBACK_CHUNK_SIZE),
+        chunk_overlap=chunking.get("chunk_overlap", FALLBACK_CHUNK_OVERLAP),
+    )
+    ids, texts, metadatas = [], [], []
+    for i, page in enumerate(pages):
+        if sections and page["sections"]:
+            chunks = chunk_sections(page["sections"], chunking["chunk_max_tokens"], chunking["chunk_min_tokens"])
+        else:
+            content = f"Title: {page['title']}\n\nURL: {page['url']}\n\nContent: {page['text']}"
+            chunks = [{"text": text, "headings": []} for text in splitter.split_text(content)]
+        for j, chunk in enumerate(chunks):
+            ids.append(f"{i}-{j}")
+            texts.append(chunk["text"])
+            metadatas.append({"url": page["url"], "title": page["title"] or "", "source": "retrieval_sweep",
+                              "headings": HEADING_PATH_SEPARATOR.join(chunk["headings"])})
+    return ids, texts, metadatas
+
+
+def build(pages: list[dict], embeddings: Embeddings, chunking: dict, quantized: bool, directory: str) -> dict:
+    """Builds the Chroma, lexical and (if `quantized`) quantized indexes under `directory`, timing each step."""
+    timings = {}
+    start = time.perf_counter()
+    ids, texts, metadatas = chunk_pages(pages, chunking)
+    timings["chunk_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectors = embeddings.embed_documents(texts)
+    timings["embed_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    collection = chromadb.PersistentClient(path=os.path.join(directory, "chroma")).create_collection(UNIVERSITY)
+    for offset in range(0, len(ids), ADD_BATCH):
+        end = offset + ADD_BATCH
+        collection.add(ids=ids[offset:end], embeddings=vectors[offset:end], documents=texts[offset:end], metadatas=metadatas[offset:end])
+    timings["chroma_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lexical = LexicalIndex(index_path(os.path.join(directory, "lexical_index"), UNIVERSITY), readonly=False)
+    lexical.add(ids, texts, metadatas)
+    lexical.close()
+    timings["lexical_index_s"] = time.perf_counter() - start
+
+    if quantized:
+        start = time.perf_counter()
+        writer = QuantizedIndex(index_dir(os.path.join(directory, "quantized_index"), UNIVERSITY), readonly=False)
+        for offset in range(0, len(ids), ADD_BATCH):
+            end = offset + ADD_BATCH
+            writer.add(ids[offset:end], vectors[offset:end], texts[offset:end], metadatas[offset:end])
+        writer.close()
+        timings["quantized_index_s"] = time.perf_counter() - start
+
+    sizes = {name: directory_bytes(os.path.join(directory, name)) for name in ("chroma", "lexical_index", "quantized_index")}
+    return {"chunks": len(ids), "timings": timings, "bytes": sizes}
+
+
+# ---------- Evaluation ----------
+def reciprocal_rank(urls: list[str], relevant: set[str]) -> float:
+    for rank, url in enumerate(urls, 1):
+        if url in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+def evaluate(search: NormalSearch, questions: list[dict], vectors: list[list[float]]) -> dict:
+    k = search.config.top_k
+    search.warm()
+    recalls, ranks, latencies = [], [], []
+    for question, vector in zip(questions, vectors):
+        start = time.perf_counter()
+        docs = search.retrieve(question["query"], embedding=vector)[:k]
+        latencies.append((time.perf_counter() - start) * 1000)
+        relevant = set(question["relevant_urls"])
+        recalls.append(recall_at_k(docs, relevant, k))
+        ranks.append(reciprocal_rank([doc.metadata.get("url") for doc in docs], relevant))
+    return {
+        "recall": sum(recalls) / max(len(recalls), 1),
+        "mrr": sum(ranks) / max(len(ranks), 1),
+        "latency_ms_p50": percentile(latencies, 0.50),
+        "latency_ms_p95": percentile(latencies, 0.95),
+    }
+
+
+def pareto_front(results: list[dict]) -> list[int]:
+    """Indexes of the results no other result matches or beats on every objective while beating on one."""
+    def dominates(a: dict, b: dict) -> bool:
+        at_least = all(a[key] >= b[key] if higher else a[key] <= b[key] for key, higher in OBJECTIVES)
+        better = any(a[key] > b[key] if higher else a[key] < b[key] for key, higher in OBJECTIVES)
+        return at_least and better
+
+    return [i for i, result in enumerate(results) if not any(dominates(other, result) for other in results)]
+
+
+def expand(grid: dict) -> tuple[list[dict], list[dict]]:
+    """The chunkings to build, and the search settings to try on each build."""
+    chunking = []
+    for strategy in grid["chunking_strategy"]:
+        if strategy == "characters":
+            pairs = itertools.product(grid["chunk_size"], grid["chunk_overlap"])
+            chunking += [{"chunking_strategy": strategy, "chunk_size": size, "chunk_overlap": overlap}
+                         for size, overlap in pairs if overlap < size]
+        elif strategy == "sections":
+            pairs = itertools.product(grid["chunk_max_tokens"], grid["chunk_min_tokens"])
+            chunking += [{"chunking_strategy": strategy, "chunk_max_tokens": most, "chunk_min_tokens": least}
+                         for most, least in pairs if least < most]
+        else:
+            raise ValueError(f"Unknown chunking strategy: {strategy}")
+    keys = ("top_k", "hybrid", "rerank", "vector_backend")
+    searches = [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+    return chunking, searches
+
+
+def sweep(corpus_dir: str, questions: list[dict], grid: dict | None = None) -> dict:
+    grid = {**DEFAULT_GRID, **(grid or {})}
+    chunking, searches = expand(grid)
+    pages = load_pages(corpus_dir)
+    embeddings = load_embeddings(grid["embedding_model"], grid["embedding_cache"])
+    vectors = embeddings.embed_documents([question["query"] for question in questions])
+    query_embedder = QueryEmbedder(embeddings)
+    cross_encoder = load_cross_encoder(grid["rerank_model"]) if any(search["rerank"] for search in searches) else None
+    quantized = any(search["vector_backend"] == "quantized" for search in searches)
+    logger.info(f"Sweeping {len(chunking)} index builds x {len(searches)} search settings over {len(questions)} questions")
+
+    results = []
+    for chunks in chunking:
+        directory = tempfile.mkdtemp(prefix="retrieval_sweep_")
+        try:
+            built = build(pages, embeddings, chunks, quantized, directory)
+            logger.info(f"{chunking_label(chunks)}: {built['chunks']} chunks, {built['timings']}")
+            client = chromadb.PersistentClient(path=os.path.join(directory, "chroma"))
+            for settings in searches:
+                config = SearchConfig(
+                    db_path=os.path.join(directory, "chroma"),
+                    university_name=UNIVERSITY,
+                    embedding_model=grid["embedding_model"],
+                    quantized_index_dir=os.path.join(directory, "quantized_index"),
+                    lexical_index_dir=os.path.join(directory, "lexical_index"),
+                    rerank_model=grid["rerank_model"],
+                    compress=False,
+                    **settings,
+                )
+                # No score cache, so every configuration pays for its own reranking
+                reranker = CrossEncoderReranker(cross_encoder, cache_size=0, latency_budget_ms=config.rerank_budget_ms) if settings["rerank"] else None
+                search = NormalSearch(config, embeddings=query_embedder, reranker=reranker, chroma_client=client)
+                try:
+                    metrics = evaluate(search, questions, vectors)
+                finally:
+                    search.close()
+
+                dense = "quantized_index" if settings["vector_backend"] == "quantized" else "chroma"
+                index_bytes = built["bytes"][dense] + (built["bytes"]["lexical_index"] if settings["hybrid"] else 0)
+                ingest_s = built["timings"]["chunk_s"] + built["timings"]["embed_s"] + built["timings"][f"{dense}_s"]
+                if settings["hybrid"]:
+                    ingest_s += built["timings"]["lexical_index_s"]
+                result = {
+                    **chunks, **settings,
+                    "chunks": built["chunks"], **metrics,
+                    "index_mb": index_bytes / 1e6, "ingest_s": ingest_s,
+                }
+                logger.info(json.dumps(result))
+                results.append(result)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    front = set(pareto_front(results))
+    for i, result in enumerate(results):
+        result["pareto"] = i in front
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": corpus.git_commit(),
+        "corpus": os.path.abspath(corpus_dir),
+        "pages": len(pages),
+        "questions": len(questions),
+        "grid": grid,
+        "results": results,
+    }
+    if isinstance(embeddings, CachedEmbeddings):
+        report["embedding_cache"] = embeddings.cache.stats()
+        embeddings.close()
+    return report
+
+
+def chunking_label(chunking: dict) -> str:
+    if chunking["chunking_strategy"] == "sections":
+        return f"sections {chunking['chunk_max_tokens']}/{chunking['chunk_min_tokens']} tok"
+    return f"characters {chunking['chunk_size']}/{chunking['chunk_overlap']}"
+
+
+def print_front(report: dict) -> None:
+    print(f"{'chunking':<20} {'top_k':>5} {'hybrid':>6} {'rerank':>6} {'backend':>9} "
+          f"{'recall':>7} {'mrr':>6} {'p50 ms':>7} {'p95 ms':>7} {'MB':>7} {'ingest s':>8}")
+    front = sorted((result for result in report["results"] if result["pareto"]), key=lambda result: -result["recall"])
+    for r in front:
+        print(f"{chunking_label(r):<20} {r['top_k']:>5} {str(r['hybrid']):>6} {str(r['rerank']):>6} "
+              f"{r['vector_backend']:>9} {r['recall']:>7.3f} {r['mrr']:>6.3f} {r['latency_ms_p50']:>7.2f} "
+              f"{r['latency_ms_p95']:>7.2f} {r['index_mb']:>7.2f} {r['ingest_s']:>8.2f}")
+    print(f"{len(front)} of {len(report['results'])} configurations on the Pareto front")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4 or sys.argv[1] not in ("questions", "run"):
+        print(__doc__)
+        sys.exit(1)
+
+    if sys.argv[1] == "questions":
+        questions = synthesize_questions(load_pages(sys.argv[2]),
+                                         int(sys.argv[4]) if len(sys.argv) > 4 else 100,
+                                         int(sys.argv[5]) if len(sys.argv) > 5 else 0)
+        with open(sys.argv[3], "w") as f:
+            json.dump(questions, f, indent=2)
+        print(f"Saved {len(questions)} questions to {sys.argv[3]}")
+        sys.exit(0)
+
+    with open(sys.argv[3], "r") as f:
+        questions = json.load(f)
+    grid = None
+    if len(sys.argv) > 4:
+        with open(sys.argv[4], "r") as f:
+            grid = json.load(f)
+    output = sys.argv[5] if len(sys.argv) > 5 else os.path.join(
+        "..", "..", "sweeps", f"sweep_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    report = sweep(sys.argv[2], questions, grid)
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print_front(report)
+    print(f"Saved results to {output}")
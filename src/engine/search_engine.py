@@ -1,32 +1,385 @@
+import asyncio
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import AsyncIterator
+
+from loguru import logger
+
 from cache.semantic_caching import SemanticCache
-from utils.general_utils import SearchResult
-from llm.llm import NormalSearch
+from utils.general_utils import NormalSearchResult, StreamEvent
+from llm.normal_search import SearchConfig
+from serving import GenerationPool, MicroBatcher, Overloaded
+from tenants import Tenant, TenantRegistry
+from tracing import Tracer, record_span, span
+
+
+def coalesce_key(query: str) -> str:
+    # Queries differing only in case, punctuation or spacing share one computation
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
 
-    
+@dataclass
+class EngineConfig:
+    # Universities opened and loaded at startup; the rest open on their first query
+    prewarm: list[str] = field(default_factory=list)
+    memory_budget_bytes: int = 2 * 1024 ** 3
+    max_tenants: int = 32
+    version_check_seconds: float = 30.0
+    cache_threshold: float = 0.8
+    cache_max_entries: int = 10_000
+    cache_max_bytes: int = 256 * 1024 * 1024
+    cache_ttl_seconds: float = 24 * 3600
+    # Concurrent queries arriving within batch_window_ms share one embedding call and one vector query
+    batch_window_ms: float = 5.0
+    max_batch_size: int = 32
+    # Generation is limited to llm_workers at once; past llm_max_waiting queued, requests are shed
+    llm_workers: int = 4
+    llm_max_waiting: int = 16
+    llm_max_wait_s: float = 10.0
+    # Per-stage latency tracing; profile_sample_rate of queries also run under cProfile, kept if slower than slow_query_ms
+    tracing: bool = True
+    profile_sample_rate: float = 0.0
+    slow_query_ms: float = 2000.0
+    profile_dir: str = "../../profiles"
+    trace_history: int = 100
 
 
 class UniversityEngine:
-    def __init__(self):
-        self.semantic_cache = SemanticCache()
-        self.normal_search = NormalSearch()
-        
-    def hybrid_search(self, query) -> SearchResult:
-        result = self.normal_search.search(query)
-        return result
-    
-    def semantic_search(self, query) -> SearchResult:
-        result = self.semantic_cache.search(query)
+    """
+    Async search over every university from one process: semantic cache, then
+    retrieval and the LLM. Universities are tenants of a TenantRegistry, opened
+    lazily and sharing one set of clients; `config.university_name` is the
+    default tenant.
+
+    - The cache lookup and first-stage retrieval start together; on a cache
+      hit the retrieval task is cancelled. A retrieval thread that has already
+      started still finishes, but its result is dropped.
+    - Identical in-flight queries (see `coalesce_key`) await the same task
+      instead of each running the pipeline. The task is shielded, so one
+      caller going away doesn't cancel it for the others.
+    - Answers are written to the cache by a background task after they are
+      returned.
+    - The query is embedded once, through an LRU shared by the cache and the
+      retriever, and the vector is handed to both.
+    - Cached answers live in the university's namespace and are tagged with
+      the collection's ingestion version, re-read at most every
+      `version_check_seconds`.
+    - Queries not in the embedding LRU are embedded in micro-batches, and
+      dense retrieval for each university runs as one batched vector query.
+    - Generation runs in a bounded GenerationPool. When it is saturated the
+      query raises Overloaded instead of queueing without limit; this is
+      checked before retrieval so shed queries cost little. A stream holds
+      its slot only while the LLM generates; tokens are buffered for clients
+      that read slowly.
+    - Every query is traced (see Tracer): its stages are timed as spans under
+      a per-query id, returned as `metrics["trace_id"]` and `metrics["stages_ms"]`,
+      and aggregated into per-stage and per-university percentiles.
+    """
+
+    def __init__(self, config: SearchConfig | None = None, semantic_cache: SemanticCache | None = None,
+                 engine_config: EngineConfig | None = None):
+        config = config or SearchConfig()
+        self.engine_config = engine_config or EngineConfig()
+        self.default_university = config.university_name
+        self.registry = TenantRegistry(
+            config,
+            memory_budget_bytes = self.engine_config.memory_budget_bytes,
+            max_tenants = self.engine_config.max_tenants,
+        )
+        self.embeddings = self.registry.embeddings
+        self.semantic_cache = semantic_cache or SemanticCache(
+            threshold = self.engine_config.cache_threshold,
+            max_entries = self.engine_config.cache_max_entries,
+            max_bytes = self.engine_config.cache_max_bytes,
+            ttl_seconds = self.engine_config.cache_ttl_seconds,
+            embeddings = self.embeddings,
+        )
+        self.embed_batcher = MicroBatcher(
+            lambda _, texts: self.embeddings.lookup_many(texts),
+            window_ms = self.engine_config.batch_window_ms,
+            max_batch_size = self.engine_config.max_batch_size,
+        )
+        self.dense_batcher = MicroBatcher(
+            self._dense_batch,
+            window_ms = self.engine_config.batch_window_ms,
+            max_batch_size = self.engine_config.max_batch_size,
+        )
+        self.generation_pool = GenerationPool(
+            workers = self.engine_config.llm_workers,
+            max_waiting = self.engine_config.llm_max_waiting,
+            max_wait_s = self.engine_config.llm_max_wait_s,
+        )
+        self.tracer = Tracer(
+            enabled = self.engine_config.tracing,
+            profile_sample_rate = self.engine_config.profile_sample_rate,
+            slow_query_ms = self.engine_config.slow_query_ms,
+            profile_dir = self.engine_config.profile_dir,
+            history = self.engine_config.trace_history,
+        )
+        self._in_flight: dict[tuple[str, str], asyncio.Task] = {}
+        self._background: set[asyncio.Task] = set()
+        self.stats: Counter = Counter()
+        self.registry.prewarm(self.engine_config.prewarm)
+
+    async def asearch(self, query: str, university: str | None = None) -> NormalSearchResult:
+        """Raises KeyError if the university has no collection and Overloaded when shedding load."""
+        university = university or self.default_university
+        self.stats["queries"] += 1
+        key = (university, coalesce_key(query))
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            logger.info(f"Coalescing onto in-flight query: {query}")
+        else:
+            task = asyncio.create_task(self._search(query, university))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _prepare(self, query: str, university: str):
+        """
+        Returns (tenant, start, embedding, metrics, cached, retrieval): `cached` is the
+        NormalSearchResult on a cache hit (or the error result when the query can't be
+        embedded), otherwise `retrieval` is the running retrieval task.
+        """
+        start = time.perf_counter()
+        with span("tenant"):
+            tenant = await asyncio.to_thread(self.registry.get, university)
+        try:
+            with span("embed"):
+                embedding, embedding_cached = await self._embed(query)
+        except Exception as e:
+            # E.g. the embedding model is down: fail the query like a later stage would, not with a server error
+            logger.error(f"Error embedding query: {e}")
+            self.stats["embedding_errors"] += 1
+            return tenant, start, None, {}, self._error_result(), None
+        embedded = time.perf_counter()
+        lookup = asyncio.create_task(self._cache_lookup(tenant, query, embedding))
+        retrieval = asyncio.create_task(self._retrieve(tenant, query, embedding))
+        metrics = {"embedding_s": embedded - start, "embedding_cached": embedding_cached, "university": university}
+
+        hit = await lookup
+        if hit is not None:
+            retrieval.cancel()
+            self.stats["cache_hits"] += 1
+            self.stats["retrievals_cancelled"] += 1
+            logger.info(f"Cache hit (similarity {hit.similarity:.3f}) in {time.perf_counter() - start:.3f}s")
+            cached = NormalSearchResult(
+                hit.doc.metadata["model_result"], [], hit.doc.metadata["sources"],
+                {"cache_hit": True, "total_s": time.perf_counter() - start, **metrics},
+            )
+            return tenant, start, embedding, metrics, cached, None
+
+        try:
+            self.generation_pool.check()
+        except Overloaded:
+            retrieval.cancel()
+            self.stats["shed"] += 1
+            raise
+        return tenant, start, embedding, metrics, None, retrieval
+
+    async def _search(self, query: str, university: str) -> NormalSearchResult:
+        with self.tracer.trace(university, query) as trace:
+            result = await self._search_traced(query, university)
+            if trace is not None and result.metrics is not None:
+                result.metrics.update({"trace_id": trace.id, "stages_ms": trace.stage_ms()})
+            return result
+
+    async def _search_traced(self, query: str, university: str) -> NormalSearchResult:
+        tenant, start, embedding, metrics, cached, retrieval = await self._prepare(query, university)
+        if cached is not None:
+            return cached
+
+        try:
+            response = await retrieval
+            retrieved = time.perf_counter()
+            async with self.generation_pool.slot():
+                record_span("generation_wait", retrieved)
+                with span("generate"):
+                    result = await tenant.search.agenerate(response, start, retrieved)
+            result.metrics.update(metrics)
+        except Overloaded:
+            self.stats["shed"] += 1
+            raise
+        except Exception as e:
+            logger.error(f"Error during query execution: {e}")
+            return self._error_result()
+
+        self._cache_in_background(tenant, query, result, embedding)
         return result
-        
-    def search(self, query):
-        # Check Semantic Cache for cached result
-        result = self.semantic_search(query)
-        
-        if result.similarity >= 0.8:
+
+    async def astream(self, query: str, university: str | None = None) -> AsyncIterator[StreamEvent]:
+        """
+        Streaming `asearch`: a "sources" event, "token" events, then a "result" event.
+        Streams aren't coalesced. A cache hit arrives as a single token. Raises
+        KeyError or Overloaded before the first event.
+        """
+        university = university or self.default_university
+        self.stats["queries"] += 1
+        self.stats["streams"] += 1
+        with self.tracer.trace(university, query) as trace:
+            async for event in self._astream_traced(query, university):
+                if event.type == "result" and trace is not None and event.data.metrics is not None:
+                    event.data.metrics.update({"trace_id": trace.id, "stages_ms": trace.stage_ms()})
+                yield event
+
+    async def _astream_traced(self, query: str, university: str) -> AsyncIterator[StreamEvent]:
+        tenant, start, embedding, metrics, cached, retrieval = await self._prepare(query, university)
+        if cached is not None:
+            if cached.response is not None:
+                yield StreamEvent("sources", cached.sources)
+                yield StreamEvent("token", cached.response)
+            yield StreamEvent("result", cached)
+            return
+
+        try:
+            response = await retrieval
+            retrieved = time.perf_counter()
+            events: asyncio.Queue = asyncio.Queue()
+            generation = asyncio.create_task(
+                self._generate_stream(tenant, query, embedding, metrics, response, start, retrieved, events)
+            )
+            try:
+                while (event := await events.get()) is not None:
+                    yield event
+                # Raises what generation raised; Overloaded can only come before the first event
+                await generation
+            finally:
+                generation.cancel()
+        except Overloaded:
+            self.stats["shed"] += 1
+            raise
+        except Exception as e:
+            logger.error(f"Error during streaming query execution: {e}")
+            yield StreamEvent("result", self._error_result())
+
+    async def _generate_stream(self, tenant: Tenant, query: str, embedding: list[float], metrics: dict,
+                               response: dict, start: float, retrieved: float, events: asyncio.Queue) -> None:
+        """
+        Streams the answer into `events`, then None. The generation slot is held only while
+        the LLM generates: tokens queue up for a slow client instead of keeping a worker busy.
+        """
+        try:
+            async with self.generation_pool.slot():
+                record_span("generation_wait", retrieved)
+                events.put_nowait(StreamEvent("sources", response['context'].sources))
+                generating = time.perf_counter()
+                async for event in tenant.search.astream_answer(response, start, retrieved):
+                    if event.type == "result":
+                        # Recorded before the result is queued, so it is in the result's stages_ms
+                        record_span("generate", generating)
+                        event.data.metrics.update(metrics)
+                        self._cache_in_background(tenant, query, event.data, embedding)
+                    events.put_nowait(event)
+        finally:
+            events.put_nowait(None)
+
+    @staticmethod
+    def _error_result() -> NormalSearchResult:
+        return NormalSearchResult(None, "An error occurred while processing your request.")
+
+    async def _embed(self, query: str) -> tuple[list[float], bool]:
+        if query in self.embeddings:
+            return await self.embeddings.alookup(query)
+        return await self.embed_batcher.submit(query)
+
+    async def _retrieve(self, tenant: Tenant, query: str, embedding: list[float]) -> dict:
+        with span("dense"):
+            dense = await self.dense_batcher.submit(embedding, key=tenant.name)
+        with span("retrieve_context"):
+            return await tenant.search.aretrieve_context(query, embedding, dense)
+
+    def _dense_batch(self, university: str, embeddings: list[list[float]]):
+        return self.registry.get(university).search.dense_search_many(embeddings)
+
+    def _current_version(self, tenant: Tenant) -> str | None:
+        now = time.monotonic()
+        if now - tenant.version_checked >= self.engine_config.version_check_seconds:
+            try:
+                with span("cache_version"):
+                    tenant.version = tenant.search.ingest_version()
+            except Exception as e:
+                # Keep the last known version; re-reading on every query would only add load to a failing store
+                logger.error(f"Could not read the ingest version of {tenant.name}: {e}")
+            finally:
+                tenant.version_checked = now
+        return tenant.version
+
+    def _lookup(self, tenant: Tenant, query: str, embedding: list[float]):
+        version = self._current_version(tenant)
+        with span("cache_lookup"):
+            return self.semantic_cache.search(tenant.name, query, embedding, version)
+
+    async def _cache_lookup(self, tenant: Tenant, query: str, embedding: list[float]):
+        try:
+            return await asyncio.to_thread(self._lookup, tenant, query, embedding)
+        except Exception as e:
+            # A broken cache shouldn't fail the query; treat it as a miss
+            logger.error(f"Semantic cache lookup failed: {e}")
+            return None
+
+    def _cache_in_background(self, tenant: Tenant, query: str, result: NormalSearchResult, embedding: list[float]) -> None:
+        task = asyncio.create_task(asyncio.to_thread(
+            self.semantic_cache.cache, tenant.name, query, result.response, result.sources, embedding, tenant.version
+        ))
+        self._background.add(task)
+        started = time.perf_counter()
+        task.add_done_callback(lambda task: self._cache_written(task, tenant.name, started))
+
+    def _cache_written(self, task: asyncio.Task, university: str, started: float) -> None:
+        self._background.discard(task)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.stats["cache_write_errors"] += 1
+            logger.error(f"Background cache write failed: {task.exception()}")
+        else:
+            self.stats["cache_writes"] += 1
+            # Runs after the query's trace has ended, so it goes straight into the histograms
+            self.tracer.observe(university, "cache_write", time.perf_counter() - started)
+
+    def latency(self) -> dict:
+        """Per-stage and per-university latency percentiles from the tracer, and the most recent slow queries."""
+        return {**self.tracer.report(), "slow_queries": self.tracer.traces(slow=True)}
+
+    def metrics(self) -> dict:
+        """Engine counters, query-embedding calls and time saved, semantic cache hit rate and open tenants."""
+        cache = {f"cache_{key}": value for key, value in self.semantic_cache.report().items()}
+        batching = {
+            **{f"embed_batch_{key}": value for key, value in self.embed_batcher.report().items()},
+            **{f"dense_batch_{key}": value for key, value in self.dense_batcher.report().items()},
+            **{f"generation_{key}": value for key, value in self.generation_pool.report().items()},
+        }
+        return {**self.stats, **self.embeddings.report(), **cache, **self.registry.report(), **batching}
+
+    async def drain(self) -> None:
+        """Waits for pending background cache writes, e.g. before shutting down."""
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+
+    def search(self, query: str, university: str | None = None) -> NormalSearchResult:
+        """Blocking wrapper around `asearch` for scripts; waits for the cache write too."""
+        async def run():
+            result = await self.asearch(query, university)
+            await self.drain()
             return result
-        
-        # If not then normal search
-        result = self.hybrid_search(query)
-        self.semantic_cache.cache(query, result)
-        
-        return result
\ No newline at end of file
+        return asyncio.run(run())
+
+
+if __name__ == "__main__":
+    # python search_engine.py [university ...]: the first is queried, all are pre-warmed
+    import sys
+
+    universities = sys.argv[1:]
+    config = SearchConfig(university_name=universities[0]) if universities else SearchConfig()
+    engine = UniversityEngine(config, engine_config=EngineConfig(prewarm=universities))
+    while True:
+        query = input("Enter a question (or 'exit' to quit): ")
+        if query == "exit":
+            break
+        result = engine.search(query)
+        print(result.response)
+        for source in result.sources:
+            print(f"[{source['id']}] {source['url']}")
@@ -0,0 +1,4 @@
+from .batcher import MicroBatcher
+from .pool import GenerationPool, Overloaded
+
+__all__ = ["GenerationPool", "MicroBatcher", "Overloaded"]
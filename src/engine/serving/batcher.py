@@ -0,0 +1,72 @@
+import asyncio
+from collections import Counter
+from typing import Any, Callable, Hashable
+
+
+class MicroBatcher:
+    """
+    Groups concurrent calls into one batched call.
+
+    `submit(item, key)` waits at most `window_ms` for other items with the
+    same key, or until `max_batch_size` of them arrive, then
+    `batch_fn(key, items)` runs once in a worker thread and each caller gets
+    its own element of the returned list. A failing batch fails every caller
+    in it. Callers that are cancelled while waiting are simply skipped.
+    """
+
+    def __init__(self, batch_fn: Callable[[Hashable, list], list], window_ms: float = 5.0, max_batch_size: int = 32):
+        self.batch_fn = batch_fn
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._pending: dict[Hashable, list[tuple[Any, asyncio.Future]]] = {}
+        self._timers: dict[Hashable, asyncio.TimerHandle] = {}
+        self._running: set[asyncio.Task] = set()
+        self.stats: Counter = Counter()
+
+    async def submit(self, item, key: Hashable = None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(key, [])
+        pending.append((item, future))
+        if len(pending) >= self.max_batch_size:
+            self._flush(key)
+        elif len(pending) == 1:
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return await future
+
+    def _flush(self, key: Hashable) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = [(item, future) for item, future in self._pending.pop(key, []) if not future.cancelled()]
+        if not batch:
+            return
+        self.stats["batches"] += 1
+        self.stats["items"] += len(batch)
+        self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(batch))
+        task = asyncio.create_task(self._run(key, batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, key: Hashable, batch: list[tuple[Any, asyncio.Future]]) -> None:
+        try:
+            results = await asyncio.to_thread(self.batch_fn, key, [item for item, _ in batch])
+        except Exception as e:
+            self.stats["failed_batches"] += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def report(self) -> dict:
+        batches = self.stats["batches"]
+        return {
+            "batches": batches,
+            "items": self.stats["items"],
+            "avg_batch_size": self.stats["items"] / batches if batches else 0.0,
+            "max_batch_size": self.stats["max_batch_size"],
+            "failed_batches": self.stats["failed_batches"],
+        }
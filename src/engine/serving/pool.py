@@ -0,0 +1,65 @@
+import asyncio
+from collections import Counter
+from contextlib import asynccontextmanager
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing when the generation pool can't take more work soon."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class GenerationPool:
+    """
+    Bounds concurrent LLM generations to `workers`.
+
+    Up to `max_waiting` requests may queue for a worker; beyond that, or
+    after waiting `max_wait_s`, `slot()` raises Overloaded so the caller can
+    shed the request (HTTP 429) rather than let latency pile up.
+    """
+
+    def __init__(self, workers: int = 4, max_waiting: int = 16, max_wait_s: float = 10.0):
+        self.workers = workers
+        self.max_waiting = max_waiting
+        self.max_wait_s = max_wait_s
+        self._semaphore = asyncio.Semaphore(workers)
+        self.active = 0
+        self.waiting = 0
+        self.stats: Counter = Counter()
+
+    def check(self) -> None:
+        """Raises Overloaded if a request arriving now would be turned away, so work before generation can be skipped."""
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            self.stats["rejected_queue_full"] += 1
+            raise Overloaded(f"{self.waiting} requests already waiting for {self.workers} generation workers", self.max_wait_s)
+
+    @asynccontextmanager
+    async def slot(self):
+        self.check()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.max_wait_s)
+        except asyncio.TimeoutError:
+            self.stats["rejected_timeout"] += 1
+            raise Overloaded(f"No generation worker free after {self.max_wait_s:.1f}s", self.max_wait_s)
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        self.stats["admitted"] += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def report(self) -> dict:
+        return {
+            "workers": self.workers,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.stats["admitted"],
+            "rejected": self.stats["rejected_queue_full"] + self.stats["rejected_timeout"],
+        }
@@ -0,0 +1,3 @@
+from .registry import Tenant, TenantRegistry
+
+__all__ = ["Tenant", "TenantRegistry"]
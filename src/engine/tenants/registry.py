@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, replace
+
+import chromadb
+from chromadb.config import Settings
+from langchain_ollama import OllamaLLM
+from langchain_ollama.embeddings import OllamaEmbeddings
+from loguru import logger
+
+from llm.normal_search import NormalSearch, SearchConfig
+from rerank import CrossEncoderReranker, load_cross_encoder
+from retrieval import QueryEmbedder
+from retrieval.quantized_index import index_dir
+
+
+@dataclass
+class Tenant:
+    name: str
+    search: NormalSearch
+    # Estimated resident size of the collection's vector index
+    bytes: int
+    # Ingestion version the semantic cache compares against, and when it was last read
+    version: str | None = None
+    version_checked: float = float("-inf")
+
+
+class TenantRegistry:
+    """
+    Serves every university from one process.
+
+    - A university's collection is opened on its first query, not at startup.
+    - One Chroma client, embeddings client, LLM client and reranker are
+      shared by all tenants. Chroma's segment cache runs with the LRU policy
+      under `memory_budget_bytes`, so cold vector indexes are unloaded.
+    - Open tenants are kept in an LRU bounded by `max_tenants` and by their
+      estimated index size against the same budget; evicted tenants are
+      reopened on their next query.
+    - `prewarm` opens tenants and loads their index ahead of traffic.
+    """
+
+    def __init__(self, config: SearchConfig, memory_budget_bytes: int = 2 * 1024 ** 3, max_tenants: int = 32,
+                 embeddings: QueryEmbedder | None = None):
+        self.config = config
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_tenants = max_tenants
+        self.embeddings = embeddings or QueryEmbedder(
+            OllamaEmbeddings(model=config.embedding_model), cache_size=config.query_embedding_cache_size
+        )
+        self.llm = OllamaLLM(model=config.llm_model)
+        self.reranker = CrossEncoderReranker(
+            load_cross_encoder(config.rerank_model),
+            cache_size = config.rerank_cache_size,
+            latency_budget_ms = config.rerank_budget_ms,
+        ) if config.rerank else None
+        self.client = chromadb.PersistentClient(
+            path = config.db_path,
+            settings = Settings(chroma_segment_cache_policy="LRU", chroma_memory_limit_bytes=memory_budget_bytes),
+        )
+        self._tenants: OrderedDict[str, Tenant] = OrderedDict()
+        self._loading: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.stats: Counter = Counter()
+        self.load_seconds = 0.0
+
+    def get(self, name: str) -> Tenant:
+        """The tenant for `name`, opening it if needed. Raises KeyError for an unknown university."""
+        with self._lock:
+            tenant = self._tenants.get(name)
+            if tenant is not None:
+                self._tenants.move_to_end(name)
+                self.stats["hits"] += 1
+                return tenant
+            load_lock = self._loading.setdefault(name, threading.Lock())
+
+        # Concurrent first queries for the same university wait for one load
+        with load_lock:
+            with self._lock:
+                tenant = self._tenants.get(name)
+                if tenant is not None:
+                    self._tenants.move_to_end(name)
+                    self.stats["hits"] += 1
+                    return tenant
+            try:
+                tenant = self._load(name)
+                with self._lock:
+                    self._tenants[name] = tenant
+                    self._evict(keep=name)
+            finally:
+                with self._lock:
+                    self._loading.pop(name, None)
+        return tenant
+
+    def _load(self, name: str) -> Tenant:
+        start = time.perf_counter()
+        if name not in self.available():
+            raise KeyError(f"No collection for university: {name}")
+
+        search = NormalSearch(
+            replace(self.config, university_name=name),
+            embeddings = self.embeddings,
+            llm = self.llm,
+            reranker = self.reranker,
+            chroma_client = self.client,
+        )
+        size = search.index_bytes()
+        elapsed = time.perf_counter() - start
+        self.stats["loads"] += 1
+        self.load_seconds += elapsed
+        logger.info(f"Opened tenant {name} in {elapsed:.2f}s (~{size / 1e6:.1f}MB index)")
+        return Tenant(name, search, size)
+
+    def _evict(self, keep: str) -> None:
+        # Called with the lock held
+        while len(self._tenants) > 1 and (
+            len(self._tenants) > self.max_tenants or self.resident_bytes() > self.memory_budget_bytes
+        ):
+            name = next(iter(self._tenants))
+            if name == keep:
+                self._tenants.move_to_end(name)
+                name = next(iter(self._tenants))
+            tenant = self._tenants.pop(name)
+            tenant.search.close()
+            self.stats["evictions"] += 1
+            logger.info(f"Evicted tenant {name} ({len(self._tenants)} open, {self.resident_bytes() / 1e6:.1f}MB)")
+
+    def resident_bytes(self) -> int:
+        return sum(tenant.bytes for tenant in self._tenants.values())
+
+    def prewarm(self, names: list[str]) -> None:
+        """Opens each tenant and runs one query so its vector index is loaded before real traffic."""
+        for name in names:
+            try:
+                self.get(name).search.warm()
+                logger.info(f"Pre-warmed tenant {name}")
+            except KeyError as e:
+                logger.warning(f"Skipping pre-warm: {e}")
+
+    def available(self) -> list[str]:
+        """Universities with a dense index for the configured backend, open or not."""
+        if self.config.vector_backend == "quantized":
+            directory = self.config.quantized_index_dir
+            if not os.path.isdir(directory):
+                return []
+            return sorted(name for name in os.listdir(directory)
+                          if os.path.exists(os.path.join(index_dir(directory, name), "index.sqlite")))
+        return sorted(str(name) for name in self.client.list_collections())
+
+    def names(self) -> list[str]:
+        with self._lock:
+            return list(self._tenants)
+
+    def report(self) -> dict:
+        requests = self.stats["hits"] + self.stats["loads"]
+        return {
+            "tenants_open": len(self._tenants),
+            "tenant_bytes": self.resident_bytes(),
+            "tenant_loads": self.stats["loads"],
+            "tenant_evictions": self.stats["evictions"],
+            "tenant_hit_rate": self.stats["hits"] / requests if requests else 0.0,
+            "tenant_load_ms_avg": self.load_seconds / self.stats["loads"] * 1000 if self.stats["loads"] else 0.0,
+        }
@@ -16,10 +16,13 @@ def test_normal_search(config: SearchConfig):
         query = input("Enter a question (or 'exit' to quit): ")
         if query == "exit":
             break
-        result = normal_search.query(query)
-        print(result.response)
-        for doc in result.docs:
-            print(doc.metadata['url'])
+        for event in normal_search.stream(query):
+            if event.type == "token":
+                print(event.data, end="", flush=True)
+            elif event.type == "result":
+                print()
+                for source in event.data.sources:
+                    print(f"[{source['id']}] {source['url']}")
     
 if __name__ == "__main__":
     print(verify_collection_exists(config.db_path, config.university_name))
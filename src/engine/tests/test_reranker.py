@@ -0,0 +1,63 @@
+import time
+
+from langchain_core.documents import Document
+
+from rerank.models import StubCrossEncoder
+from rerank.reranker import CrossEncoderReranker
+
+QUERY = "graduate tuition deadline"
+# First-stage order; the stub scores by how many query words each passage contains
+DOCS = [
+    Document(id="a", page_content="Campus map and parking."),
+    Document(id="b", page_content="Graduate tuition is billed per term."),
+    Document(id="c", page_content="The graduate tuition deadline is March 1."),
+    Document(id="d", page_content="Graduate programs."),
+]
+
+
+def ids(docs):
+    return [doc.id for doc in docs]
+
+
+def test_full_rerank():
+    reranker = CrossEncoderReranker(StubCrossEncoder(seconds_per_pair=0.001), latency_budget_ms=1000)
+    assert ids(reranker.rerank(QUERY, DOCS)) == ["c", "b", "d", "a"]
+    assert ids(reranker.rerank(QUERY, DOCS, top_k=2)) == ["c", "b"]
+    assert reranker.history[0].mode == "full" and reranker.history[0].scored == 4
+
+
+def test_partial_rerank_when_the_budget_runs_out():
+    reranker = CrossEncoderReranker(StubCrossEncoder(seconds_per_pair=0.02), latency_budget_ms=50,
+                                    initial_seconds_per_pair=0.02)
+    # Two pairs fit: the best two first-stage candidates are reranked, the rest keep their order
+    assert ids(reranker.rerank(QUERY, DOCS)) == ["b", "a", "c", "d"]
+    stats = reranker.history[-1]
+    assert stats.mode == "partial" and stats.scored == 2
+
+
+def test_first_stage_order_when_no_time_is_left():
+    model = StubCrossEncoder()
+    reranker = CrossEncoderReranker(model, latency_budget_ms=10)
+    # Retrieval already used up the budget
+    result = reranker.rerank(QUERY, DOCS, started=time.perf_counter() - 1)
+    assert ids(result) == ids(DOCS)
+    assert reranker.history[-1].mode == "fallback" and model.calls == 0
+
+
+def test_cache_hits_skip_predict():
+    model = StubCrossEncoder(seconds_per_pair=0.001)
+    reranker = CrossEncoderReranker(model, latency_budget_ms=1000)
+    first = reranker.rerank(QUERY, DOCS)
+    # Same query up to case and spacing: every score comes from the cache
+    second = reranker.rerank("  Graduate TUITION deadline ", DOCS)
+    assert ids(first) == ids(second)
+    assert model.calls == 1
+    assert reranker.history[-1].cached == 4 and reranker.history[-1].scored == 0
+    assert reranker.report()["cache_hit_rate"] == 0.5
+
+
+if __name__ == "__main__":
+    test_full_rerank()
+    test_partial_rerank_when_the_budget_runs_out()
+    test_first_stage_order_when_no_time_is_left()
+    test_cache_hits_skip_predict()
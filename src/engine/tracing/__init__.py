@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Histograms and the Prometheus text format are shared with the crawler (src/crawler), imported as crawler.*
+_SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if _SRC_DIR not in sys.path:
+    sys.path.append(_SRC_DIR)
+
+from .tracer import LatencyHistogram, QueryProfile, Trace, Tracer, current_trace, record_span, span
+
+__all__ = ["LatencyHistogram", "QueryProfile", "Trace", "Tracer", "current_trace", "record_span", "span"]
@@ -0,0 +1,316 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from loguru import logger
+
+from crawler.utils.histogram import Histogram
+from crawler.utils.prometheus import render
+
+# Upper bounds in milliseconds, from an LRU hit to a long generation
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10_000, 20_000, 60_000)
+
+_current: ContextVar["Trace | None"] = ContextVar("trace", default=None)
+_profiling = threading.local()
+
+
+class LatencyHistogram(Histogram):
+    """The crawler's fixed-bucket histogram over milliseconds, with the summary the engine reports."""
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS_MS):
+        super().__init__(buckets)
+
+    def summary(self) -> dict:
+        count = self.count
+        return {
+            "count": count,
+            "mean_ms": self.sum / count if count else 0.0,
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": self.max,
+        }
+
+
+class QueryProfile:
+    """
+    cProfile stats for one sampled query, merged from every span that ran in
+    a worker thread. Spans on the event loop aren't profiled: the profiler
+    would also see the coroutines of every other query.
+    """
+
+    def __init__(self):
+        self.stats: pstats.Stats | None = None
+        self._lock = threading.Lock()
+
+    def start(self) -> cProfile.Profile | None:
+        if getattr(_profiling, "active", False):
+            # An enclosing span in this thread is already profiling
+            return None
+        try:
+            asyncio.get_running_loop()
+            return None
+        except RuntimeError:
+            pass
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active (on Python 3.12+ that is process-wide)
+            return None
+        _profiling.active = True
+        return profiler
+
+    def stop(self, profiler: cProfile.Profile) -> None:
+        profiler.disable()
+        _profiling.active = False
+        with self._lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profiler)
+            else:
+                self.stats.add(profiler)
+
+    def top(self, limit: int = 20) -> str:
+        out = io.StringIO()
+        with self._lock:
+            if self.stats is None:
+                return ""
+            self.stats.stream = out
+            self.stats.sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+
+@dataclass
+class Trace:
+    id: str
+    university: str
+    query: str
+    start: float
+    started_at: float
+    # (stage, offset from the start of the query, duration), both in seconds
+    spans: list[tuple[str, float, float]] = field(default_factory=list)
+    profile: QueryProfile | None = None
+    total_s: float | None = None
+    profile_path: str | None = None
+
+    def add(self, name: str, start: float, seconds: float) -> None:
+        # Threads may still finish spans after the query returned (e.g. a cancelled retrieval); those are dropped
+        if self.total_s is None:
+            self.spans.append((name, start - self.start, seconds))
+
+    def stage_ms(self) -> dict[str, float]:
+        """Total milliseconds per stage; a stage that ran more than once is summed."""
+        totals: dict[str, float] = {}
+        for name, _, seconds in list(self.spans):
+            totals[name] = totals.get(name, 0.0) + seconds * 1000
+        return totals
+
+    def to_dict(self) -> dict:
+        # No query text: this is served unauthenticated. The slow-query log line has it, under the same id.
+        return {
+            "id": self.id,
+            "university": self.university,
+            "started_at": self.started_at,
+            "total_ms": (self.total_s or 0.0) * 1000,
+            "spans": [
+                {"stage": name, "offset_ms": offset * 1000, "duration_ms": seconds * 1000}
+                for name, offset, seconds in sorted(self.spans, key=lambda span: span[1])
+            ],
+            "profile_path": self.profile_path,
+        }
+
+
+class Span:
+    """Times the enclosed block as a stage of the current trace. Does nothing outside a trace."""
+
+    __slots__ = ("name", "trace", "start", "profiler")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "Span":
+        self.trace = _current.get()
+        self.profiler = None
+        if self.trace is not None and self.trace.profile is not None:
+            self.profiler = self.trace.profile.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        if self.trace is not None:
+            seconds = time.perf_counter() - self.start
+            if self.profiler is not None:
+                self.trace.profile.stop(self.profiler)
+            self.trace.add(self.name, self.start, seconds)
+        return False
+
+
+def span(name: str) -> Span:
+    return Span(name)
+
+
+def record_span(name: str, start: float) -> None:
+    """Adds a stage that started at perf_counter() `start` and ends now, for waits that can't be wrapped in a block."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, start, time.perf_counter() - start)
+
+
+def current_trace() -> Trace | None:
+    return _current.get()
+
+
+class Tracer:
+    """
+    Per-query tracing for the engine.
+
+    `trace(university, query)` starts a trace with its own id; `span(name)`
+    blocks anywhere below it (including worker threads started from it, as
+    asyncio and LangChain copy the context) add timed stages. When the
+    trace ends every stage, and the query's total as "total", goes into
+    latency histograms per stage and per university and stage.
+
+    A `profile_sample_rate` fraction of queries also run under cProfile
+    (see QueryProfile). Sampled queries slower than `slow_query_ms` have
+    their stats written to `profile_dir` as <time>_<university>_<id>.prof,
+    for `python -m pstats` or snakeviz. The last `history` traces and the
+    last `history` slow ones are kept.
+    """
+
+    def __init__(self, enabled: bool = True, profile_sample_rate: float = 0.0, slow_query_ms: float = 2000.0,
+                 profile_dir: str = "../../profiles", history: int = 100):
+        self.enabled = enabled
+        self.profile_sample_rate = profile_sample_rate
+        self.slow_query_ms = slow_query_ms
+        self.profile_dir = profile_dir
+        self.stages: dict[str, LatencyHistogram] = {}
+        self.universities: dict[str, dict[str, LatencyHistogram]] = {}
+        self.recent: deque[Trace] = deque(maxlen=history)
+        self.slow: deque[Trace] = deque(maxlen=history)
+        self.traced = 0
+        self.slow_queries = 0
+        self.profiled = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def trace(self, university: str, query: str) -> Iterator[Trace | None]:
+        if not self.enabled:
+            yield None
+            return
+        sampled = self.profile_sample_rate > 0 and random.random() < self.profile_sample_rate
+        trace = Trace(
+            id=uuid.uuid4().hex[:12], university=university, query=query,
+            start=time.perf_counter(), started_at=time.time(), profile=QueryProfile() if sampled else None,
+        )
+        token = _current.set(trace)
+        try:
+            yield trace
+        finally:
+            try:
+                _current.reset(token)
+            except ValueError:
+                # An async generator finalized from another context; the trace ends with it anyway
+                pass
+            self.finish(trace)
+
+    def finish(self, trace: Trace) -> None:
+        if trace.total_s is not None:
+            return
+        trace.total_s = time.perf_counter() - trace.start
+        total_ms = trace.total_s * 1000
+        stages = {**trace.stage_ms(), "total": total_ms}
+        with self._lock:
+            self.traced += 1
+            for stage, ms in stages.items():
+                self._observe(trace.university, stage, ms)
+            self.recent.append(trace)
+            if total_ms >= self.slow_query_ms:
+                self.slow_queries += 1
+                self.slow.append(trace)
+
+        if total_ms < self.slow_query_ms:
+            return
+        breakdown = ", ".join(f"{stage} {ms:.0f}ms" for stage, ms in sorted(stages.items(), key=lambda item: -item[1]))
+        logger.warning(f"Slow query {trace.id} ({trace.university}) in {total_ms:.0f}ms: {breakdown}; query: {trace.query!r}")
+        if trace.profile is not None and trace.profile.stats is not None:
+            self._dump_profile(trace)
+
+    def _observe(self, university: str, stage: str, ms: float) -> None:
+        self.stages.setdefault(stage, LatencyHistogram()).observe(ms)
+        self.universities.setdefault(university, {}).setdefault(stage, LatencyHistogram()).observe(ms)
+
+    def observe(self, university: str, stage: str, seconds: float) -> None:
+        """Records a stage that runs after its query's trace ended, e.g. the background cache write."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._observe(university, stage, seconds * 1000)
+
+    def _dump_profile(self, trace: Trace) -> None:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(trace.started_at))
+        path = os.path.join(self.profile_dir, f"{stamp}_{trace.university}_{trace.id}.prof")
+        try:
+            trace.profile.stats.dump_stats(path)
+        except OSError as e:
+            logger.error(f"Failed to write profile for query {trace.id}: {e}")
+            return
+        trace.profile_path = path
+        self.profiled += 1
+        logger.warning(f"Profile of slow query {trace.id} written to {path}\n{trace.profile.top(15)}")
+
+    def report(self) -> dict:
+        """p50/p95/p99 per stage across universities and per university, plus trace counts."""
+        with self._lock:
+            return {
+                "traced": self.traced,
+                "slow": self.slow_queries,
+                "profiled": self.profiled,
+                "slow_query_ms": self.slow_query_ms,
+                "stages": {stage: histogram.summary() for stage, histogram in self.stages.items()},
+                "universities": {
+                    university: {stage: histogram.summary() for stage, histogram in stages.items()}
+                    for university, stages in self.universities.items()
+                },
+            }
+
+    def traces(self, slow: bool = False, limit: int = 20) -> list[dict]:
+        """The most recent traces (or slow traces), newest first."""
+        with self._lock:
+            traces = list(self.slow if slow else self.recent)
+        return [trace.to_dict() for trace in reversed(traces[-limit:])]
+
+    def prometheus(self) -> str:
+        """The per-university stage histograms in the Prometheus text format."""
+        samples = []
+        with self._lock:
+            for university, stages in self.universities.items():
+                for stage, histogram in stages.items():
+                    labels = {"university": university, "stage": stage}
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        samples.append(("_bucket", {**labels, "le": str(bound / 1000)}, cumulative))
+                    total = histogram.count
+                    samples.append(("_bucket", {**labels, "le": "+Inf"}, total))
+                    samples.append(("_sum", labels, histogram.sum / 1000))
+                    samples.append(("_count", labels, total))
+            families = {
+                "engine_stage_seconds": ("histogram", "Time spent in each stage of a search query.", samples),
+                "engine_traced_queries_total": ("counter", "Queries traced.", [("", {}, self.traced)]),
+                "engine_slow_queries_total": (
+                    "counter", "Traced queries slower than the slow query threshold.", [("", {}, self.slow_queries)]
+                ),
+            }
+        return render(families)
@@ -1,3 +1,3 @@
 from .general_utils import *
 
-__all__ = ["SemanticSearchResult", "NormalSearchResult"]
\ No newline at end of file
+__all__ = ["SemanticSearchResult", "NormalSearchResult", "StreamEvent"]
\ No newline at end of file
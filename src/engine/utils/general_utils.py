@@ -1,3 +1,6 @@
+from dataclasses import dataclass
+from typing import Any
+
 from langchain_core.documents import Document
 
 class SemanticSearchResult:
@@ -6,6 +9,17 @@ class SemanticSearchResult:
         self.doc: Document = document
         
 class NormalSearchResult:
-    def __init__(self, response: str, docs: list[Document]) -> None:
+    def __init__(self, response: str, docs: list[Document], sources: list[dict] | None = None,
+                 metrics: dict | None = None) -> None:
         self.response: str = response
-        self.docs: list[Document] = docs
\ No newline at end of file
+        self.docs: list[Document] = docs
+        # Citations for the [n] markers in the response: {"id", "url", "title"}
+        self.sources: list[dict] = sources or []
+        # Per-query timings: retrieval_s, ttft_s, tokens, tokens_per_sec, total_s
+        self.metrics: dict = metrics or {}
+
+@dataclass
+class StreamEvent:
+    # "sources" (list of citation dicts), "token" (str) or "result" (the final NormalSearchResult)
+    type: str
+    data: Any
\ No newline at end of file
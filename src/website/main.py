@@ -0,0 +1,356 @@
+"""
+HTTP search service over the UniversityEngine.
+
+    GET  /                     search page
+    GET  /api/universities     universities with a collection
+    POST /api/search           {"query", "university"} -> answer, sources and metrics
+    POST /api/search/stream    the same as NDJSON events: sources, tokens, then the result
+    GET  /api/metrics          engine, batching, generation pool and HTTP counters
+    GET  /api/metrics/latency  p50/p95/p99 per query stage and university, and recent slow queries
+    GET  /metrics              the stage latency histograms for Prometheus
+    GET  /health
+
+Requests are rate limited per client with a token bucket, and the service
+sheds load with 429 responses (with Retry-After) when more than
+`max_in_flight` requests are running or the engine's generation pool is
+full, instead of letting every request slow down.
+
+Configured through UNIVERSITY_SEARCH_* environment variables (see
+WebsiteConfig). Set OLLAMA_HOST to point the engine at tools/fake_ollama.py
+for load tests.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, fields
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+# The engine's modules import each other from the engine directory
+ENGINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "engine")
+sys.path.insert(0, os.path.abspath(ENGINE_DIR))
+
+from llm.normal_search import SearchConfig  # noqa: E402
+from search_engine import EngineConfig, UniversityEngine  # noqa: E402
+from serving import Overloaded  # noqa: E402
+from utils.general_utils import NormalSearchResult, StreamEvent  # noqa: E402
+
+
+@dataclass
+class WebsiteConfig:
+    db_path: str = "../../chroma_langchain_db"
+    lexical_index_dir: str = "../../lexical_index"
+    vector_backend: str = "chroma"
+    quantized_index_dir: str = "../../quantized_index"
+    quantization: str = "int8"
+    default_university: str = "stanford"
+    # Comma-separated in the environment
+    prewarm: str = ""
+    embedding_model: str = "mxbai-embed-large"
+    llm_model: str = "llama3.2"
+    rerank: bool = True
+    llm_workers: int = 4
+    llm_max_waiting: int = 16
+    llm_max_wait_s: float = 10.0
+    batch_window_ms: float = 5.0
+    max_batch_size: int = 32
+    max_in_flight: int = 64
+    rate_limit_per_minute: float = 30.0
+    rate_limit_burst: int = 10
+    profile_sample_rate: float = 0.0
+    slow_query_ms: float = 2000.0
+    profile_dir: str = "../../profiles"
+
+    @classmethod
+    def from_env(cls) -> "WebsiteConfig":
+        """Reads UNIVERSITY_SEARCH_<FIELD> variables, e.g. UNIVERSITY_SEARCH_LLM_WORKERS=8."""
+        values = {}
+        for f in fields(cls):
+            raw = os.environ.get(f"UNIVERSITY_SEARCH_{f.name.upper()}")
+            if raw is None:
+                continue
+            if f.type in (bool, "bool"):
+                values[f.name] = raw.lower() in ("1", "true", "yes")
+            elif f.type in (int, "int"):
+                values[f.name] = int(raw)
+            elif f.type in (float, "float"):
+                values[f.name] = float(raw)
+            else:
+                values[f.name] = raw
+        return cls(**values)
+
+    def search_config(self) -> SearchConfig:
+        return SearchConfig(
+            db_path = self.db_path,
+            university_name = self.default_university,
+            embedding_model = self.embedding_model,
+            llm_model = self.llm_model,
+            lexical_index_dir = self.lexical_index_dir,
+            vector_backend = self.vector_backend,
+            quantized_index_dir = self.quantized_index_dir,
+            quantization = self.quantization,
+            rerank = self.rerank,
+        )
+
+    def engine_config(self) -> EngineConfig:
+        return EngineConfig(
+            prewarm = [name.strip() for name in self.prewarm.split(",") if name.strip()],
+            batch_window_ms = self.batch_window_ms,
+            max_batch_size = self.max_batch_size,
+            llm_workers = self.llm_workers,
+            llm_max_waiting = self.llm_max_waiting,
+            llm_max_wait_s = self.llm_max_wait_s,
+            profile_sample_rate = self.profile_sample_rate,
+            slow_query_ms = self.slow_query_ms,
+            profile_dir = self.profile_dir,
+        )
+
+
+class RateLimiter:
+    """
+    Token bucket per client: `burst` requests at once, refilled at `per_minute`.
+    Past `max_clients`, the least recently seen client's bucket is dropped; it
+    has most likely refilled, and a full bucket is the same as a new client.
+    """
+
+    def __init__(self, per_minute: float, burst: int, max_clients: int = 10_000):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def allow(self, client: str) -> tuple[bool, float]:
+        """Returns (allowed, seconds until the next token)."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        self._buckets[client] = (tokens - 1 if allowed else tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        if not allowed:
+            return False, (1 - tokens) / self.rate if self.rate else 60.0
+        return True, 0.0
+
+
+class SearchRequest(BaseModel):
+    query: str = Field(min_length=1, max_length=1000)
+    university: str | None = None
+
+
+class SearchResponse(BaseModel):
+    answer: str
+    sources: list[dict]
+    metrics: dict
+
+
+config = WebsiteConfig.from_env()
+engine: UniversityEngine | None = None
+limiter = RateLimiter(config.rate_limit_per_minute, config.rate_limit_burst)
+in_flight = 0
+http_stats: Counter = Counter()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global engine
+    # Opening and pre-warming tenants blocks, so keep it off the event loop
+    engine = await asyncio.to_thread(UniversityEngine, config.search_config(), None, config.engine_config())
+    yield
+    await engine.drain()
+
+
+app = FastAPI(title="University Search", lifespan=lifespan)
+
+
+def too_many(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(max(1, round(retry_after)))})
+
+
+def admit(request: Request) -> None:
+    """Rate limit and in-flight admission; raises a 429 HTTPException, otherwise counts the request in."""
+    global in_flight
+    http_stats["requests"] += 1
+    allowed, retry_after = limiter.allow(request.client.host if request.client else "unknown")
+    if not allowed:
+        http_stats["rate_limited"] += 1
+        raise too_many("Rate limit exceeded", retry_after)
+    if in_flight >= config.max_in_flight:
+        http_stats["shed"] += 1
+        raise too_many(f"Server busy ({in_flight} requests in flight)", 1)
+    in_flight += 1
+
+
+def release() -> None:
+    global in_flight
+    in_flight -= 1
+
+
+def result_payload(result: NormalSearchResult) -> dict:
+    return {"answer": result.response, "sources": result.sources, "metrics": result.metrics}
+
+
+def event_line(event: StreamEvent) -> str:
+    if event.type == "sources":
+        payload = {"type": "sources", "sources": event.data}
+    elif event.type == "token":
+        payload = {"type": "token", "text": event.data}
+    else:
+        payload = {"type": "result", **result_payload(event.data)}
+    return json.dumps(payload) + "\n"
+
+
+@app.post("/api/search", response_model=SearchResponse)
+async def search(body: SearchRequest, request: Request):
+    admit(request)
+    try:
+        result = await engine.asearch(body.query, body.university)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown university: {body.university}")
+    except Overloaded as e:
+        http_stats["shed"] += 1
+        raise too_many(str(e), e.retry_after)
+    finally:
+        release()
+    if result.response is None:
+        raise HTTPException(status_code=500, detail="An error occurred while processing your request.")
+    return result_payload(result)
+
+
+@app.post("/api/search/stream")
+async def search_stream(body: SearchRequest, request: Request):
+    admit(request)
+    events = engine.astream(body.query, body.university)
+    # Pull the first event here so an unknown university or a full pool still gets a proper status code
+    try:
+        first = await events.__anext__()
+    except KeyError:
+        release()
+        raise HTTPException(status_code=404, detail=f"Unknown university: {body.university}")
+    except Overloaded as e:
+        release()
+        http_stats["shed"] += 1
+        raise too_many(str(e), e.retry_after)
+    except BaseException:
+        release()
+        raise
+
+    async def body_lines():
+        try:
+            yield event_line(first)
+            async for event in events:
+                yield event_line(event)
+        finally:
+            await events.aclose()
+            release()
+
+    return StreamingResponse(body_lines(), media_type="application/x-ndjson")
+
+
+@app.get("/api/universities")
+async def universities():
+    names = await asyncio.to_thread(engine.registry.available)
+    return {"universities": names, "default": config.default_university}
+
+
+@app.get("/api/metrics")
+async def metrics():
+    return JSONResponse({**engine.metrics(), **{f"http_{key}": value for key, value in http_stats.items()}, "http_in_flight": in_flight})
+
+
+@app.get("/api/metrics/latency")
+async def latency():
+    return JSONResponse(engine.latency())
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(engine.tracer.prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok" if engine is not None else "starting"}
+
+
+PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>University Search</title>
+<style>
+  body { font-family: sans-serif; max-width: 48rem; margin: 2rem auto; padding: 0 1rem; }
+  form { display: flex; gap: .5rem; }
+  input { flex: 1; padding: .4rem; }
+  #answer { white-space: pre-wrap; margin-top: 1.5rem; }
+  #sources a { display: block; }
+</style>
+</head>
+<body>
+<h1>University Search</h1>
+<form id="search">
+  <select id="university"></select>
+  <input id="query" placeholder="Ask about admissions, programs, deadlines..." autofocus>
+  <button>Search</button>
+</form>
+<div id="answer"></div>
+<div id="sources"></div>
+<script>
+const select = document.getElementById("university");
+fetch("/api/universities").then(r => r.json()).then(data => {
+  for (const name of data.universities) {
+    select.add(new Option(name, name, false, name === data.default));
+  }
+});
+document.getElementById("search").addEventListener("submit", async (event) => {
+  event.preventDefault();
+  const answer = document.getElementById("answer"), sources = document.getElementById("sources");
+  answer.textContent = "";
+  sources.textContent = "";
+  const response = await fetch("/api/search/stream", {
+    method: "POST",
+    headers: {"Content-Type": "application/json"},
+    body: JSON.stringify({query: document.getElementById("query").value, university: select.value}),
+  });
+  if (!response.ok) {
+    answer.textContent = (await response.json()).detail;
+    return;
+  }
+  const reader = response.body.getReader(), decoder = new TextDecoder();
+  let buffer = "";
+  for (;;) {
+    const {value, done} = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, {stream: true});
+    const lines = buffer.split("\\n");
+    buffer = lines.pop();
+    for (const line of lines.filter(Boolean)) {
+      const message = JSON.parse(line);
+      if (message.type === "token") answer.textContent += message.text;
+      if (message.type === "sources") {
+        for (const source of message.sources) {
+          const link = document.createElement("a");
+          link.href = source.url;
+          link.textContent = `[${source.id}] ${source.title}`;
+          sources.appendChild(link);
+        }
+      }
+    }
+  }
+});
+</script>
+</body>
+</html>
+"""
+
+
+@app.get("/", response_class=HTMLResponse)
+async def index():
+    return PAGE
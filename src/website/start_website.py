@@ -0,0 +1,20 @@
+"""
+Starts the search service.
+
+Usage: python start_website.py [host] [port]
+
+One process serves every university; the engine's batching, generation
+pool and tenant registry are per process, so run a single worker.
+"""
+
+import sys
+
+import uvicorn
+
+from main import app
+
+
+if __name__ == "__main__":
+    host = sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1"
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+    uvicorn.run(app, host=host, port=port, workers=1)
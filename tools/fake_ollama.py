@@ -0,0 +1,151 @@
+"""
+A stand-in for the Ollama server, for load tests that shouldn't measure the model.
+
+Serves the endpoints the engine uses (/api/embed, /api/embeddings,
+/api/generate, /api/chat, /api/tags). Embeddings are deterministic hashed
+bags of words, so the same query always gets the same vector and queries
+sharing words are similar. Embedding requests take `embed_ms` on top of
+the hashing. Answers are a fixed sentence streamed word by word with
+`token_ms` between tokens, after `first_token_ms`.
+
+Usage: python tools/fake_ollama.py [port] [token_ms] [first_token_ms] [dim] [embed_ms]
+
+Then point the engine at it with OLLAMA_HOST=http://127.0.0.1:<port>.
+"""
+
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+PORT = int(sys.argv[1]) if len(sys.argv) > 1 else 11434
+TOKEN_SECONDS = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.02
+FIRST_TOKEN_SECONDS = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.2
+DIM = int(sys.argv[4]) if len(sys.argv) > 4 else 1024
+EMBED_SECONDS = float(sys.argv[5]) / 1000 if len(sys.argv) > 5 else 0.0
+
+ANSWER = "Based on the context, here is what the university pages say about your question [1]."
+
+counts = {"embed_requests": 0, "embedded_texts": 0, "generations": 0}
+counts_lock = threading.Lock()
+
+
+def count(key, n=1):
+    with counts_lock:
+        counts[key] += n
+
+
+@lru_cache(maxsize=8192)
+def word_vector(word: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(word.encode()).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+
+
+def embed(text: str) -> list[float]:
+    vector = np.zeros(DIM, dtype=np.float32)
+    for word in re.findall(r"\w+", text.lower()):
+        vector += word_vector(word)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunk(self, payload):
+        data = (json.dumps(payload) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self.send_json({"models": [{"name": "fake", "model": "fake"}]})
+        elif self.path == "/api/version":
+            self.send_json({"version": "0.0.0-fake"})
+        elif self.path == "/stats":
+            with counts_lock:
+                self.send_json(dict(counts))
+        else:
+            self.send_json({"status": "Ollama is running"})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path in ("/api/embed", "/api/embeddings"):
+            self.handle_embed(request)
+        elif self.path in ("/api/generate", "/api/chat"):
+            self.handle_generate(request, chat=self.path == "/api/chat")
+        else:
+            self.send_json({"error": f"unknown endpoint {self.path}"}, status=404)
+
+    def handle_embed(self, request):
+        texts = request.get("input", request.get("prompt", ""))
+        texts = [texts] if isinstance(texts, str) else texts
+        count("embed_requests")
+        count("embedded_texts", len(texts))
+        time.sleep(EMBED_SECONDS)
+        if self.path == "/api/embeddings":
+            self.send_json({"embedding": embed(texts[0])})
+        else:
+            self.send_json({"model": request.get("model"), "embeddings": [embed(text) for text in texts]})
+
+    def handle_generate(self, request, chat):
+        count("generations")
+        model = request.get("model")
+        words = ANSWER.split()
+
+        def message(text, done):
+            payload = {"model": model, "created_at": now(), "done": done}
+            if chat:
+                payload["message"] = {"role": "assistant", "content": text}
+            else:
+                payload["response"] = text
+            if done:
+                payload.update({"done_reason": "stop", "eval_count": len(words)})
+            return payload
+
+        time.sleep(FIRST_TOKEN_SECONDS)
+        if not request.get("stream", True):
+            time.sleep(TOKEN_SECONDS * (len(words) - 1))
+            self.send_json(message(ANSWER, True))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(TOKEN_SECONDS)
+            self.send_chunk(message(word if i == 0 else " " + word, False))
+        self.send_chunk(message("", True))
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", PORT), Handler)
+    server.daemon_threads = True
+    print(f"Fake Ollama listening on http://127.0.0.1:{PORT} ({DIM}-d embeddings, {TOKEN_SECONDS * 1000:.0f}ms/token)")
+    server.serve_forever()
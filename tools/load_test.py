@@ -0,0 +1,64 @@
+"""
+Fires concurrent queries at the search service and reports latency and shedding.
+
+Usage: python tools/load_test.py [url] [requests] [concurrency] [university]
+
+Queries are made unique per request so the semantic cache doesn't answer
+them; the engine's batching and generation pool counters are printed from
+/api/metrics afterwards.
+"""
+
+import asyncio
+import sys
+import time
+from collections import Counter
+
+import httpx
+import numpy as np
+
+URL = sys.argv[1] if len(sys.argv) > 1 else "http://127.0.0.1:8000"
+REQUESTS = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+CONCURRENCY = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+UNIVERSITY = sys.argv[4] if len(sys.argv) > 4 else None
+
+TOPICS = ["admissions deadline", "tuition and fees", "graduate programs", "campus housing",
+          "financial aid", "research labs", "course registration", "library hours"]
+
+
+async def run() -> None:
+    statuses: Counter = Counter()
+    latencies: list[float] = []
+    queue = asyncio.Queue()
+    for i in range(REQUESTS):
+        queue.put_nowait(f"{TOPICS[i % len(TOPICS)]} question {i}")
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        while not queue.empty():
+            query = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{URL}/api/search", json={"query": query, "university": UNIVERSITY})
+                statuses[response.status_code] += 1
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+
+    start = time.perf_counter()
+    async with httpx.AsyncClient(timeout=120) as client:
+        await asyncio.gather(*(worker(client) for _ in range(CONCURRENCY)))
+        metrics = (await client.get(f"{URL}/api/metrics")).json()
+    elapsed = time.perf_counter() - start
+
+    print(f"{REQUESTS} requests, {CONCURRENCY} concurrent, {elapsed:.1f}s ({len(latencies) / elapsed:.1f} answers/s)")
+    print("Status codes:", dict(statuses))
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"Latency p50 {p50 * 1000:.0f}ms, p95 {p95 * 1000:.0f}ms, p99 {p99 * 1000:.0f}ms")
+    for key, value in sorted(metrics.items()):
+        if key.startswith(("embed_batch", "dense_batch", "generation", "http_")):
+            print(f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())